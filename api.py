@@ -0,0 +1,332 @@
+"""API HTTP de conversion (tornado), pour les appels de machine à machine (ERP)
+
+Routes :
+    POST /convertir?nom=Offre.xlsx&format=xlsx  classeur dans le corps de la requête :
+                                                renvoie le fichier Magenta
+    POST /convertir?nom=…&file=1                dépose le classeur dans la file d'attente
+                                                (cf. travaux.py) : renvoie {"id": …} (202)
+    GET  /travaux/<id>                          état d'un travail (JSON)
+    GET  /travaux/<id>/sortie                   fichier Magenta d'un travail terminé
+    GET  /sante                                 état du service (JSON)
+    GET  /metriques                             métriques des conversions, format texte
+                                                de Prometheus (cf. metriques.py)
+
+Les conversions directes sont exécutées par des processus lancés au démarrage, qui ont
+déjà importé pandas, openpyxl, xlsxwriter et les modules de traitement : la première
+requête ne paie pas ces imports. Au-delà du nombre maximal de conversions simultanées,
+la requête est refusée (503, Retry-After). Les erreurs sont renvoyées en JSON
+({"erreur": message}).
+
+Au-delà de SABIANA_GRAND_FICHIER octets (cf. grands_fichiers.py), le classeur reçu est
+écrit dans un fichier temporaire, lu par projection en mémoire dans le processus de
+conversion ; un grand fichier produit est de même renvoyé par un fichier temporaire. Les
+fichiers Magenta sont envoyés par blocs et les fichiers temporaires supprimés à la fin
+de la requête.
+
+Variables d'environnement :
+    SABIANA_API_PORT         port d'écoute (par défaut 8600)
+    SABIANA_API_PROCESSUS    processus des conversions directes (par défaut : nombre de cœurs)
+    SABIANA_API_CONCURRENCE  conversions directes simultanées (par défaut : 2 par processus)
+    SABIANA_API_TAILLE_MAX   taille maximale d'un classeur en octets (par défaut 50 Mo)
+    SABIANA_API_INACTIVITE   durée de maintien d'une connexion inactive (keep-alive),
+                             en secondes (par défaut 60)
+
+Exemple :
+    python api.py --port 8600 --processus 4
+    curl --data-binary @Offerta.xlsx "http://localhost:8600/convertir?nom=Offerta.xlsx" \\
+        -o fichier_traite.xlsx
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import tornado.httpserver
+import tornado.web
+from tornado.ioloop import IOLoop
+
+from batch import convertir_contenu, prechauffer
+from conversion import nom_fichier_sortie
+from formats import FORMATS, FORMATS_SORTIE
+from grands_fichiers import est_grand, fichier_temporaire, lire_par_blocs, ouvrir_contenu, \
+    supprimer_temporaire
+from metriques import compter_erreur_api, exposer
+from travaux import SUFFIXE_SORTIE, TERMINES, chemin_fichier, etat_travail, lancer_processus, \
+    soumettre
+
+PORT_DEFAUT = 8600
+TAILLE_MAX_DEFAUT = 50 * 1024 * 1024
+INACTIVITE_DEFAUT = 60
+# Délai conseillé au client avant de renvoyer une requête refusée (secondes)
+DELAI_NOUVEL_ESSAI = 1
+
+
+def convertir_requete(classeur, nom_fichier, format_sortie):
+    """Conversion directe exécutée par un processus de conversion : classeur est le contenu
+    reçu (octets) ou le chemin du fichier temporaire d'un grand classeur. Renvoie (statut,
+    type de fichier, sortie, message), un grand fichier produit étant renvoyé par le chemin
+    d'un fichier temporaire plutôt qu'en octets."""
+    if isinstance(classeur, str):
+        with ouvrir_contenu(classeur) as contenu:
+            statut, type_fichier, sortie, message = convertir_contenu(contenu, nom_fichier,
+                                                                      format_sortie)
+    else:
+        statut, type_fichier, sortie, message = convertir_contenu(classeur, nom_fichier,
+                                                                  format_sortie)
+
+    if sortie is not None and est_grand(len(sortie)):
+        with fichier_temporaire() as f:
+            f.write(sortie)
+        sortie = f.name
+    return statut, type_fichier, sortie, message
+
+
+def demarrer_executeur(nombre):
+    """Lance les processus des conversions directes et attend qu'ils soient prêts."""
+    executeur = ProcessPoolExecutor(nombre, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=prechauffer)
+    # Une tâche par processus : tous sont démarrés (et préchauffés) avant la première requête
+    for attente in [executeur.submit(os.getpid) for _ in range(nombre)]:
+        attente.result()
+    return executeur
+
+
+class GestionnaireApi(tornado.web.RequestHandler):
+    """Base des routes de l'API : erreurs renvoyées en JSON."""
+
+    def write_error(self, status_code, **kwargs):
+        erreur = kwargs.get("exc_info", (None, None, None))[1]
+        message = erreur.log_message if isinstance(erreur, tornado.web.HTTPError) \
+            and erreur.log_message else self._reason
+        if status_code == 503:
+            self.set_header("Retry-After", str(DELAI_NOUVEL_ESSAI))
+        compter_erreur_api(status_code)
+        self.finish({"erreur": message})
+
+    async def envoyer_fichier(self, sortie, type_fichier, format_sortie):
+        """Renvoie un fichier Magenta (octets, ou chemin d'un fichier envoyé par blocs) avec
+        son type MIME et son nom."""
+        self.set_header("Content-Type", FORMATS_SORTIE[format_sortie][2])
+        self.set_header("Content-Disposition", "attachment; filename="
+                        f"\"{nom_fichier_sortie(type_fichier, format_sortie)}\"")
+        self.set_header("X-Type-Fichier", type_fichier)
+        if isinstance(sortie, bytes):
+            self.finish(sortie)
+            return
+
+        self.set_header("Content-Length", os.path.getsize(sortie))
+        for bloc in lire_par_blocs(sortie):
+            self.write(bloc)
+            # Bloc envoyé avant la lecture du suivant
+            await self.flush()
+        self.finish()
+
+
+@tornado.web.stream_request_body
+class Conversion(GestionnaireApi):
+    """POST /convertir : conversion directe ou dépôt dans la file d'attente."""
+
+    def initialize(self):
+        # Grand classeur : corps écrit dans un fichier temporaire au fur et à mesure
+        self.temporaire = None
+
+    def prepare(self):
+        # Corps reçu par morceaux : la taille est contrôlée avant de tout recevoir
+        taille_max = self.settings["taille_max"]
+        self.request.connection.set_max_body_size(taille_max)
+        longueur = self.request.headers.get("Content-Length")
+        if longueur is not None and int(longueur) > taille_max:
+            raise tornado.web.HTTPError(413, f"classeur trop volumineux (maximum "
+                                             f"{taille_max} octets)")
+        self.morceaux = []
+        self.taille = 0
+
+    def data_received(self, morceau):
+        self.taille += len(morceau)
+        if self.taille > self.settings["taille_max"]:
+            raise tornado.web.HTTPError(413, "classeur trop volumineux")
+        if self.temporaire is None and est_grand(self.taille):
+            self.temporaire = fichier_temporaire()
+            self.temporaire.writelines(self.morceaux)
+            self.morceaux = []
+        if self.temporaire is not None:
+            self.temporaire.write(morceau)
+        else:
+            self.morceaux.append(morceau)
+
+    def on_finish(self):
+        self.supprimer_classeur()
+
+    def on_connection_close(self):
+        # Client déconnecté avant la fin de la réponse
+        self.supprimer_classeur()
+
+    def supprimer_classeur(self):
+        """Supprime le fichier temporaire du classeur reçu."""
+        if self.temporaire is not None:
+            self.temporaire.close()
+            supprimer_temporaire(self.temporaire.name)
+
+    async def post(self):
+        if not self.taille:
+            raise tornado.web.HTTPError(400, "corps de la requête vide : envoyer le classeur")
+        if self.temporaire is not None:
+            self.temporaire.close()
+            classeur = self.temporaire.name
+        else:
+            classeur = b"".join(self.morceaux)
+            self.morceaux = []
+        format_sortie = self.get_query_argument("format", "xlsx")
+        if format_sortie not in FORMATS_SORTIE:
+            raise tornado.web.HTTPError(400, f"format inconnu : {format_sortie} "
+                                             f"({', '.join(FORMATS_SORTIE)})")
+        nom_fichier = self.get_query_argument("nom", "")
+
+        if self.get_query_argument("file", "0") == "1":
+            if isinstance(classeur, str):
+                with open(classeur, "rb") as f:
+                    id_travail = await IOLoop.current().run_in_executor(
+                        None, soumettre, f, nom_fichier, format_sortie)
+            else:
+                id_travail = await IOLoop.current().run_in_executor(
+                    None, soumettre, classeur, nom_fichier, format_sortie)
+            self.set_status(202)
+            self.set_header("Location", f"/travaux/{id_travail}")
+            self.finish({"id": id_travail, "etat": f"/travaux/{id_travail}",
+                         "sortie": f"/travaux/{id_travail}/sortie"})
+            return
+
+        application = self.application
+        if application.en_cours >= self.settings["concurrence"]:
+            raise tornado.web.HTTPError(503, "trop de conversions en cours")
+        application.en_cours += 1
+        try:
+            statut, type_fichier, sortie, message = await IOLoop.current().run_in_executor(
+                self.settings["executeur"], convertir_requete, classeur, nom_fichier,
+                format_sortie)
+        finally:
+            application.en_cours -= 1
+
+        if statut == "IGNORÉ":
+            raise tornado.web.HTTPError(415, message)
+        if statut != "OK":
+            raise tornado.web.HTTPError(422, message)
+        try:
+            await self.envoyer_fichier(sortie, type_fichier, format_sortie)
+        finally:
+            if isinstance(sortie, str):
+                supprimer_temporaire(sortie)
+
+
+class Travail(GestionnaireApi):
+    """GET /travaux/<id> : état d'un travail de la file d'attente."""
+
+    def get(self, id_travail):
+        travail = etat_travail(id_travail)
+        if travail is None:
+            raise tornado.web.HTTPError(404, "travail inconnu")
+        self.finish(travail)
+
+
+class SortieTravail(GestionnaireApi):
+    """GET /travaux/<id>/sortie : fichier Magenta d'un travail terminé."""
+
+    async def get(self, id_travail):
+        travail = etat_travail(id_travail)
+        if travail is None:
+            raise tornado.web.HTTPError(404, "travail inconnu")
+        if travail["statut"] not in TERMINES:
+            raise tornado.web.HTTPError(409, f"travail {travail['statut'].lower()}")
+        if travail["statut"] != "OK":
+            raise tornado.web.HTTPError(422, travail["message"])
+
+        sortie = chemin_fichier(id_travail, SUFFIXE_SORTIE)
+        if not os.path.exists(sortie):
+            raise tornado.web.HTTPError(404, "fichier produit supprimé")
+        await self.envoyer_fichier(sortie, travail["type_fichier"], travail["format_sortie"])
+
+
+class Sante(GestionnaireApi):
+    """GET /sante : état du service."""
+
+    def get(self):
+        self.finish({"statut": "ok", "en_cours": self.application.en_cours,
+                     "concurrence": self.settings["concurrence"],
+                     "formats": list(FORMATS), "formats_sortie": list(FORMATS_SORTIE)})
+
+
+class Metriques(GestionnaireApi):
+    """GET /metriques : métriques des conversions (format texte de Prometheus)."""
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(exposer())
+
+
+def creer_application(executeur=None, concurrence=None, taille_max=None):
+    """Crée l'application tornado. executeur exécute les conversions directes (None : fils
+    d'exécution du processus, par exemple pour un client de test local)."""
+    if concurrence is None:
+        concurrence = int(os.environ.get("SABIANA_API_CONCURRENCE",
+                                         2 * int(os.environ.get("SABIANA_API_PROCESSUS",
+                                                                os.cpu_count() or 1))))
+    if taille_max is None:
+        taille_max = int(os.environ.get("SABIANA_API_TAILLE_MAX", TAILLE_MAX_DEFAUT))
+
+    application = tornado.web.Application([
+        (r"/convertir", Conversion),
+        (r"/travaux/([0-9a-f]+)", Travail),
+        (r"/travaux/([0-9a-f]+)/sortie", SortieTravail),
+        (r"/sante", Sante),
+        (r"/metriques", Metriques),
+    ], executeur=executeur, concurrence=concurrence, taille_max=taille_max)
+    application.en_cours = 0
+    return application
+
+
+async def servir(application, port, inactivite):
+    """Écoute les requêtes jusqu'à l'arrêt du processus."""
+    serveur = tornado.httpserver.HTTPServer(
+        application, max_body_size=application.settings["taille_max"],
+        idle_connection_timeout=inactivite)
+    serveur.listen(port)
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    """Point d'entrée du service HTTP."""
+    parser = argparse.ArgumentParser(description="API HTTP de conversion pour MAGENTA")
+    parser.add_argument("--port", type=int,
+                        default=int(os.environ.get("SABIANA_API_PORT", PORT_DEFAUT)))
+    parser.add_argument("--processus", type=int,
+                        default=int(os.environ.get("SABIANA_API_PROCESSUS",
+                                                   os.cpu_count() or 1)),
+                        help="Processus des conversions directes (par défaut : nombre de cœurs)")
+    parser.add_argument("--inactivite", type=float,
+                        default=float(os.environ.get("SABIANA_API_INACTIVITE",
+                                                     INACTIVITE_DEFAUT)),
+                        help="Maintien des connexions inactives en secondes (par défaut : 60)")
+    args = parser.parse_args(argv)
+
+    executeur = demarrer_executeur(max(1, args.processus))
+    # Processus de la file d'attente (SABIANA_PROCESSUS=0 s'ils sont lancés à part)
+    lancer_processus()
+
+    application = creer_application(executeur, int(os.environ.get(
+        "SABIANA_API_CONCURRENCE", 2 * max(1, args.processus))))
+    print(f"API de conversion : http://localhost:{args.port} "
+          f"({args.processus} processus préchauffés)")
+    try:
+        asyncio.run(servir(application, args.port, args.inactivite))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executeur.shutdown(cancel_futures=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""Conversion en lot (sans interface) des fichiers Easysel, Rapid'Aero et PANNEAU
+
+Exemples :
+    python batch.py /chemin/vers/offres
+    python batch.py --liste fichiers.txt --processus 8
+    python batch.py /chemin/vers/offres --sortie csv
+    SABIANA_MEMOIRE_MAX=500000000 python batch.py /chemin/vers/offres
+"""
+
+import argparse
+import os
+import sys
+import time
+from functools import partial
+from multiprocessing import Pool
+
+from detection import identifier_format
+from formats import FORMATS, FORMATS_SORTIE, convertisseur, ecrivain
+from grands_fichiers import flux, ouvrir_contenu
+from metriques import enregistrer_conversion
+from suivi import demarrer_suivi
+
+EXTENSIONS = (".xlsx", ".xlsm")
+SUFFIXE_SORTIE = "_Magenta"
+AUCUNE_DONNEE = "aucune donnée extraite"
+
+
+def chemin_sortie(chemin, format_sortie="xlsx"):
+    """Renvoie le chemin du fichier Magenta écrit à côté du fichier source."""
+    racine, _ = os.path.splitext(chemin)
+    return racine + SUFFIXE_SORTIE + FORMATS_SORTIE[format_sortie][1]
+
+
+def est_classeur_source(nom_fichier):
+    """Vérifie qu'un fichier est un classeur à convertir (ni fichier de verrou, ni sortie)."""
+    return (nom_fichier.lower().endswith(EXTENSIONS)
+            and not nom_fichier.startswith("~$")
+            and not os.path.splitext(nom_fichier)[0].endswith(SUFFIXE_SORTIE))
+
+
+def lister_fichiers(chemins, liste=None):
+    """Parcourt les dossiers et la liste de fichiers pour trouver les classeurs à convertir."""
+    fichiers = []
+
+    for chemin in chemins:
+        if os.path.isdir(chemin):
+            for dossier, _, noms in os.walk(chemin):
+                fichiers.extend(os.path.join(dossier, nom) for nom in sorted(noms)
+                                if est_classeur_source(nom))
+        else:
+            fichiers.append(chemin)
+
+    if liste:
+        with open(liste, encoding="utf-8") as f:
+            fichiers.extend(ligne.strip() for ligne in f if ligne.strip())
+
+    return fichiers
+
+
+def prechauffer():
+    """Importe d'avance les modules de traitement et d'écriture de tous les formats
+    (pandas, openpyxl, xlsxwriter), ainsi que le cache des conversions. Appelée au
+    démarrage d'un processus de conversion : le plafond SABIANA_MEMOIRE_MAX ne compte pas
+    ces imports dans sa première conversion."""
+    for nom in FORMATS:
+        convertisseur(nom)
+    for format_sortie in FORMATS_SORTIE:
+        ecrivain(format_sortie)
+    import cache  # noqa: F401  (importé par convertir_contenu à la première conversion)
+
+
+def convertir_contenu(contenu, nom_fichier, format_sortie="xlsx", relire=True):
+    """Identifie et convertit un classeur (octets ou projection d'un grand fichier, cf.
+    grands_fichiers.ouvrir_contenu) : renvoie (statut, type de fichier, contenu Magenta ou
+    None, message). Les erreurs sont renvoyées, jamais levées (relire=False ignore le
+    résultat en cache, cf. convertir_avec_cache). La conversion est comptée dans les
+    métriques (cf. metriques.py)."""
+    debut = time.perf_counter()
+    statut, type_fichier, sortie, message, raison = _convertir_contenu(
+        contenu, nom_fichier, format_sortie, relire)
+    enregistrer_conversion(type_fichier, statut, raison, time.perf_counter() - debut,
+                           len(contenu), len(sortie) if sortie is not None else None)
+    return statut, type_fichier, sortie, message
+
+
+def _convertir_contenu(contenu, nom_fichier, format_sortie, relire):
+    """Conversion de convertir_contenu : renvoie aussi la raison comptée dans les métriques
+    ("ok", "format_non_reconnu", "aucune_donnee", "memoire" ou "erreur")."""
+    type_fichier, _ = identifier_format(flux(contenu), nom_fichier)
+    if type_fichier is None:
+        return "IGNORÉ", None, None, "format non reconnu", "format_non_reconnu"
+
+    # Importé à la première conversion (avec les règles, pandas et numpy)
+    from cache import convertir_avec_cache
+
+    try:
+        sortie = convertir_avec_cache(contenu, type_fichier, format_sortie, relire)
+    except MemoryError as e:
+        # Plafond SABIANA_MEMOIRE_MAX dépassé (MemoireDepassee) ou mémoire épuisée
+        return "ÉCHEC", type_fichier, None, str(e), "memoire"
+    except Exception as e:
+        return "ÉCHEC", type_fichier, None, str(e), "erreur"
+    if sortie is None:
+        return "ÉCHEC", type_fichier, None, AUCUNE_DONNEE, "aucune_donnee"
+
+    return "OK", type_fichier, sortie, type_fichier, "ok"
+
+
+def convertir_chemin(chemin, format_sortie="xlsx"):
+    """Convertit un fichier et renvoie (chemin, statut, sortie, durée, mémoire utilisée en
+    octets ou None, message). La conversion est limitée à SABIANA_MEMOIRE_MAX octets."""
+    debut = time.perf_counter()
+
+    try:
+        with ouvrir_contenu(chemin) as source:
+            with demarrer_suivi() as rapport:
+                statut, _, contenu, message = convertir_contenu(
+                    source, os.path.basename(chemin), format_sortie)
+        memoire = rapport.en_dict()["memoire_utilisee_octets"]
+        if statut != "OK":
+            return chemin, statut, None, time.perf_counter() - debut, memoire, message
+
+        sortie = chemin_sortie(chemin, format_sortie)
+        with open(sortie, "wb") as f:
+            f.write(contenu)
+    except OSError as e:
+        return chemin, "ÉCHEC", None, time.perf_counter() - debut, None, str(e)
+
+    return chemin, "OK", sortie, time.perf_counter() - debut, memoire, message
+
+
+def main(argv=None):
+    """Point d'entrée de la conversion en lot."""
+    parser = argparse.ArgumentParser(description="Conversion en lot des fichiers pour MAGENTA")
+    parser.add_argument("chemins", nargs="*", help="Fichiers ou dossiers à convertir")
+    parser.add_argument("--liste", help="Fichier texte contenant un chemin par ligne")
+    parser.add_argument("--sortie", choices=list(FORMATS_SORTIE), default="xlsx",
+                        help="Format des fichiers produits (par défaut : xlsx)")
+    parser.add_argument("--processus", type=int, default=os.cpu_count(),
+                        help="Nombre de processus de conversion (par défaut : nombre de cœurs)")
+    args = parser.parse_args(argv)
+
+    fichiers = lister_fichiers(args.chemins, args.liste)
+    if not fichiers:
+        parser.error("aucun fichier à convertir")
+
+    compteurs = {"OK": 0, "ÉCHEC": 0, "IGNORÉ": 0}
+    debut = time.perf_counter()
+
+    with Pool(processes=max(1, min(args.processus, len(fichiers))),
+              initializer=prechauffer) as pool:
+        conversion = partial(convertir_chemin, format_sortie=args.sortie)
+        for chemin, statut, sortie, duree, memoire, message in \
+                pool.imap_unordered(conversion, fichiers):
+            compteurs[statut] += 1
+            if statut == "OK":
+                memoire = f", {memoire / 1e6:.0f} Mo" if memoire is not None else ""
+                print(f"{statut:<7} {chemin} -> {sortie} ({message}, {duree:.2f} s{memoire})")
+            else:
+                print(f"{statut:<7} {chemin} : {message}")
+
+    duree_totale = time.perf_counter() - debut
+    debit = len(fichiers) / duree_totale if duree_totale > 0 else 0.0
+    print(f"\n{len(fichiers)} fichier(s) en {duree_totale:.2f} s ({debit:.1f} fichiers/s) : "
+          f"{compteurs['OK']} converti(s), {compteurs['ÉCHEC']} échec(s), "
+          f"{compteurs['IGNORÉ']} ignoré(s)")
+
+    from cache import statistiques_cache
+    stats = statistiques_cache()
+    print(f"Cache : {stats['presents']} présent(s), {stats['absents']} absent(s), "
+          f"{stats['entrees']} entrée(s), {stats['taille'] / 1e6:.1f} Mo")
+
+    return 1 if compteurs["ÉCHEC"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
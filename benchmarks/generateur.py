@@ -0,0 +1,136 @@
+"""Génération de classeurs synthétiques Easysel, Rapid'Aero et PANNEAU
+
+Les classeurs reproduisent la structure lue par les pipelines (sections PREZZI E
+CONDIZIONI / TOTAL, feuilles "°C", onglets PULSAR et DS18) et sont écrits avec
+xlsxwriter, comme Excel, avec des chaînes partagées.
+"""
+
+import json
+import random
+
+import xlsxwriter
+
+from panneau import COLS_CODE_DS18, COLS_QUANTITE_DS18, lettre_en_index
+from regles import chemin_regles
+
+# Codes ordinaires présents dans les offres, en plus des codes des règles de substitution
+CODES_COURANTS = [9000001, 9000002, 9012345, 9024680, "ACC-12", "KIT-03"]
+
+
+def codes_regles():
+    """Renvoie les codes déclencheurs et les codes remplacés du fichier de règles."""
+    with open(chemin_regles(), encoding="utf-8") as f:
+        regles = json.load(f)["regles"]
+    declencheurs = [code for regle in regles for code in regle.get("declencheurs", [])]
+    remplaces = [int(code) for regle in regles for code in regle["correspondances"]]
+    return declencheurs, remplaces
+
+
+def generer_easysel(chemin, nb_lignes, graine=0):
+    """Offre Easysel : en-tête, tableau de nb_lignes lignes par blocs, TOTAL puis annexes."""
+    aleatoire = random.Random(graine)
+    declencheurs, remplaces = codes_regles()
+    codes = declencheurs + remplaces + CODES_COURANTS
+
+    workbook = xlsxwriter.Workbook(chemin, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Offerta")
+
+    lignes = [["SABIANA - OFFERTA"], [], ["Cliente", "Client synthétique"], [],
+              ["PREZZI E CONDIZIONI"],
+              ["Ref.", "Descrizione", "Code", "Q.té", "Prezzo", "Sconto", "Totale"]]
+
+    # Blocs : une ligne de titre, quelques articles puis une ligne vide
+    while len(lignes) < nb_lignes + 6:
+        lignes.append([f"Zone {len(lignes)}"])
+        for _ in range(aleatoire.randint(1, 8)):
+            quantite = aleatoire.randint(1, 10)
+            lignes.append([aleatoire.randint(1, 99), "Article", aleatoire.choice(codes),
+                           quantite, 125.5, 0.1, quantite * 112.95])
+        lignes.append([])
+
+    # Ligne TOTAL puis conditions générales et annexes (ignorées par l'extraction)
+    lignes.append(["TOTAL", None, None, None, None, None, 1000.0])
+    lignes.extend([f"Condition {i}", "Texte des conditions générales de vente " * 4]
+                  for i in range(nb_lignes // 2))
+
+    for num, ligne in enumerate(lignes):
+        worksheet.write_row(num, 0, ligne)
+    workbook.close()
+
+
+def generer_rapid_aero(chemin, nb_feuilles, nb_lignes, graine=0):
+    """Sélection Rapid'Aero : une feuille de synthèse et nb_feuilles feuilles "°C"."""
+    aleatoire = random.Random(graine)
+
+    workbook = xlsxwriter.Workbook(chemin, {"constant_memory": True})
+    workbook.add_worksheet("Synthese").write(0, 0, "Sélection Rapid'Aero")
+
+    for numero in range(nb_feuilles):
+        worksheet = workbook.add_worksheet(f"{10 + numero}°C")
+        worksheet.write_row(0, 0, [f"Colonne {col}" for col in range(20)])
+
+        # Calculs thermiques en A:O, référence / désignation / quantité en P:R
+        for ligne in range(1, nb_lignes + 1):
+            worksheet.write_row(ligne, 0, [aleatoire.random() * 100 for _ in range(15)])
+            worksheet.write_row(ligne, 15, [aleatoire.choice(["0008314", "9012345", "0004417"]),
+                                            f"Aérotherme {ligne}", aleatoire.randint(1, 4),
+                                            "Note", 1.5])
+    workbook.close()
+
+
+def generer_panneau(chemin, nb_lignes_annexes=200, pulsar=True, ds18=True, graine=0):
+    """Calcul PANNEAU : onglets PULSAR et/ou DS18 suivis de nb_lignes_annexes lignes de calcul."""
+    aleatoire = random.Random(graine)
+    workbook = xlsxwriter.Workbook(chemin)
+
+    if pulsar:
+        worksheet = workbook.add_worksheet("PULSAR")
+        worksheet.write(0, 0, "PULSAR")
+        # Titres des colonnes au-dessus des panneaux : colonnes de texte pour pandas
+        worksheet.write_row(13, 0, ["Bâtiment", "Quantité", "Type", "Position"])
+        worksheet.write(13, 14, "Référence")
+        # Panneaux (lignes 16 à 42) : titre en A, quantité, type, position, référence en O
+        for ligne in range(15, 42):
+            if ligne % 7 == 0:
+                worksheet.write(ligne, 0, f"Bâtiment {ligne}")
+            if aleatoire.random() < 0.7:
+                worksheet.write_row(ligne, 1, [aleatoire.randint(1, 9), "Plafond", ligne - 14])
+                worksheet.write(ligne, 14, 9100000 + ligne)
+        # Accessoires (lignes 47 à 70) : code en A, quantité en O
+        for ligne in range(46, 70):
+            if aleatoire.random() < 0.5:
+                worksheet.write(ligne, 0, 9200000 + ligne)
+                worksheet.write(ligne, 14, aleatoire.randint(1, 3))
+        for ligne in range(80, 80 + nb_lignes_annexes):
+            worksheet.write_row(ligne, 0, [aleatoire.random() for _ in range(15)])
+
+    if ds18:
+        worksheet = workbook.add_worksheet("DS18")
+        worksheet.write(0, 0, "DS18")
+        colonnes = list(zip([lettre_en_index(col) for col in COLS_QUANTITE_DS18],
+                            [lettre_en_index(col) for col in COLS_CODE_DS18]))
+        # Titres des colonnes au-dessus des panneaux : colonnes de texte pour pandas
+        worksheet.write_row(12, 0, ["Accessoire", "Nombre", "Modèle", "Longueur"])
+        worksheet.write(12, 15, "Quantité")
+        for col_quantite, col_code in colonnes:
+            worksheet.write(12, col_quantite, "Qté")
+            worksheet.write(12, col_code, "Code")
+        # Panneaux (lignes 15 à 45) : nombre, modèle, longueur puis quantités/codes par type
+        for ligne in range(14, 45):
+            if aleatoire.random() < 0.6:
+                worksheet.write_row(ligne, 1, [aleatoire.randint(1, 4), "DS18",
+                                               aleatoire.choice([1.2, 2.4, 3, 3.6])])
+                for col_quantite, col_code in colonnes:
+                    if aleatoire.random() < 0.6:
+                        worksheet.write(ligne, col_quantite, aleatoire.choice([0, 1, 2]))
+                        worksheet.write(ligne, col_code, 9300000 + ligne * 100 + col_quantite)
+        # Accessoires (lignes 50 à 80) : code, libellé, quantité en P
+        for ligne in range(49, 80):
+            if aleatoire.random() < 0.5:
+                worksheet.write_row(ligne, 0, [9400000 + ligne, "Accessoire"])
+                worksheet.write(ligne, 15, aleatoire.randint(1, 5))
+        # Onglet de calcul large : nombreuses colonnes intermédiaires
+        for ligne in range(84, 84 + nb_lignes_annexes):
+            worksheet.write_row(ligne, 0, [aleatoire.random() for _ in range(120)])
+
+    workbook.close()
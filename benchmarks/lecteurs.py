@@ -0,0 +1,150 @@
+"""Comparaison du lecteur xlsx natif (lecteur_xlsx.py) et d'openpyxl en lecture seule
+
+Pour chaque classeur synthétique, l'ouverture et l'extraction des pipelines sont mesurées
+avec les deux lecteurs (SABIANA_LECTEUR), ainsi qu'un parcours complet des cellules de
+tous les onglets. Les tableaux extraits doivent être identiques, et identiques à ceux
+obtenus à partir des onglets complets lus par pd.read_excel (cf. reference.py).
+
+Exemples (depuis la racine du dépôt) :
+    python -m benchmarks.lecteurs
+    python -m benchmarks.lecteurs --tailles 200,5000 --feuilles 5,30 --repetitions 5
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.mesures import PIPELINES, generer_cas
+from benchmarks.reference import copier_donnees_easysel, copier_tableaux_rapid_aero
+from lecture import ouvrir_classeur
+from panneau import traiter_ds18, traiter_pulsar
+
+LECTEURS = ("openpyxl", "natif")
+
+
+@contextlib.contextmanager
+def lecteur(nom):
+    """Sélectionne le lecteur utilisé par lecture.ouvrir_classeur."""
+    ancien = os.environ.get("SABIANA_LECTEUR")
+    os.environ["SABIANA_LECTEUR"] = nom
+    try:
+        yield
+    finally:
+        if ancien is None:
+            del os.environ["SABIANA_LECTEUR"]
+        else:
+            os.environ["SABIANA_LECTEUR"] = ancien
+
+
+def parcourir(chemin):
+    """Lit toutes les cellules de tous les onglets et renvoie leur nombre."""
+    classeur = ouvrir_classeur(chemin)
+    try:
+        nombre = 0
+        for feuille in classeur.worksheets:
+            feuille.reset_dimensions()
+            for ligne in feuille.iter_rows(values_only=True):
+                nombre += len(ligne)
+        return nombre
+    finally:
+        classeur.close()
+
+
+def extraire_easysel_pandas(chemin):
+    """Extraction Easysel de référence : première feuille complète lue par pandas."""
+    return copier_donnees_easysel(pd.read_excel(chemin, sheet_name=0, header=None))
+
+
+def extraire_panneau_pandas(chemin):
+    """Extraction PANNEAU de référence : onglets PULSAR et DS18 complets lus par pandas,
+    colonnes numérotées par position."""
+    onglets = pd.read_excel(chemin, sheet_name=None)
+    df_export = pd.DataFrame(columns=["Code Produit", "Libellé", "Quantité"])
+    for nom, traiter in (("PULSAR", traiter_pulsar), ("DS18", traiter_ds18)):
+        if nom in onglets:
+            onglet = onglets[nom]
+            onglet.columns = range(onglet.shape[1])
+            df_export = traiter(onglet, df_export)
+    return df_export
+
+
+# Extractions de référence (pd.read_excel sur les onglets complets)
+REFERENCES = {
+    "easysel": extraire_easysel_pandas,
+    "panneau": extraire_panneau_pandas,
+    "rapidaero": lambda chemin: copier_tableaux_rapid_aero(pd.ExcelFile(chemin)),
+}
+
+
+def meilleure_duree(fonction, repetitions):
+    """Renvoie (meilleure durée en secondes, résultat)."""
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        durees.append(time.perf_counter() - debut)
+    return min(durees), resultat
+
+
+def identiques(resultats):
+    """Vérifie que les deux lecteurs donnent le même résultat."""
+    premier, second = resultats
+    if isinstance(premier, pd.DataFrame):
+        return premier.equals(second) and list(premier.dtypes) == list(second.dtypes)
+    return premier == second
+
+
+def main(argv=None):
+    """Point d'entrée de la comparaison."""
+    parser = argparse.ArgumentParser(description="Lecteur xlsx natif comparé à openpyxl")
+    parser.add_argument("--tailles", default="200,2000",
+                        help="Nombres de lignes Easysel / lignes annexes PANNEAU")
+    parser.add_argument("--feuilles", default="5,30", help="Nombres de feuilles Rapid'Aero")
+    parser.add_argument("--repetitions", type=int, default=3,
+                        help="Nombre d'exécutions par mesure (meilleure durée retenue)")
+    args = parser.parse_args(argv)
+
+    # Blocs extraits jamais repris du cache : chaque mesure lit réellement le classeur
+    os.environ["SABIANA_CACHE_TAILLE_MAX"] = "0"
+
+    tailles = [int(taille) for taille in args.tailles.split(",")]
+    feuilles = [int(nombre) for nombre in args.feuilles.split(",")]
+
+    print(f"{'format':<10} {'taille':<22} {'mesure':<12} "
+          + " ".join(f"{nom:>10}" for nom in LECTEURS) + "   gain")
+    ecarts = 0
+    with tempfile.TemporaryDirectory() as dossier:
+        for format_fichier, taille, chemin in generer_cas(dossier, tailles, feuilles):
+            mesures = {"extraction": lambda: PIPELINES[format_fichier][0](chemin),
+                       "cellules": lambda: parcourir(chemin)}
+            for nom_mesure, fonction in mesures.items():
+                durees, resultats = [], []
+                for nom in LECTEURS:
+                    with lecteur(nom), contextlib.redirect_stdout(io.StringIO()):
+                        duree, resultat = meilleure_duree(fonction, args.repetitions)
+                    durees.append(duree)
+                    resultats.append(resultat)
+
+                identique = identiques(resultats)
+                conforme = True
+                if nom_mesure == "extraction" and format_fichier in REFERENCES:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        reference = REFERENCES[format_fichier](chemin)
+                    conforme = identiques([reference, resultats[1]])
+                ecarts += (not identique) + (not conforme)
+                print(f"{format_fichier:<10} {taille:<22} {nom_mesure:<12} "
+                      + " ".join(f"{duree * 1000:>7.1f} ms" for duree in durees)
+                      + f"   x{durees[0] / durees[1]:.1f}"
+                      + ("" if identique else "   RÉSULTATS DIFFÉRENTS")
+                      + ("" if conforme else "   DIFFÉRENT DE PANDAS"))
+
+    return 1 if ecarts else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
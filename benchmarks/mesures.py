@@ -0,0 +1,241 @@
+"""Mesure des performances de chaque étape des pipelines sur des classeurs synthétiques
+
+Étapes mesurées pour chaque format :
+    ouverture      ouverture du classeur en lecture seule et liste des onglets
+    extraction     lecture des cellules utiles (lire_* / traiter_*), sans cache
+    extraction_cache  extraction avec les blocs des onglets repris du cache (Rapid'Aero
+                   et PANNEAU, cf. cache.empreintes_onglets), plus rapide que sans cache
+    extraction_<mode>  extraction Rapid'Aero avec les feuilles '°C' lues en parallèle
+                   (--modes fils,processus ; cf. SABIANA_FEUILLES_MODE)
+    mise_en_forme  modifier_* / mise_en_forme_*
+    ecriture       écriture du fichier Magenta xlsx
+
+Exemples (depuis la racine du dépôt) :
+    python -m benchmarks.mesures
+    python -m benchmarks.mesures --tailles 1000,10000 --sortie resultats.json
+    python -m benchmarks.mesures --comparer ancien.json
+    python -m benchmarks.mesures --modes sequentiel,fils,processus --feuilles 30,100
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+from benchmarks.generateur import generer_easysel, generer_panneau, generer_rapid_aero
+from easysel import lire_donnees_easysel, modifier_tableau_easysel
+from ecriture import ecrire_magenta
+from lecture import ouvrir_classeur
+from panneau import lire_onglets_panneau, modifier_tableau_panneau, traiter_ds18, \
+    traiter_pulsar
+from rapidaero import lire_tableaux_rapid_aero, mise_en_forme_rapid_aero
+
+
+def mesurer(fonction, repetitions):
+    """Renvoie (meilleure durée en secondes, pic mémoire en octets, résultat) d'une étape."""
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        durees.append(time.perf_counter() - debut)
+
+    # Pic mémoire mesuré à part : tracemalloc ralentit l'exécution
+    tracemalloc.start()
+    fonction()
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(durees), pic, resultat
+
+
+def ouvrir(chemin):
+    """Étape d'ouverture commune aux trois formats."""
+    classeur = ouvrir_classeur(chemin)
+    onglets = classeur.sheetnames
+    classeur.close()
+    return onglets
+
+
+def extraire_panneau(chemin):
+    """Extraction PANNEAU : plages PULSAR/DS18 puis lignes d'export."""
+    df_pulsar, df_ds18 = lire_onglets_panneau(chemin)
+    df_export = pd.DataFrame(columns=["Code Produit", "Libellé", "Quantité"])
+    if df_pulsar is not None:
+        df_export = traiter_pulsar(df_pulsar, df_export)
+    if df_ds18 is not None:
+        df_export = traiter_ds18(df_ds18, df_export)
+    return df_export
+
+
+# Pour chaque format : fonction d'extraction et fonction de mise en forme
+PIPELINES = {
+    "easysel": (lire_donnees_easysel, modifier_tableau_easysel),
+    "rapidaero": (lire_tableaux_rapid_aero, mise_en_forme_rapid_aero),
+    "panneau": (extraire_panneau, modifier_tableau_panneau),
+}
+
+
+# Formats dont l'extraction reprend les blocs des onglets du cache
+FORMATS_BLOCS = ("rapidaero", "panneau")
+
+
+@contextlib.contextmanager
+def cache_blocs():
+    """Active le cache des blocs extraits dans un dossier temporaire."""
+    anciens = {nom: os.environ.get(nom)
+               for nom in ("SABIANA_CACHE_DOSSIER", "SABIANA_CACHE_TAILLE_MAX")}
+    with tempfile.TemporaryDirectory() as dossier:
+        os.environ["SABIANA_CACHE_DOSSIER"] = dossier
+        os.environ["SABIANA_CACHE_TAILLE_MAX"] = str(500 * 1024 * 1024)
+        try:
+            yield
+        finally:
+            for nom, valeur in anciens.items():
+                if valeur is None:
+                    os.environ.pop(nom, None)
+                else:
+                    os.environ[nom] = valeur
+
+
+@contextlib.contextmanager
+def mode_feuilles(mode):
+    """Sélectionne le mode d'extraction des feuilles '°C' (cf. rapidaero.mode_extraction)."""
+    ancien = os.environ.get("SABIANA_FEUILLES_MODE")
+    os.environ["SABIANA_FEUILLES_MODE"] = mode
+    try:
+        yield
+    finally:
+        if ancien is None:
+            del os.environ["SABIANA_FEUILLES_MODE"]
+        else:
+            os.environ["SABIANA_FEUILLES_MODE"] = ancien
+
+
+def mesurer_fichier(format_fichier, chemin, repetitions, modes=()):
+    """Mesure les étapes d'un fichier et renvoie une liste de résultats (modes : modes
+    d'extraction parallèle des feuilles Rapid'Aero mesurés en plus)."""
+    extraire, mettre_en_forme = PIPELINES[format_fichier]
+    resultats = []
+
+    def ajouter(etape, fonction):
+        duree, pic, resultat = mesurer(fonction, repetitions)
+        resultats.append({"etape": etape, "duree_s": round(duree, 6), "memoire_pic_octets": pic})
+        return resultat
+
+    ajouter("ouverture", lambda: ouvrir(chemin))
+    donnees = ajouter("extraction", lambda: extraire(chemin))
+    if format_fichier in FORMATS_BLOCS:
+        with cache_blocs():
+            # Première extraction : blocs enregistrés, les suivantes les reprennent
+            extraire(chemin)
+            ajouter("extraction_cache", lambda: extraire(chemin))
+    if format_fichier == "rapidaero":
+        for mode in modes:
+            if mode != "sequentiel":
+                with mode_feuilles(mode):
+                    ajouter(f"extraction_{mode}", lambda: extraire(chemin))
+    # Les fonctions de mise en forme modifient le DataFrame reçu : une copie par appel
+    tableau = ajouter("mise_en_forme", lambda: mettre_en_forme(donnees.copy()))
+    ajouter("ecriture", lambda: ecrire_magenta(tableau, io.BytesIO()))
+
+    return resultats
+
+
+def generer_cas(dossier, tailles, feuilles):
+    """Génère les classeurs à mesurer : (format, paramètre de taille, chemin)."""
+    cas = []
+    for taille in tailles:
+        chemin = os.path.join(dossier, f"Offerta_{taille}.xlsx")
+        generer_easysel(chemin, taille)
+        cas.append(("easysel", f"{taille} lignes", chemin))
+
+        chemin = os.path.join(dossier, f"PANNEAU_{taille}.xlsx")
+        generer_panneau(chemin, nb_lignes_annexes=taille)
+        cas.append(("panneau", f"{taille} lignes annexes", chemin))
+
+    for nb_feuilles in feuilles:
+        chemin = os.path.join(dossier, f"Rapid'Aero_{nb_feuilles}.xlsx")
+        generer_rapid_aero(chemin, nb_feuilles, nb_lignes=200)
+        cas.append(("rapidaero", f"{nb_feuilles} feuilles", chemin))
+
+    return cas
+
+
+def comparer(actuels, chemin_reference):
+    """Affiche le rapport de durée entre les résultats actuels et une exécution précédente."""
+    with open(chemin_reference, encoding="utf-8") as f:
+        reference = {(r["format"], r["taille"], r["etape"]): r for r in json.load(f)["resultats"]}
+
+    print(f"\nComparaison avec {chemin_reference} :")
+    for resultat in actuels:
+        ancien = reference.get((resultat["format"], resultat["taille"], resultat["etape"]))
+        if ancien and ancien["duree_s"] > 0:
+            rapport = resultat["duree_s"] / ancien["duree_s"]
+            print(f"{resultat['format']:<10} {resultat['taille']:<22} {resultat['etape']:<20} "
+                  f"x{rapport:.2f}")
+
+
+def main(argv=None):
+    """Point d'entrée des mesures."""
+    parser = argparse.ArgumentParser(description="Mesures de performance par étape")
+    parser.add_argument("--tailles", default="100,1000,10000",
+                        help="Nombres de lignes Easysel / lignes annexes PANNEAU")
+    parser.add_argument("--feuilles", default="5,30", help="Nombres de feuilles Rapid'Aero")
+    parser.add_argument("--repetitions", type=int, default=3,
+                        help="Nombre d'exécutions par étape (meilleure durée retenue)")
+    parser.add_argument("--sortie", help="Fichier JSON des résultats "
+                        "(par défaut : benchmarks/resultats/<date>.json)")
+    parser.add_argument("--comparer", help="Fichier JSON d'une exécution précédente")
+    parser.add_argument("--modes", default="sequentiel",
+                        help="Modes d'extraction des feuilles Rapid'Aero mesurés "
+                        "(sequentiel, fils, processus)")
+    args = parser.parse_args(argv)
+
+    # Blocs extraits jamais repris du cache : chaque répétition lit réellement le classeur
+    os.environ["SABIANA_CACHE_TAILLE_MAX"] = "0"
+    # Étape extraction en séquentiel, les autres modes sont mesurés à part (--modes)
+    os.environ["SABIANA_FEUILLES_MODE"] = "sequentiel"
+
+    tailles = [int(taille) for taille in args.tailles.split(",")]
+    feuilles = [int(nombre) for nombre in args.feuilles.split(",")]
+
+    resultats = []
+    with tempfile.TemporaryDirectory() as dossier:
+        for format_fichier, taille, chemin in generer_cas(dossier, tailles, feuilles):
+            # Les messages de suivi des pipelines ne sont pas utiles ici
+            with contextlib.redirect_stdout(io.StringIO()):
+                mesures = mesurer_fichier(format_fichier, chemin, args.repetitions,
+                                          args.modes.split(","))
+            for mesure in mesures:
+                resultats.append({"format": format_fichier, "taille": taille, **mesure})
+                print(f"{format_fichier:<10} {taille:<22} {mesure['etape']:<20} "
+                      f"{mesure['duree_s'] * 1000:>10.1f} ms "
+                      f"{mesure['memoire_pic_octets'] / 1e6:>8.1f} Mo")
+
+    sortie = args.sortie or os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultats",
+                                         datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(sortie)), exist_ok=True)
+    with open(sortie, "w", encoding="utf-8") as f:
+        json.dump({
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "machine": platform.platform(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "resultats": resultats,
+        }, f, indent=2, ensure_ascii=False)
+    print(f"\nRésultats enregistrés dans {sortie}")
+
+    if args.comparer:
+        comparer(resultats, args.comparer)
+
+
+if __name__ == "__main__":
+    main()
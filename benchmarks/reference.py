@@ -0,0 +1,406 @@
+"""Implémentations de référence : pipelines d'origine, par pd.read_excel
+
+Ces fonctions reprennent le traitement de l'application avant la lecture en flux
+(lecture.py) et le moteur de règles (regles.py) : feuilles complètes lues par pandas,
+mise en forme ligne par ligne et table des plénums écrite en dur. Les benchmarks et les
+tests comparent à leur résultat celui des pipelines (cf. convertir_reference).
+"""
+
+import logging
+
+import pandas as pd
+
+journal = logging.getLogger(__name__)
+
+# Codes "BEL" et table de correspondance plénums (ajout 19/03/25)
+CODES_BEL = {
+    9066613, 9066603, 9066593, 9066615, 9066605, 9066595,
+    9066617, 9066607, 9066597, 9038037, 9038038, 9038039, 9038047
+}
+TABLE_CORRESPONDANCE = {
+    9069180: (9069570, 9069570),
+    9069190: (9069560, 9069190),
+    9069181: (9069571, 9069571),
+    9069191: (9069561, 9069191),
+    9038050: (9069572, 9069572),
+    9069222: (9069562, 9069222),
+    9066468: (9069573, 9069573),
+    9066368: (9069563, 9066368),
+    9069185: (9069575, 9069575),
+    9069195: (9069565, 9069195),
+    9069186: (9069576, 9069576),
+    9069196: (9069566, 9069196),
+    9069188: (9069578, 9069578),
+    9069198: (9069568, 9069198),
+}
+
+
+def convertir_reference(chemin, type_fichier):
+    """Convertit un classeur comme l'application d'origine : renvoie le tableau Magenta
+    (None si aucune donnée n'est extraite)."""
+    if type_fichier == "easysel":
+        sheet = pd.read_excel(chemin, sheet_name=0, header=None)
+        donnees = copier_donnees_easysel(sheet)
+        return modifier_tableau_easysel(donnees) if donnees is not None else None
+
+    if type_fichier == "rapidaero":
+        donnees = copier_tableaux_rapid_aero(pd.ExcelFile(chemin))
+        return mise_en_forme_rapid_aero(donnees) if donnees is not None else None
+
+    xl = pd.ExcelFile(chemin)
+    df_pulsar = xl.parse("PULSAR") if "PULSAR" in xl.sheet_names else None
+    df_ds18 = xl.parse("DS18") if "DS18" in xl.sheet_names else None
+    df_export = pd.DataFrame(columns=["Code Produit", "Libellé", "Quantité"])
+    if df_pulsar is not None:
+        df_export = traiter_pulsar(df_pulsar, df_export)
+    if df_ds18 is not None:
+        df_export = traiter_ds18(df_ds18, df_export)
+    return modifier_tableau_panneau(df_export)
+
+
+def copier_donnees_easysel(sheet):
+    """Simule le comportement du VBA CopierDonneesEasysel"""
+    # Recherche des mots-clés
+    prix_conditions_index = sheet[sheet.iloc[:, 0] == "PREZZI E CONDIZIONI"].index
+    total_index = sheet[sheet.iloc[:, 0] == "TOTAL"].index
+
+    if prix_conditions_index.empty or total_index.empty:
+        journal.error("Les sections 'PREZZI E CONDIZIONI' ou 'TOTAL' sont introuvables.")
+        return None
+
+    prix_conditions_row = prix_conditions_index[0] + 1
+    total_row = total_index[0]
+
+    # Recherche des colonnes nécessaires
+    headers = sheet.iloc[prix_conditions_row].tolist()
+    try:
+        ref_col = headers.index("Ref.")
+        code_col = headers.index("Code")
+        qte_col = headers.index("Q.té")
+    except ValueError:
+        journal.error("Les colonnes 'Ref.', 'Code', ou 'Q.té' sont introuvables.")
+        return None
+
+    # Extraction des données
+    data = sheet.iloc[prix_conditions_row + 1 : total_row, [ref_col, code_col, qte_col]]
+    data.columns = ["Ref.", "Code", "Q.té"]
+    return data
+
+
+def modifier_tableau_easysel(df):
+    """Mise en forme du tableau, traitement des correspondances plénum"""
+
+    # 1. S'assurer que le DataFrame a au moins 9 colonnes
+    while df.shape[1] < 9:
+        df[f'Col_{df.shape[1]+1}'] = ""
+
+    # 2. Déplacer la colonne A vers la colonne I (index 8)
+    df.insert(8, 'Sous total', df.iloc[:, 0])
+    df.drop(df.columns[0], axis=1, inplace=True)
+
+    # 3. Insérer une colonne vide entre A et B (index 1)
+    df.insert(1, 'Libellé', "")
+
+    # 4. Renommer correctement les colonnes
+    titres = ["Code", "Libellé", "Qté"] + [f"Col_{i+4}" for \
+        i in range(df.shape[1] - 4)] + ["Sous total"]
+    df.columns = titres
+
+    # 5. Traitement des valeurs dans la colonne "Sous total" (ancienne colonne I)
+    for i in df.index:
+        valeur_col_I = df.at[i, "Col_9"]
+        if pd.notna(valeur_col_I) and not str(valeur_col_I).isnumeric():
+            # Si c'est une chaîne de caractères, copier en "Libellé" et mettre "T" en "Sous total"
+            df.at[i, "Libellé"] = valeur_col_I
+            df.at[i, "Sous total"] = "T"
+
+    # Suppression de la colonne I
+    df.drop(df.columns[8], axis=1, inplace=True)
+
+    # 6. Remplir les cellules vides avec des chaînes vides pour éviter les NaN
+    df.fillna("", inplace=True)
+
+    # Réinitialiser l'index pour éviter les erreurs d'accès aux lignes
+    df.reset_index(drop=True, inplace=True)
+
+    # Fonction pour traiter un bloc complet
+    def traiter_bloc(df, indices_bloc):
+        code_col_idx = df.columns.get_loc("Code")
+        # Récupérer les valeurs du bloc et vérifier si au moins un code est dans la liste BEL
+        bloc_values = df.iloc[indices_bloc, code_col_idx].dropna().astype(str)
+
+        # Remplacement des valeurs du bloc
+        for idx in indices_bloc:
+            valeur_actuelle = df.iloc[idx, code_col_idx]
+
+            # Vérifier si AU MOINS UN code BEL est présent dans le bloc
+            contient_bel = any(int(val) in CODES_BEL for val in bloc_values if val.isdigit())
+
+            if pd.notna(valeur_actuelle) and str(valeur_actuelle).isdigit():
+                valeur_actuelle = int(valeur_actuelle)
+
+                if valeur_actuelle in TABLE_CORRESPONDANCE:
+                    nouvelle_valeur = (
+                        TABLE_CORRESPONDANCE[valeur_actuelle][1] if contient_bel
+                        else TABLE_CORRESPONDANCE[valeur_actuelle][0]
+                    )
+                    df.iloc[idx, code_col_idx] = nouvelle_valeur
+
+    # Identification des blocs de lignes consécutives non vides
+    indices_bloc = []
+    for i, valeur in enumerate(df["Code"]):
+        if pd.isna(valeur) or str(valeur).strip() == "":
+            # Si on rencontre une ligne vide, on traite le bloc en cours
+            if indices_bloc:
+                traiter_bloc(df, indices_bloc)
+                indices_bloc = []
+        else:
+            indices_bloc.append(i)
+
+    # Traiter le dernier bloc s'il existe
+    if indices_bloc:
+        traiter_bloc(df, indices_bloc)
+
+    return df
+
+
+def lettre_en_index(lettre):
+    """Convertit une référence de colonne sous forme de lettres (ex: 'A', 'Z', 'AA') en un
+    index numérique pour Pandas."""
+    index = 0
+    for char in lettre:
+        index *= 26
+        index += ord(char.upper()) - ord('A') + 1
+    return index - 1
+
+
+def traiter_pulsar(df_source, df_export):
+    """Fonction pour traiter les données de l'onglet PULSAR"""
+    colonnes_cibles = ["Code Produit", "Libellé", "Quantité"]
+    lignes_pulsar = []
+
+    titres_exportes = set()
+    dernier_titre = ""
+
+    # Utilisation des indices numériques pour éviter les erreurs de colonnes
+    col_titre = 0   # Colonne A
+    col_quantite = 1 # Colonne B
+    col_type = 2     # Colonne C
+    col_position = 3 # Colonne D
+    col_ref = 14     # Colonne O
+
+    # 1. Traitement par titre (Plage A15:A41)
+    for i, row in df_source.iloc[14:41].iterrows():
+        if pd.notna(row.iloc[col_titre]):
+            dernier_titre = row.iloc[col_titre]
+
+            if dernier_titre not in titres_exportes:
+                titres_exportes.add(dernier_titre)
+                lignes_pulsar.append(["", dernier_titre, ""])
+
+        if dernier_titre != "":
+            quantite = row.iloc[col_quantite]
+            if pd.notna(quantite):
+                type_valeur = row.iloc[col_type]
+                position = row.iloc[col_position]
+                reference_valeur = row.iloc[col_ref]
+
+                libelle = f"{type_valeur} {position}" if pd.notna(type_valeur) \
+                    and pd.notna(position) else ""
+                lignes_pulsar.append([reference_valeur, libelle, quantite])
+
+    # 2. Cas sans titre en colonne A (Plage O15:O41)
+    if dernier_titre == "":
+        for i, row in df_source.iloc[14:41].iterrows():
+            reference_valeur = row.iloc[col_ref]
+            if pd.notna(reference_valeur):
+                quantite = row.iloc[col_quantite]
+                if pd.notna(quantite):
+                    type_valeur = row.iloc[col_type]
+                    position = row.iloc[col_position]
+
+                    libelle = f"{type_valeur} {position}" if pd.notna(type_valeur) \
+                        and pd.notna(position) else ""
+                    lignes_pulsar.append([reference_valeur, libelle, quantite])
+
+    # 3. Traitement des options/accessoires (Plage A47:O69)
+    if lignes_pulsar:
+        lignes_pulsar.append(["", "", ""])
+        lignes_pulsar.append(["", "Accessoires PULSAR", ""])
+
+        for i, row in df_source.iloc[45:69].iterrows():
+            if pd.notna(row.iloc[col_titre]):
+                lignes_pulsar.append([row.iloc[col_titre], "", row.iloc[col_ref]])
+
+    df_pulsar = pd.DataFrame(lignes_pulsar, columns=colonnes_cibles)
+    return pd.concat([df_export, df_pulsar], ignore_index=True)
+
+
+def traiter_ds18(df_source, df_export):
+    """Extrait et formate les données de l'onglet DS18 pour les ajouter au fichier de sortie"""
+    if df_source is None:
+        journal.error("Erreur : L'onglet 'DS18' n'existe pas dans le fichier source.")
+        return df_export
+
+    # Liste des types, colonnes de quantités et colonnes codes correspondantes
+    types = ["PanneauComplet", "PanneauFirst", "PanneauIntermédiaire", "PanneauFinal",
+             "CapotEntree", "CapotInter", "CapotFinal", "Jonction", "Travail", "CacheTube"]
+    cols_quantite = ["AR", "AZ", "BH", "BP", "BY", "CA", "CC", "CE", "CH", "CJ"]
+    cols_code = ["AS", "BA", "BI", "BQ", "BZ", "CB", "CD", "CF", "CI", "CK"]
+
+    cols_quantite_indices = [lettre_en_index(col) for col in cols_quantite]
+    cols_code_indices = [lettre_en_index(col) for col in cols_code]
+
+    nouvelles_lignes = []
+
+    # Traitement des panneaux DS18 (lignes 15 à 44)
+    for i in range(13, 44):
+        if pd.notna(df_source.iloc[i, 1]) and pd.notna(df_source.iloc[i, 2]) \
+            and pd.notna(df_source.iloc[i, 3]):
+            titre = f"{df_source.iloc[i, 1]}x {df_source.iloc[i, 2]} de {df_source.iloc[i, 3]}m"
+            nouvelles_lignes.append({"Code Produit": "", "Libellé": titre, "Quantité": ""})
+
+            for j, libelle in enumerate(types):
+                quantite = df_source.iloc[i, cols_quantite_indices[j]]
+                code = df_source.iloc[i, cols_code_indices[j]]
+
+                if pd.notna(quantite) and quantite != 0 and pd.notna(code):
+                    nouvelles_lignes.append({"Code Produit": code, \
+                    "Libellé": libelle, "Quantité": quantite})
+
+    # Traitement des accessoires DS18 (lignes 50 à 79), seulement avec des panneaux DS18
+    if nouvelles_lignes:
+        nouvelles_lignes.append({"Code Produit": "", "Libellé": "Accessoires DS18", "Quantité": ""})
+
+        for i in range(48, 79):
+            if pd.notna(df_source.iloc[i, 0]):
+                code = df_source.iloc[i, 0]
+                libelle = df_source.iloc[i, 1] if pd.notna(df_source.iloc[i, 1]) else ""
+                quantite = df_source.iloc[i, 15] if pd.notna(df_source.iloc[i, 15]) else ""
+
+                nouvelles_lignes.append({"Code Produit": code, \
+                "Libellé": libelle, "Quantité": quantite})
+
+    return pd.concat([df_export, pd.DataFrame(nouvelles_lignes)], ignore_index=True)
+
+
+def modifier_tableau_panneau(df_export):
+    """Mise en forme du dataframe."""
+
+    # 1. S'assurer que le DataFrame a au moins 11 colonnes
+    while df_export.shape[1] < 11:
+        df_export[f'Col_{df_export.shape[1] + 1}'] = ""
+
+    # 2. Ajouter les titres
+    titres = ["Code", "Libellé", "Qté", "Col_4", "Col_5", "Col_6", "Col_7", "Col_8",
+              "Sous total", "Col_10", "Col_11"]
+    df_export.columns = titres
+
+    # 3a Supprimer les lignes où les colonnes A et B sont vides
+    df_export = df_export[~(df_export["Code"].isna() | (df_export["Code"] == "")) |
+            ~(df_export["Libellé"].isna() | (df_export["Libellé"] == ""))]
+    # 3b Supprimer les lignes où les colonnes B et C sont vides
+    df_export = df_export[~(df_export["Qté"].isna() | (df_export["Qté"] == "")) |
+            ~(df_export["Libellé"].isna() | (df_export["Libellé"] == ""))]
+
+    # 4. Ajout de "T" en colonne "Sous total" si SEUL "Libellé" contient une donnée
+    if "Sous total" in df_export.columns:
+        for i, row in df_export.iterrows():
+            if pd.notna(row["Libellé"]) and (pd.isna(row["Code"]) or row["Code"] == "") \
+                and (pd.isna(row["Qté"]) or row["Qté"] == ""):
+                df_export.at[i, "Sous total"] = "T"
+
+    # Remplacement des NaN par ""
+    df_export.fillna("", inplace=True)
+
+    # Déplacement des libellés en colonne K si ce n'est pas un titre
+    if "Sous total" in df_export.columns:
+        for i, row in df_export.iterrows():
+            if row["Sous total"] != "T":
+                df_export.at[i, "Col_11"] = row["Libellé"]
+                df_export.at[i, "Libellé"] = ""
+
+    return df_export
+
+
+def copier_tableaux_rapid_aero(excel_file):
+    """ Copie les données des feuilles se terminant par '°C' """
+    liste_feuilles = excel_file.sheet_names  # Récupérer la liste des feuilles
+    resultats = []
+    ligne_destination = 0
+
+    for sheet_name in liste_feuilles:
+        if sheet_name.endswith("°C"):
+            journal.debug("Traitement de la feuille : %s", sheet_name)
+            # ajout dtype=str pour éviter le problème de référence 0008314
+            df = pd.read_excel(excel_file, sheet_name=sheet_name, header=None, dtype=str)
+
+            # Vérifier que le fichier contient au moins 18 colonnes (jusqu'à la colonne R)
+            if df.shape[1] > 17:
+                # Trouver la dernière ligne utilisée dans la colonne P (colonne index 15)
+                dern_ligne = df.iloc[:, 15].last_valid_index()
+
+                if dern_ligne and dern_ligne >= 1:  # Vérifier qu'il y a bien des données
+                    journal.debug("Dernière ligne remplie en colonne P : %s", dern_ligne)
+
+                # Créer une liste vide pour stocker les données formatées
+                extrait_liste = []
+
+                #  **Ajouter le titre dans la première colonne (ligne actuelle)**
+                # Colonnes P, Q, R vides
+                extrait_liste.append([f"Aérotherme - {sheet_name}"] + [""] * 2)
+
+                #  **Ajouter les données à partir de la ligne suivante**
+                extrait_liste.extend(df.iloc[1:dern_ligne + 1, [15, 16, 17]].values.tolist())
+
+                # Convertir la liste en DataFrame pandas
+                extrait = pd.DataFrame(extrait_liste, columns=["P", "Q", "R"])
+
+                # Ajouter au résultat final
+                resultats.append(extrait)
+
+                # Mise à jour de la ligne de destination (incrémentation)
+                ligne_destination += len(extrait)
+
+    if resultats:
+        return pd.concat(resultats, ignore_index=True)
+    else:
+        return None
+
+
+def mise_en_forme_rapid_aero(df):
+    """
+    Met en forme le tableau extrait :
+    - Déplace une colonne,
+    - Supprime les colonnes inutiles,
+    - Ajoute des titres,
+    - Supprime les lignes vides.
+    """
+
+    # S'assurer que le DataFrame a au moins 11 colonnes
+    while df.shape[1] < 11:
+        df[f'Col_{df.shape[1] + 1}'] = ""
+
+    # Ajouter les titres
+    titres = ["Code", "Libellé", "Qté", "Col_4", "Col_5", "Col_6", "Col_7", "Col_8",
+              "Sous total", "Col_10", "Col_11"]
+    df.columns = titres
+
+    # Swap colonnes A et B
+    df[["Code", "Libellé", "Qté"]] = df[["Libellé","Code", "Qté"]]
+
+    # Ajouter "T" dans "sous-total" si "Aérotherme" est trouvé dans "Libellé"
+    df.loc[df["Libellé"].str.contains("Aérotherme", na=False), "Sous total"] = "T"
+
+    # Supprimer les lignes où les colonnes A et I sont vides
+    df = df[~(df["Code"].isna() | (df["Code"] == "")) |
+            ~(df["Sous total"].isna() | (df["Sous total"] == ""))]
+
+    # Déplacement des libellés en colonne K si ce n'est pas un titre
+    if "Sous total" in df.columns:
+        for i, row in df.iterrows():
+            if row["Sous total"] != "T":
+                df.at[i, "Col_11"] = row["Libellé"]
+                df.at[i, "Libellé"] = ""
+
+    return df
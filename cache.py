@@ -0,0 +1,313 @@
+"""Cache disque des conversions, partagé entre sessions et processus
+
+Les fichiers Magenta sont indexés par l'empreinte SHA-256 du classeur source, du format,
+de la version du convertisseur, des règles de substitution et du catalogue produits.
+Au-delà de la taille maximale, les entrées les moins récemment utilisées sont supprimées.
+
+Les tableaux Magenta (avant écriture) sont conservés de la même façon : ils servent à
+produire un autre format de sortie et à consolider les offres (cf. nomenclature.py)
+sans relire les classeurs.
+
+Les blocs extraits des onglets (avant mise en forme) sont aussi conservés, indexés par
+la signature de la partie de l'onglet, des chaînes partagées et des styles : CRC-32 et
+taille lus dans l'annuaire de l'archive xlsx, et SHA-256 du contenu compressé (une
+collision du CRC-32 et de la taille ne suffit pas à reprendre un bloc périmé). À la
+conversion d'une nouvelle version d'un classeur, seuls les onglets modifiés sont relus.
+
+La taille totale du cache est tenue à jour à chaque écriture (fichier .taille) : le
+dossier n'est parcouru que lorsqu'elle dépasse la taille maximale, et l'éviction le
+ramène alors à MARGE_EVICTION de celle-ci. Les lectures présentes/absentes sont comptées
+dans les métriques (cf. metriques.py).
+
+Variables d'environnement :
+    SABIANA_CACHE_DOSSIER     dossier du cache (par défaut ~/.cache/sabiana-magenta)
+    SABIANA_CACHE_TAILLE_MAX  taille maximale en octets (par défaut 500 Mo, 0 = désactivé)
+"""
+
+import hashlib
+import os
+import pickle
+import struct
+import tempfile
+import zipfile
+
+from filelock import FileLock
+
+from catalogue import empreinte_catalogue
+from conversion import VERSION_CONVERTISSEUR, convertir_tableau, ecrire_tableau
+from detection import chemins_onglets
+from grands_fichiers import flux
+from metriques import compter_lecture_cache, lectures_cache
+from regles import empreinte_regles
+from suivi import etape, noter
+
+EXTENSION = ".sortie"
+EXTENSION_BLOC = ".bloc"
+TAILLE_MAX_DEFAUT = 500 * 1024 * 1024
+# Part de la taille maximale conservée par l'éviction (les écritures suivantes ne
+# relancent pas aussitôt un parcours du dossier)
+MARGE_EVICTION = 0.9
+
+# Parties de l'archive dont dépendent les valeurs lues dans tous les onglets
+PARTIES_COMMUNES = ("sharedstrings.xml", "styles.xml")
+# En-tête local d'une partie de l'archive zip : signature, longueurs du nom et de l'extra
+ENTETE_LOCAL = struct.Struct("<4s22xHH")
+# Taille des lectures du contenu compressé d'une partie (empreinte des onglets)
+TAILLE_LECTURE = 1024 * 1024
+
+
+def dossier_cache():
+    """Renvoie le dossier du cache (créé si besoin)."""
+    dossier = os.environ.get("SABIANA_CACHE_DOSSIER",
+                             os.path.join(os.path.expanduser("~"), ".cache", "sabiana-magenta"))
+    os.makedirs(dossier, exist_ok=True)
+    return dossier
+
+
+def taille_max_cache():
+    """Renvoie la taille maximale du cache en octets."""
+    return int(os.environ.get("SABIANA_CACHE_TAILLE_MAX", TAILLE_MAX_DEFAUT))
+
+
+def _verrou():
+    """Verrou inter-processus protégeant les écritures, l'éviction et la taille totale."""
+    return FileLock(os.path.join(dossier_cache(), ".verrou"))
+
+
+def cle_cache(contenu, type_fichier, format_sortie="xlsx"):
+    """Calcule la clé d'un classeur : SHA-256 du contenu, des formats d'entrée et de sortie,
+    de la version, des règles de substitution et du catalogue produits."""
+    empreinte = hashlib.sha256(contenu)
+    empreinte.update(f"|{type_fichier}|{format_sortie}|{VERSION_CONVERTISSEUR}|"
+                     f"{empreinte_regles()}|{empreinte_catalogue()}".encode())
+    return empreinte.hexdigest()
+
+
+def lire_cache(cle):
+    """Renvoie le fichier Magenta en cache (None si absent) et met à jour son utilisation."""
+    chemin = os.path.join(dossier_cache(), cle + EXTENSION)
+    try:
+        with open(chemin, "rb") as f:
+            contenu = f.read()
+        os.utime(chemin)  # Date de dernière utilisation pour l'éviction LRU
+    except FileNotFoundError:
+        compter_lecture_cache(False)
+        return None
+
+    compter_lecture_cache(True)
+    return contenu
+
+
+def ecrire_cache(cle, contenu):
+    """Enregistre un fichier Magenta puis supprime les entrées les plus anciennes si besoin."""
+    _ecrire(cle + EXTENSION, contenu)
+
+
+def _ecrire(nom, contenu):
+    """Enregistre une entrée du cache (fichier Magenta ou bloc extrait) puis supprime les
+    entrées les plus anciennes si la taille totale dépasse la taille maximale."""
+    taille_max = taille_max_cache()
+    if taille_max <= 0 or len(contenu) > taille_max:
+        return
+
+    dossier = dossier_cache()
+    chemin = os.path.join(dossier, nom)
+
+    # Écriture atomique : un autre processus ne lit jamais un fichier incomplet
+    descripteur, temporaire = tempfile.mkstemp(dir=dossier, suffix=".tmp")
+    try:
+        with os.fdopen(descripteur, "wb") as f:
+            f.write(contenu)
+    except OSError:
+        os.remove(temporaire)
+        raise
+
+    with _verrou():
+        try:
+            remplacee = os.stat(chemin).st_size
+        except FileNotFoundError:
+            remplacee = 0
+        os.replace(temporaire, chemin)
+
+        taille = _lire_taille(dossier)
+        if taille is None:
+            taille = _taille_entrees(dossier)
+        else:
+            taille += len(contenu) - remplacee
+        if taille > taille_max:
+            taille = _evincer(dossier, int(taille_max * MARGE_EVICTION))
+        _ecrire_taille(dossier, taille)
+
+
+def _entrees(dossier):
+    """Renvoie les entrées du cache (fichiers Magenta et blocs extraits)."""
+    return [entree for entree in os.scandir(dossier)
+            if entree.name.endswith((EXTENSION, EXTENSION_BLOC))]
+
+
+def _taille_entrees(dossier):
+    """Renvoie la taille totale des entrées du cache (parcours du dossier)."""
+    return sum(entree.stat().st_size for entree in _entrees(dossier))
+
+
+def _lire_taille(dossier):
+    """Renvoie la taille totale tenue à jour (None si inconnue). Appelée sous _verrou."""
+    try:
+        with open(os.path.join(dossier, ".taille"), encoding="ascii") as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _ecrire_taille(dossier, taille):
+    """Enregistre la taille totale du cache. Appelée sous _verrou."""
+    with open(os.path.join(dossier, ".taille"), "w", encoding="ascii") as f:
+        f.write(str(taille))
+
+
+def _evincer(dossier, taille_cible):
+    """Supprime les entrées les moins récemment utilisées jusqu'à taille_cible octets et
+    renvoie la taille restante. Appelée sous _verrou."""
+    entrees = sorted(_entrees(dossier), key=lambda entree: entree.stat().st_mtime)
+    taille = sum(entree.stat().st_size for entree in entrees)
+    for entree in entrees:
+        if taille <= taille_cible:
+            break
+        taille -= entree.stat().st_size
+        os.remove(entree.path)
+    return taille
+
+
+def statistiques_cache():
+    """Renvoie les compteurs de présents/absents (métriques), le nombre d'entrées et la
+    taille du cache."""
+    presents, absents = lectures_cache()
+    entrees = _entrees(dossier_cache())
+    return {"presents": presents, "absents": absents, "entrees": len(entrees),
+            "taille": sum(entree.stat().st_size for entree in entrees)}
+
+
+def tableau_avec_cache(contenu, type_fichier, relire=True):
+    """Renvoie le tableau Magenta (DataFrame, None si aucune donnée) d'un classeur (octets
+    ou projection d'un grand fichier), repris du cache s'il y est (relire=False force la
+    conversion et met à jour le cache)."""
+    cle = cle_cache(contenu, type_fichier, "tableau")
+    if relire:
+        present, tableau = lire_bloc(cle)
+        if present:
+            return tableau
+
+    tableau = convertir_tableau(flux(contenu), type_fichier)
+    ecrire_bloc(cle, tableau)
+    return tableau
+
+
+def convertir_avec_cache(contenu, type_fichier, format_sortie="xlsx", relire=True):
+    """Convertit un classeur (octets) en réutilisant le résultat en cache s'il existe
+    (relire=False force la conversion, pour la mesurer, et met à jour le cache).
+    À défaut du fichier, le tableau Magenta en cache (autre format de sortie) est écrit."""
+    with etape("cache"):
+        cle = cle_cache(contenu, type_fichier, format_sortie)
+        resultat = lire_cache(cle) if relire else None
+        noter("present", resultat is not None)
+
+    if resultat is None:
+        tableau = tableau_avec_cache(contenu, type_fichier, relire)
+        if tableau is None:
+            return None
+        resultat = ecrire_tableau(tableau, type_fichier, format_sortie)
+        ecrire_cache(cle, resultat)
+
+    return resultat
+
+
+def signature_partie(archive, info):
+    """Renvoie la signature d'une partie de l'archive : son entrée dans l'annuaire (CRC-32
+    et taille du contenu décompressé) et l'empreinte SHA-256 de son contenu compressé, lu
+    tel quel dans l'archive sans le décompresser."""
+    fichier = archive.fp
+    fichier.seek(info.header_offset)
+    entete = fichier.read(ENTETE_LOCAL.size)
+    if len(entete) != ENTETE_LOCAL.size:
+        raise zipfile.BadZipFile(f"en-tête tronqué : {info.filename}")
+    signature, longueur_nom, longueur_extra = ENTETE_LOCAL.unpack(entete)
+    if signature != b"PK\x03\x04":
+        raise zipfile.BadZipFile(f"en-tête invalide : {info.filename}")
+
+    fichier.seek(info.header_offset + ENTETE_LOCAL.size + longueur_nom + longueur_extra)
+    condensat = hashlib.sha256()
+    reste = info.compress_size
+    while reste > 0:
+        bloc = fichier.read(min(reste, TAILLE_LECTURE))
+        if not bloc:
+            raise zipfile.BadZipFile(f"partie tronquée : {info.filename}")
+        condensat.update(bloc)
+        reste -= len(bloc)
+
+    return f"|{info.filename}|{info.CRC:08x}|{info.file_size}|{condensat.hexdigest()}".encode()
+
+
+def empreintes_onglets(source, classeur, nature, noms):
+    """Renvoie l'empreinte des onglets noms d'un classeur ouvert ({nom: clé}), vide si le
+    cache est désactivé ou l'archive illisible.
+
+    L'empreinte d'un onglet couvre la signature de sa partie XML, des chaînes partagées et
+    des styles (formats de date), ainsi que l'origine des dates du classeur : un onglet
+    d'empreinte inchangée donne le même bloc extrait. Les parties sont lues compressées,
+    sans décompression.
+    nature distingue les extractions d'un même onglet (colonnes lues)."""
+    if taille_max_cache() <= 0:
+        return {}
+
+    commun = hashlib.sha256(f"{nature}|{VERSION_CONVERTISSEUR}|{classeur.epoch}".encode())
+    empreintes = {}
+    try:
+        with zipfile.ZipFile(source) as archive:
+            parties = {info.filename: info for info in archive.infolist()}
+            for nom_partie, info in sorted(parties.items()):
+                if os.path.basename(nom_partie).lower() in PARTIES_COMMUNES:
+                    commun.update(signature_partie(archive, info))
+            for nom, chemin in chemins_onglets(archive).items():
+                if nom not in noms:
+                    continue
+                empreinte = commun.copy()
+                empreinte.update(f"|{nom}".encode())
+                empreinte.update(signature_partie(archive, parties[chemin]))
+                empreintes[nom] = empreinte.hexdigest()
+    except (zipfile.BadZipFile, KeyError, OSError):
+        return {}
+
+    return empreintes
+
+
+def extraire_bloc(cle, extraire, *args):
+    """Renvoie le bloc extrait d'un onglet : depuis le cache si son empreinte y est
+    (cf. empreintes_onglets), sinon extraire(*args), enregistré pour les conversions
+    suivantes. Sans clé, le bloc est extrait sans cache."""
+    if cle is None:
+        return extraire(*args)
+
+    present, bloc = lire_bloc(cle)
+    noter("reutilise", present)
+    if not present:
+        bloc = extraire(*args)
+        ecrire_bloc(cle, bloc)
+    return bloc
+
+
+def lire_bloc(cle):
+    """Renvoie (présent, bloc) : un bloc en cache (DataFrame ou None) et met à jour son
+    utilisation."""
+    chemin = os.path.join(dossier_cache(), cle + EXTENSION_BLOC)
+    try:
+        with open(chemin, "rb") as f:
+            bloc = pickle.load(f)
+        os.utime(chemin)  # Date de dernière utilisation pour l'éviction LRU
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return False, None
+    return True, bloc
+
+
+def ecrire_bloc(cle, bloc):
+    """Enregistre un bloc (DataFrame ou None) dans le cache."""
+    _ecrire(cle + EXTENSION_BLOC, pickle.dumps(bloc, protocol=pickle.HIGHEST_PROTOCOL))
@@ -0,0 +1,255 @@
+"""Catalogue produits : libellé et famille de chaque code, pour compléter les tableaux Magenta
+
+Le catalogue est une base SQLite indexée par code, construite à partir d'un export du
+catalogue (CSV ou xlsx avec les colonnes code, libellé et, facultativement, famille) :
+
+    python catalogue.py export_catalogue.csv
+
+Les codes d'un tableau sont recherchés en une seule requête (codes absents du cache
+seulement) ; les réponses, codes inconnus compris, sont gardées dans un cache LRU du
+processus. Sans base, les tableaux ne sont pas modifiés.
+
+Variables d'environnement :
+    SABIANA_CATALOGUE        chemin de la base
+                             (par défaut ~/.cache/sabiana-magenta/catalogue.sqlite3)
+    SABIANA_CATALOGUE_CACHE  nombre de codes gardés en mémoire (par défaut 20000)
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+TAILLE_CACHE_DEFAUT = 20000
+
+# Noms de colonnes reconnus dans l'export (sans accents ni majuscules)
+COLONNES_EXPORT = {
+    "code": ("code", "code produit", "reference", "ref", "article"),
+    "libelle": ("libelle", "designation", "description"),
+    "famille": ("famille", "famille produit", "gamme"),
+}
+
+SCHEMA = """
+CREATE TABLE produits (
+    code TEXT PRIMARY KEY,
+    libelle TEXT NOT NULL,
+    famille TEXT NOT NULL DEFAULT ''
+) WITHOUT ROWID;
+CREATE TABLE informations (cle TEXT PRIMARY KEY, valeur TEXT NOT NULL);
+"""
+
+# Codes recherchés ({code: (libellé, famille) ou None}) et base dont ils sont issus
+_cache = {"signature": None, "empreinte": "", "codes": OrderedDict()}
+_verrou = threading.Lock()
+
+
+def chemin_catalogue():
+    """Renvoie le chemin de la base du catalogue."""
+    return os.environ.get("SABIANA_CATALOGUE",
+                          os.path.join(os.path.expanduser("~"), ".cache", "sabiana-magenta",
+                                       "catalogue.sqlite3"))
+
+
+def taille_cache_catalogue():
+    """Renvoie le nombre de codes gardés en mémoire."""
+    return int(os.environ.get("SABIANA_CATALOGUE_CACHE", TAILLE_CACHE_DEFAUT))
+
+
+def texte_code(code):
+    """Renvoie un code produit sous forme de texte (9100021.0 lu en nombre -> "9100021")."""
+    if isinstance(code, float) and code.is_integer():
+        return str(int(code))
+    return str(code).strip()
+
+
+def connecter(chemin):
+    """Ouvre la base du catalogue en lecture seule (connexion fermée à la sortie du bloc
+    with)."""
+    return contextlib.closing(sqlite3.connect(f"file:{chemin}?mode=ro", uri=True,
+                                              timeout=30))
+
+
+def _actualiser():
+    """Vide le cache si la base a été reconstruite ; renvoie False s'il n'y a pas de base.
+    Appelée sous _verrou."""
+    chemin = chemin_catalogue()
+    try:
+        etat = os.stat(chemin)
+    except FileNotFoundError:
+        _cache.update(signature=None, empreinte="", codes=OrderedDict())
+        return False
+
+    signature = (chemin, etat.st_mtime_ns, etat.st_size)
+    if _cache["signature"] != signature:
+        with connecter(chemin) as base:
+            ligne = base.execute("SELECT valeur FROM informations WHERE cle = 'empreinte'") \
+                .fetchone()
+        _cache.update(signature=signature, empreinte=ligne[0] if ligne else "",
+                      codes=OrderedDict())
+    return True
+
+
+def empreinte_catalogue():
+    """Renvoie l'empreinte de la base du catalogue ("" sans base), pour le cache des
+    conversions."""
+    with _verrou:
+        _actualiser()
+        return _cache["empreinte"]
+
+
+def rechercher(codes):
+    """Renvoie {code: (libellé, famille)} pour les codes (texte, cf. texte_code) connus du
+    catalogue. Les codes absents du cache sont recherchés en une seule requête."""
+    codes = set(codes) - {""}
+    with _verrou:
+        if not codes or not _actualiser():
+            return {}
+
+        connus = _cache["codes"]
+        manquants = [code for code in codes if code not in connus]
+        if manquants:
+            with connecter(chemin_catalogue()) as base:
+                trouves = {code: (libelle, famille) for code, libelle, famille in
+                           base.execute("SELECT code, libelle, famille FROM produits "
+                                        "WHERE code IN (SELECT value FROM json_each(?))",
+                                        (json.dumps(manquants),))}
+            for code in manquants:
+                # Codes inconnus gardés aussi : ils ne sont pas recherchés à nouveau
+                connus[code] = trouves.get(code)
+
+        resultats = {}
+        for code in codes:
+            connus.move_to_end(code)
+            if connus[code] is not None:
+                resultats[code] = connus[code]
+
+        # Éviction des codes les moins récemment utilisés
+        taille_max = taille_cache_catalogue()
+        while len(connus) > taille_max:
+            connus.popitem(last=False)
+    return resultats
+
+
+def completer_libelles(df, colonne_code="Code", colonne_libelle="Libellé"):
+    """Remplit le libellé vide des lignes produits (hors titres "T") avec le libellé du
+    catalogue de leur code. Sans base de catalogue, le tableau n'est pas modifié."""
+    if df.empty or not os.path.exists(chemin_catalogue()):
+        return df
+
+    libelles = df[colonne_libelle]
+    a_completer = (libelles.isna() | (libelles == "")) & df[colonne_code].notna() \
+        & (df[colonne_code] != "")
+    if "Sous total" in df.columns:
+        a_completer &= df["Sous total"] != "T"
+    if not a_completer.any():
+        return df
+
+    # Chaque code distinct n'est converti et recherché qu'une fois
+    codes = df.loc[a_completer, colonne_code]
+    positions, distincts = pd.factorize(codes)
+    textes = [texte_code(code) for code in distincts]
+    catalogue = rechercher(textes)
+    if not catalogue:
+        return df
+
+    libelles_distincts = np.array([catalogue[texte][0] if texte in catalogue else None
+                                   for texte in textes], dtype=object)
+    trouves = pd.Series(libelles_distincts[positions], index=codes.index).dropna()
+    df.loc[trouves.index, colonne_libelle] = trouves
+    return df
+
+
+def normaliser_colonne(nom):
+    """Nom de colonne de l'export sans accents, espaces superflus ni majuscules."""
+    nom = unicodedata.normalize("NFKD", str(nom)).encode("ascii", "ignore").decode()
+    return " ".join(nom.lower().replace("_", " ").split())
+
+
+def lire_export(chemin):
+    """Lit un export du catalogue (CSV ou xlsx) : DataFrame code, libelle, famille."""
+    if chemin.lower().endswith((".xlsx", ".xlsm")):
+        export = pd.read_excel(chemin, dtype=str)
+    else:
+        # Séparateur détecté (",", ";" ou tabulation selon l'export)
+        export = pd.read_csv(chemin, dtype=str, sep=None, engine="python",
+                             encoding="utf-8-sig")
+
+    noms = {normaliser_colonne(colonne): colonne for colonne in export.columns}
+    colonnes = {}
+    for cible, possibles in COLONNES_EXPORT.items():
+        trouvee = next((noms[nom] for nom in possibles if nom in noms), None)
+        if trouvee is None and cible != "famille":
+            raise ValueError(f"Colonne '{cible}' introuvable dans {chemin} "
+                             f"(colonnes : {', '.join(map(str, export.columns))})")
+        colonnes[cible] = trouvee
+
+    produits = pd.DataFrame({
+        "code": export[colonnes["code"]].fillna("").str.strip(),
+        "libelle": export[colonnes["libelle"]].fillna("").str.strip(),
+        "famille": (export[colonnes["famille"]].fillna("").str.strip()
+                    if colonnes["famille"] else ""),
+    })
+    # Une ligne par code (la dernière de l'export), libellé renseigné
+    produits = produits[(produits["code"] != "") & (produits["libelle"] != "")]
+    return produits.drop_duplicates("code", keep="last")
+
+
+def construire(chemin_export, chemin_base=None):
+    """Construit la base du catalogue à partir d'un export et renvoie le nombre de codes.
+    La base est remplacée de façon atomique : les conversions en cours lisent l'ancienne."""
+    chemin_base = chemin_base or chemin_catalogue()
+    produits = lire_export(chemin_export)
+
+    with open(chemin_export, "rb") as f:
+        empreinte = hashlib.sha256(f.read()).hexdigest()[:16]
+
+    dossier = os.path.dirname(os.path.abspath(chemin_base))
+    os.makedirs(dossier, exist_ok=True)
+    descripteur, temporaire = tempfile.mkstemp(dir=dossier, suffix=".tmp")
+    os.close(descripteur)
+    try:
+        base = sqlite3.connect(temporaire)
+        try:
+            base.executescript(SCHEMA)
+            base.executemany("INSERT INTO produits VALUES (?, ?, ?)",
+                             produits.itertuples(index=False, name=None))
+            base.executemany("INSERT INTO informations VALUES (?, ?)",
+                             [("empreinte", empreinte), ("source", chemin_export),
+                              ("date", time.strftime("%Y-%m-%d %H:%M:%S"))])
+            base.commit()
+        finally:
+            base.close()
+        os.replace(temporaire, chemin_base)
+    except BaseException:
+        os.remove(temporaire)
+        raise
+    return len(produits)
+
+
+def main(argv=None):
+    """Point d'entrée de la construction du catalogue."""
+    parser = argparse.ArgumentParser(description="Construction du catalogue produits")
+    parser.add_argument("export", help="Export du catalogue (CSV ou xlsx)")
+    parser.add_argument("--base", default=chemin_catalogue(),
+                        help="Base produite (par défaut : SABIANA_CATALOGUE)")
+    args = parser.parse_args(argv)
+
+    debut = time.perf_counter()
+    nombre = construire(args.export, args.base)
+    print(f"{nombre} code(s) produit dans {args.base} ({time.perf_counter() - debut:.2f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""Module de conversion des fichiers, indépendant de l'interface Streamlit
+
+Les modules de traitement (panneau, easysel, rapidaero) et d'écriture ne sont importés
+qu'à la première conversion du format concerné (cf. formats.py).
+"""
+
+import io
+
+from formats import FORMATS, FORMATS_SORTIE, convertisseur, ecrivain
+from suivi import etape, noter
+
+# À incrémenter à chaque modification du contenu des fichiers produits (invalide le cache)
+VERSION_CONVERTISSEUR = 4
+
+
+def nom_fichier_sortie(type_fichier, format_sortie="xlsx"):
+    """Renvoie le nom du fichier proposé au téléchargement."""
+    return FORMATS[type_fichier].nom_fichier + FORMATS_SORTIE[format_sortie][1]
+
+
+def convertir_tableau(source, type_fichier):
+    """Extrait et met en forme un classeur : renvoie le tableau Magenta (DataFrame, None si
+    aucune donnée), avant écriture."""
+    return convertisseur(type_fichier)(source)
+
+
+def ecrire_tableau(resultat, type_fichier, format_sortie="xlsx"):
+    """Écrit un tableau Magenta au format de sortie demandé et renvoie le contenu du fichier."""
+    with etape("ecriture " + format_sortie):
+        output = io.BytesIO()
+        ecrivain(format_sortie)(resultat, output, FORMATS[type_fichier].nom_onglet)
+        noter("octets", output.tell())
+    return output.getvalue()
+
+
+def convertir_fichier(source, type_fichier, format_sortie="xlsx"):
+    """Convertit un classeur et renvoie le contenu du fichier Magenta (None si aucune donnée)
+    au format de sortie demandé ("xlsx", "csv", "parquet" ou "magenta")."""
+    resultat = convertir_tableau(source, type_fichier)
+    if resultat is None:
+        return None
+    return ecrire_tableau(resultat, type_fichier, format_sortie)
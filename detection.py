@@ -0,0 +1,126 @@
+"""Détection du type de fichier d'après son contenu (sans analyser les feuilles de calcul)
+
+Seuls xl/workbook.xml (noms des onglets) et, si besoin, le début de xl/sharedStrings.xml
+sont lus dans l'archive xlsx. Pour les classeurs sans chaînes partagées (chaînes en
+ligne), le début du premier onglet est parcouru comme du texte brut.
+"""
+
+import zipfile
+import xml.etree.ElementTree as ET
+
+from formats import FORMATS, detecter_format
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Nombre maximal de chaînes partagées examinées pour repérer un marqueur (offre Easysel)
+MAX_CHAINES = 2000
+# Nombre maximal d'octets du premier onglet examinés à défaut de chaînes partagées
+MAX_OCTETS_ONGLET = 256 * 1024
+
+
+def chemins_onglets(archive):
+    """Renvoie les onglets déclarés dans xl/workbook.xml, dans leur ordre, avec le chemin
+    de leur partie dans l'archive ({nom: chemin})."""
+    with archive.open("xl/workbook.xml") as f:
+        onglets = list(ET.parse(f).getroot().iter(NS + "sheet"))
+    if not onglets:
+        return {}
+
+    # Chemins des onglets d'après les relations du classeur
+    with archive.open("xl/_rels/workbook.xml.rels") as f:
+        cibles = {relation.get("Id"): relation.get("Target")
+                  for relation in ET.parse(f).getroot().iter(NS_PKG + "Relationship")}
+    chemins = {}
+    for onglet in onglets:
+        cible = cibles.get(onglet.get(NS_REL + "id"), "")
+        chemins[onglet.get("name")] = cible.lstrip("/") if cible.startswith("/") \
+            else "xl/" + cible
+    return chemins
+
+
+def lire_onglets(archive):
+    """Renvoie les noms des onglets déclarés dans xl/workbook.xml et le chemin du premier."""
+    chemins = chemins_onglets(archive)
+    if not chemins:
+        return [], None
+    return list(chemins), next(iter(chemins.values()))
+
+
+def chercher_marqueurs(archive, marqueurs, max_chaines=MAX_CHAINES):
+    """Renvoie les marqueurs trouvés parmi les premières chaînes partagées du classeur."""
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return set()
+
+    restants = set(marqueurs)
+    trouves = set()
+    with archive.open("xl/sharedStrings.xml") as f:
+        for nombre, (_, element) in enumerate(ET.iterparse(f), start=1):
+            if element.tag != NS + "si":
+                continue
+            # Une chaîne peut être découpée en plusieurs segments (texte enrichi)
+            texte = "".join(t.text or "" for t in element.iter(NS + "t"))
+            element.clear()
+            if texte in restants:
+                restants.discard(texte)
+                trouves.add(texte)
+                if not restants:
+                    break
+            if nombre >= max_chaines:
+                break
+
+    return trouves
+
+
+def chercher_marqueurs_onglet(archive, chemin, marqueurs, max_octets=MAX_OCTETS_ONGLET):
+    """Renvoie les marqueurs présents au début d'un onglet (chaînes en ligne), sans l'analyser."""
+    if chemin not in archive.namelist():
+        return set()
+
+    with archive.open(chemin) as f:
+        debut = f.read(max_octets)
+    return {marqueur for marqueur in marqueurs if marqueur.encode("utf-8") in debut}
+
+
+class ApercuClasseur:
+    """Ce que les prédicats de détection des formats peuvent consulter d'un classeur :
+    noms des onglets et recherche de marqueurs textuels."""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.onglets, self.premier_onglet = lire_onglets(archive)
+
+    def chercher(self, marqueurs):
+        """Renvoie les marqueurs trouvés dans les chaînes partagées ou le premier onglet."""
+        return chercher_marqueurs(self.archive, marqueurs) \
+            or chercher_marqueurs_onglet(self.archive, self.premier_onglet, marqueurs)
+
+
+def detecter_format_contenu(source):
+    """Identifie le type d'un classeur d'après son contenu : (format, confiance entre 0 et 1).
+    Les formats du registre sont essayés dans leur ordre d'enregistrement."""
+    try:
+        with zipfile.ZipFile(source) as archive:
+            apercu = ApercuClasseur(archive)
+            for nom, format_source in FORMATS.items():
+                confiance = format_source.detecter_contenu(apercu)
+                if confiance:
+                    return nom, confiance
+    except (zipfile.BadZipFile, KeyError, ET.ParseError):
+        pass
+
+    return None, 0.0
+
+
+def identifier_format(source, nom_fichier=""):
+    """Combine la détection par contenu et par nom de fichier : (format, confiance)."""
+    format_contenu, confiance = detecter_format_contenu(source)
+    format_nom = detecter_format(nom_fichier)
+
+    if format_contenu is None:
+        # Contenu non reconnu : seul le nom du fichier permet de décider
+        return format_nom, 0.5 if format_nom else 0.0
+    if format_contenu == format_nom:
+        return format_contenu, 1.0
+    return format_contenu, confiance
@@ -1,138 +1,128 @@
 """Module de traitement des fichiers Easysel"""
 
-import streamlit as st
-import pandas as pd
+import logging
+from collections import defaultdict
 
-def copier_donnees_easysel(sheet):
-    """Simule le comportement du VBA CopierDonneesEasysel"""
-    # Recherche des mots-clés
-    prix_conditions_index = sheet[sheet.iloc[:, 0] == "PREZZI E CONDIZIONI"].index
-    total_index = sheet[sheet.iloc[:, 0] == "TOTAL"].index
+import numpy as np
+import pandas as pd
 
-    if prix_conditions_index.empty or total_index.empty:
-        st.error("Les sections 'PREZZI E CONDIZIONI' ou 'TOTAL' sont introuvables.")
-        return None
+from catalogue import completer_libelles
+from lecture import ouvrir_classeur, convertir_valeur, iterer_lignes, \
+    memoriser, unifier
+from regles import appliquer_regles
+from suivi import etape, noter
 
-    prix_conditions_row = prix_conditions_index[0] + 1
-    total_row = total_index[0]
+journal = logging.getLogger(__name__)
 
-    # Recherche des colonnes nécessaires
-    headers = sheet.iloc[prix_conditions_row].tolist()
+def lire_donnees_easysel(source):
+    """Lecture en flux de la première feuille : même résultat que l'extraction d'origine
+    (benchmarks/reference.py), sans lire les conditions et annexes situées après la ligne
+    TOTAL"""
+    classeur = ouvrir_classeur(source)
     try:
-        ref_col = headers.index("Ref.")
-        code_col = headers.index("Code")
-        qte_col = headers.index("Q.té")
-    except ValueError:
-        st.error("Les colonnes 'Ref.', 'Code', ou 'Q.té' sont introuvables.")
+        with etape("feuille " + classeur.worksheets[0].title):
+            return copier_donnees_easysel_flux(iterer_lignes(classeur.worksheets[0]))
+    finally:
+        classeur.close()
+
+def copier_donnees_easysel_flux(lignes):
+    """Extraction d'origine (copier_donnees_easysel) sur un itérateur de lignes, arrêtée à
+    TOTAL"""
+    lignes = enumerate(lignes)
+    prix_conditions_row = None
+    total_row = None
+
+    # Premières occurrences de 0/1/False/True par colonne, comme pd.read_excel (cf. unifier)
+    memos = defaultdict(dict)
+
+    # Recherche de "PREZZI E CONDIZIONI" (un TOTAL placé avant donne un tableau vide)
+    for num, ligne in lignes:
+        memoriser_ligne(memos, ligne)
+        marqueur = ligne[0] if ligne else None
+        if marqueur == "TOTAL" and total_row is None:
+            total_row = num
+        if marqueur == "PREZZI E CONDIZIONI":
+            prix_conditions_row = num + 1
+            break
+
+    # Recherche des colonnes nécessaires dans la ligne suivante
+    num, ligne = next(lignes, (None, ()))
+    memoriser_ligne(memos, ligne)
+    headers = [convertir_valeur(valeur) for valeur in ligne]
+    if ligne and ligne[0] == "TOTAL" and total_row is None:
+        total_row = num
+
+    # Extraction des trois colonnes jusqu'à la ligne TOTAL
+    data = []
+    if prix_conditions_row is not None and total_row is None:
+        colonnes = [headers.index(titre) if titre in headers else None
+                    for titre in ("Ref.", "Code", "Q.té")]
+        for num, ligne in lignes:
+            if ligne and ligne[0] == "TOTAL":
+                total_row = num
+                break
+            data.append([unifier(memos[col], convertir_valeur(ligne[col]))
+                         if col is not None and col < len(ligne) else np.nan
+                         for col in colonnes])
+
+    if prix_conditions_row is None or total_row is None:
+        journal.error("Les sections 'PREZZI E CONDIZIONI' ou 'TOTAL' sont introuvables.")
         return None
 
-    # Extraction des données
-    data = sheet.iloc[prix_conditions_row + 1 : total_row, [ref_col, code_col, qte_col]]
-    data.columns = ["Ref.", "Code", "Q.té"]
-    return data
-
-def modifier_tableau_easysel(df):
-    """Mise en forme du tableau, traitement des correspondances plénum"""
-
-    # 1. S'assurer que le DataFrame a au moins 9 colonnes
-    while df.shape[1] < 9:
-        df[f'Col_{df.shape[1]+1}'] = ""
-
-    # 2. Déplacer la colonne A vers la colonne I (index 8)
-    #    # Renommer la colonne A en "Sous total"
-    df.insert(8, 'Sous total', df.iloc[:, 0])  # Déplacer la colonne A vers la colonne I
-    df.drop(df.columns[0], axis=1, inplace=True)  # Supprimer la colonne A d'origine
-
-    # 3. Insérer une colonne vide entre A et B (index 1)
-    df.insert(1, 'Libellé', "")  # Nouvelle colonne vide en B
-
-    # 4. Renommer correctement les colonnes
-    titres = ["Code", "Libellé", "Qté"] + [f"Col_{i+4}" for \
-        i in range(df.shape[1] - 4)] + ["Sous total"]
-    df.columns = titres
-
-    # 5. Traitement des valeurs dans la colonne "Sous total" (ancienne colonne I)
-    for i in df.index:
-        # Vérifier si la valeur dans "Sous total" est une chaîne de caractères
-        valeur_col_I = df.at[i, "Col_9"]
-        if pd.notna(valeur_col_I) and not str(valeur_col_I).isnumeric():
-            # Si c'est une chaîne de caractères, copier en "Libellé" et mettre "T" en "Sous total"
-            df.at[i, "Libellé"] = valeur_col_I  # Copier dans la colonne B ("Libellé")
-            df.at[i, "Sous total"] = "T"        # Remplacer par "T" dans la colonne I
-
-    #Suppression de la colonne I
-    df.drop(df.columns[8], axis=1, inplace=True)
-
-    # 6. Remplir les cellules vides avec des chaînes vides pour éviter les NaN
-    df.fillna("", inplace=True)
-
-    # Intégration de la correspondance codes plénums
-        # Ajout 19/03/25
-        # Définition des codes "BEL"
-
-    codes_bel = {
-        9066613, 9066603, 9066593, 9066615, 9066605, 9066595,
-        9066617, 9066607, 9066597, 9038037, 9038038, 9038039, 9038047
-    }
-
-    # Table de correspondance plénums
-    table_correspondance = {
-        9069180: (9069570, 9069570),
-        9069190: (9069560, 9069190),
-        9069181: (9069571, 9069571),
-        9069191: (9069561, 9069191),
-        9038050: (9069572, 9069572),
-        9069222: (9069562, 9069222),
-        9066468: (9069573, 9069573),
-        9066368: (9069563, 9066368),
-        9069185: (9069575, 9069575),
-        9069195: (9069565, 9069195),
-        9069186: (9069576, 9069576),
-        9069196: (9069566, 9069196),
-        9069188: (9069578, 9069578),
-        9069198: (9069568, 9069198),
-    }
-
-    # Réinitialiser l'index pour éviter les erreurs d'accès aux lignes
-    df.reset_index(drop=True, inplace=True)
-
-    # Fonction pour traiter un bloc complet
-    def traiter_bloc(df, indices_bloc):
-        code_col_idx = df.columns.get_loc("Code")  # Récupérer l'index de la colonne "Code"
-        # Récupérer les valeurs du bloc et vérifier si au moins un code est dans la liste BEL
-        bloc_values = df.iloc[indices_bloc, code_col_idx].dropna().astype(str)
-
-        # Remplacement des valeurs du bloc
-        for idx in indices_bloc:
-            valeur_actuelle = df.iloc[idx, code_col_idx]
+    if not all(titre in headers for titre in ("Ref.", "Code", "Q.té")):
+        journal.error("Les colonnes 'Ref.', 'Code', ou 'Q.té' sont introuvables.")
+        return None
 
-            # Vérifier si AU MOINS UN code BEL est présent dans le bloc
-            contient_bel = any(int(val) in codes_bel for val in bloc_values if val.isdigit())
+    index = range(prix_conditions_row + 1, max(total_row, prix_conditions_row + 1))
+    return pd.DataFrame(data, index=index, columns=["Ref.", "Code", "Q.té"], dtype=object)
 
-            if pd.notna(valeur_actuelle) and str(valeur_actuelle).isdigit():
-                valeur_actuelle = int(valeur_actuelle)
+def memoriser_ligne(memos, ligne):
+    """Note les premières occurrences de 0/1/False/True d'une ligne précédant les données,
+    par colonne (cf. lecture.unifier)"""
+    for col, valeur in enumerate(ligne or ()):
+        memoriser(memos[col], valeur)
 
-                if valeur_actuelle in table_correspondance:
-                    nouvelle_valeur = (
-                        table_correspondance[valeur_actuelle][1] if contient_bel
-                        else table_correspondance[valeur_actuelle][0]
-                    )
-                    df.iloc[idx, code_col_idx] = nouvelle_valeur
+def modifier_tableau_easysel(df):
+    """Mise en forme du tableau, traitement des correspondances plénum
+
+    Le tableau Magenta est construit en une seule fois à partir des colonnes Ref., Code
+    et Q.té (sans copie du tableau à chaque insertion ou suppression de colonne)."""
+
+    # Colonne A (Ref.) : une chaîne non numérique est un titre de bloc, copié en "Libellé"
+    # avec "T" en "Sous total"
+    references, codes, quantites = (df.iloc[:, col] for col in range(3))
+    est_titre = (references.notna() & ~references.astype(str).str.isnumeric()).to_numpy()
+    vide = np.full(len(df), "", dtype=object)
+
+    # Code, Libellé, Qté, colonnes vides Col_4 à Col_8 puis "Sous total" ;
+    # cellules vides remplies avec des chaînes vides pour éviter les NaN
+    colonnes = {
+        "Code": np.where(codes.isna(), vide, codes.to_numpy(dtype=object)),
+        "Libellé": np.where(est_titre, references.to_numpy(dtype=object), vide),
+        "Qté": np.where(quantites.isna(), vide, quantites.to_numpy(dtype=object)),
+    }
+    for num in range(4, 9):
+        colonnes[f"Col_{num}"] = vide
+    colonnes["Sous total"] = np.where(est_titre, "T", vide)
 
-    # Identification des blocs de lignes consécutives non vides
-    indices_bloc = []
-    for i, valeur in enumerate(df["Code"]):
-        if pd.isna(valeur) or str(valeur).strip() == "":  
-            # Si on rencontre une ligne vide, on traite le bloc en cours
-            if indices_bloc:  
-                traiter_bloc(df, indices_bloc)  
-                indices_bloc = []  # Réinitialiser pour le prochain bloc
-        else:
-            indices_bloc.append(i)  # Ajouter l'index de la ligne au bloc actuel
+    df = pd.DataFrame(colonnes, index=pd.RangeIndex(len(df)))
 
-    # Traiter le dernier bloc s'il existe
-    if indices_bloc:
-        traiter_bloc(df, indices_bloc)
+    # Intégration de la correspondance codes plénums (cf. regles_substitution.json)
+    appliquer_regles(df, "easysel")
 
+    # Libellés des lignes produits repris du catalogue (cf. catalogue.py)
+    completer_libelles(df)
 
     return df
+
+def convertir(source):
+    """Extrait et met en forme le tableau d'une offre Easysel (None si sections absentes)."""
+    # Lecture en flux de la première feuille, arrêtée à la ligne TOTAL
+    with etape("extraction"):
+        donnees = lire_donnees_easysel(source)
+        if donnees is None:
+            return None
+        noter("lignes", len(donnees))
+
+    with etape("mise_en_forme"):
+        return modifier_tableau_easysel(donnees)
@@ -0,0 +1,85 @@
+"""Écriture des fichiers Magenta (xlsxwriter en mode mémoire constante)
+
+Les formats de sortie et leurs fonctions d'écriture sont déclarés dans formats.FORMATS_SORTIE.
+"""
+
+import math
+
+import pandas as pd
+import xlsxwriter
+
+
+def valeur_cellule(valeur):
+    """Remplace les valeurs manquantes (NaN, None, pd.NA) par une cellule vide."""
+    if valeur is None or valeur is pd.NA or (isinstance(valeur, float) and math.isnan(valeur)):
+        return None
+    return valeur
+
+
+def ecrire_magenta(df, output, nom_onglet="Sheet1"):
+    """
+    Écrit le tableau Magenta ligne par ligne : en-tête, lignes de titre ("T" en
+    "Sous total") en gras, colonne Code centrée et largeurs ajustées au contenu.
+    """
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(nom_onglet)
+
+    # Formats : en-tête identique à celui de pandas, titres en gras, code centré
+    format_entete = workbook.add_format({"bold": True, "border": 1,
+                                         "align": "center", "valign": "top"})
+    format_titre = workbook.add_format({"bold": True})
+    format_code = workbook.add_format({"align": "center", "valign": "vcenter"})
+    format_code_titre = workbook.add_format({"bold": True, "align": "center",
+                                             "valign": "vcenter"})
+
+    colonnes = list(df.columns)
+    worksheet.write_row(0, 0, colonnes, format_entete)
+
+    col_sous_total = colonnes.index("Sous total") if "Sous total" in colonnes else None
+    largeurs = [0] * len(colonnes)
+
+    # En mode mémoire constante, les lignes doivent être écrites dans l'ordre
+    for num, ligne in enumerate(df.itertuples(index=False, name=None), start=1):
+        valeurs = [valeur_cellule(valeur) for valeur in ligne]
+
+        # Largeur maximale de chaque colonne, calculée pendant l'écriture
+        for col, valeur in enumerate(valeurs):
+            if valeur is not None:
+                largeurs[col] = max(largeurs[col], len(str(valeur)))
+
+        titre = col_sous_total is not None and valeurs[col_sous_total] == "T"
+        if titre:
+            # Mettre la ligne en gras
+            worksheet.set_row(num, None, format_titre)
+
+        if valeurs:
+            worksheet.write(num, 0, valeurs[0], format_code_titre if titre else format_code)
+            worksheet.write_row(num, 1, valeurs[1:])
+
+    # Ajustement des largeurs de colonnes (un peu d'espace en plus), colonne Code centrée
+    for col, largeur in enumerate(largeurs):
+        worksheet.set_column(col, col, largeur + 2, format_code if col == 0 else None)
+
+    workbook.close()
+
+
+def ecrire_csv(df, output, nom_onglet=None):
+    """Écrit le tableau Magenta au format CSV (UTF-8, avec en-tête ; nom_onglet ignoré)."""
+    df.to_csv(output, index=False, encoding="utf-8", chunksize=10000)
+
+
+def ecrire_parquet(df, output, nom_onglet=None):
+    """Écrit le tableau Magenta au format Parquet, toutes colonnes en texte (nom_onglet ignoré)."""
+    # Les colonnes mélangent nombres et chaînes vides : un type texte unique par colonne
+    df.astype("string").to_parquet(output, index=False, engine="pyarrow")
+
+
+def ecrire_texte_magenta(df, output, nom_onglet=None):
+    """
+    Écrit le fichier d'import à plat Magenta : une ligne par article, colonnes séparées
+    par des tabulations dans l'ordre du tableau, sans en-tête, fins de ligne Windows et
+    encodage Windows-1252 (nom_onglet ignoré).
+    """
+    df.to_csv(output, sep="\t", header=False, index=False, lineterminator="\r\n",
+              encoding="cp1252", errors="replace", chunksize=10000)
+
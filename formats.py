@@ -0,0 +1,89 @@
+"""Registre des formats : classeurs source pris en charge et fichiers Magenta produits
+
+Chaque format source est enregistré avec son module de traitement, importé seulement à
+la première conversion de ce format, et ses prédicats de détection (nom du fichier,
+contenu du classeur). Les fonctions d'écriture des formats de sortie sont de même
+importées à la première utilisation : ce module ne dépend que de la bibliothèque
+standard, un processus ne charge que les modules des formats qu'il traite.
+"""
+
+import importlib
+from collections import namedtuple
+
+# Format source :
+#   module            module de traitement, qui définit convertir(source)
+#   nom_onglet        nom de l'onglet du fichier Magenta produit
+#   nom_fichier       nom du fichier proposé au téléchargement (sans extension)
+#   detecter_nom      detecter_nom(nom_fichier) -> bool
+#   detecter_contenu  detecter_contenu(apercu) -> confiance entre 0 et 1 (0 : autre format),
+#                     apercu étant un detection.ApercuClasseur (onglets, marqueurs)
+FormatSource = namedtuple("FormatSource", ["module", "nom_onglet", "nom_fichier",
+                                           "detecter_nom", "detecter_contenu"])
+
+# Formats source, dans l'ordre de priorité de la détection
+FORMATS = {}
+
+MARQUEURS_EASYSEL = ("PREZZI E CONDIZIONI", "Q.té")
+
+# Formats de sortie : fonction d'écriture (module ecriture), extension, type MIME et libellé
+FORMATS_SORTIE = {
+    "xlsx": ("ecrire_magenta", ".xlsx",
+             "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+             "Excel (xlsx)"),
+    "csv": ("ecrire_csv", ".csv", "text/csv", "CSV"),
+    "parquet": ("ecrire_parquet", ".parquet", "application/vnd.apache.parquet", "Parquet"),
+    "magenta": ("ecrire_texte_magenta", ".txt", "text/plain", "Import Magenta (texte)"),
+}
+
+
+def enregistrer_format(nom, module, nom_onglet, nom_fichier, detecter_nom, detecter_contenu):
+    """Ajoute un format source au registre (le module n'est pas importé)."""
+    FORMATS[nom] = FormatSource(module, nom_onglet, nom_fichier, detecter_nom,
+                                detecter_contenu)
+
+
+def convertisseur(nom):
+    """Renvoie la fonction de conversion d'un format, en important son module si besoin."""
+    return importlib.import_module(FORMATS[nom].module).convertir
+
+
+def ecrivain(format_sortie):
+    """Renvoie la fonction d'écriture d'un format de sortie."""
+    return getattr(importlib.import_module("ecriture"), FORMATS_SORTIE[format_sortie][0])
+
+
+def detecter_format(nom_fichier):
+    """Identifie le type de fichier en fonction de son nom ("panneau", "easysel", "rapidaero")."""
+    for nom, format_source in FORMATS.items():
+        if format_source.detecter_nom(nom_fichier):
+            return nom
+    return None
+
+
+def contenu_panneau(apercu):
+    """PANNEAU : onglets de calcul PULSAR et/ou DS18."""
+    panneaux = {"PULSAR", "DS18"} & set(apercu.onglets)
+    if not panneaux:
+        return 0.0
+    return 0.99 if len(panneaux) == 2 else 0.9
+
+
+def contenu_rapid_aero(apercu):
+    """Rapid'Aero : une feuille par température ("…°C")."""
+    return 0.9 if any(onglet.endswith("°C") for onglet in apercu.onglets) else 0.0
+
+
+def contenu_easysel(apercu):
+    """Easysel : section "PREZZI E CONDIZIONI" et colonne "Q.té"."""
+    marqueurs = apercu.chercher(MARQUEURS_EASYSEL)
+    if "PREZZI E CONDIZIONI" not in marqueurs:
+        return 0.0
+    return 0.95 if len(marqueurs) == len(MARQUEURS_EASYSEL) else 0.8
+
+
+enregistrer_format("panneau", "panneau", "Données Exportées", "export_donnees",
+                   lambda nom_fichier: "PANNEAU" in nom_fichier.upper(), contenu_panneau)
+enregistrer_format("rapidaero", "rapidaero", "Sheet1", "fichier_traite",
+                   lambda nom_fichier: "Rapid'Aero" in nom_fichier, contenu_rapid_aero)
+enregistrer_format("easysel", "easysel", "Sheet1", "fichier_traite",
+                   lambda nom_fichier: "Offerta" in nom_fichier, contenu_easysel)
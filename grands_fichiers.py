@@ -0,0 +1,105 @@
+"""Grands classeurs : contenu projeté en mémoire (mmap) et fichiers copiés par blocs
+
+Au-delà de SABIANA_GRAND_FICHIER octets (par défaut 16 Mo, 0 = jamais), un classeur
+n'est plus lu en mémoire : son fichier est projeté (mmap) et le système ne charge que les
+pages lues par zipfile. Les classeurs reçus et les fichiers produits passent par des
+fichiers (temporaires pour l'API, supprimés à la fin de la requête), copiés ou envoyés
+par blocs de TAILLE_BLOC octets.
+
+    with ouvrir_contenu(chemin) as contenu:
+        type_fichier, _ = identifier_format(flux(contenu))
+"""
+
+import contextlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+
+SEUIL_DEFAUT = 16 * 1024 * 1024
+TAILLE_BLOC = 1024 * 1024
+
+
+def seuil_grand_fichier():
+    """Renvoie la taille en octets au-delà de laquelle un fichier est traité sur disque
+    (0 : jamais)."""
+    return int(os.environ.get("SABIANA_GRAND_FICHIER", SEUIL_DEFAUT))
+
+
+def est_grand(taille):
+    """Vérifie qu'une taille en octets dépasse le seuil des grands fichiers."""
+    seuil = seuil_grand_fichier()
+    return 0 < seuil < taille
+
+
+class Projection(mmap.mmap):
+    """Fichier projeté en mémoire en lecture seule, utilisable comme un fichier ouvert
+    (zipfile, openpyxl) et comme des octets (hashlib). chemin : fichier projeté."""
+
+    chemin = None
+
+    def seekable(self):
+        return True
+
+
+@contextlib.contextmanager
+def ouvrir_contenu(chemin):
+    """Ouvre le contenu d'un classeur : octets lus en mémoire, ou Projection d'un grand
+    fichier, fermée à la sortie."""
+    with open(chemin, "rb") as f:
+        if not est_grand(os.fstat(f.fileno()).st_size):
+            yield f.read()
+            return
+        projection = Projection(f.fileno(), 0, access=mmap.ACCESS_READ)
+        projection.chemin = os.fspath(chemin)
+
+    try:
+        yield projection
+    finally:
+        projection.close()
+
+
+def flux(contenu):
+    """Renvoie un fichier ouvert sur le contenu d'un classeur (octets ou Projection), sans
+    copie du contenu."""
+    if isinstance(contenu, Projection):
+        contenu.seek(0)
+        return contenu
+    return io.BytesIO(contenu)
+
+
+def ecrire_par_blocs(source, chemin):
+    """Écrit des octets, ou un fichier ouvert copié par blocs depuis son début, dans chemin.
+    Écriture atomique : un autre processus ne lit jamais un fichier incomplet."""
+    descripteur, temporaire = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix=".tmp")
+    try:
+        with os.fdopen(descripteur, "wb") as f:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                f.write(source)
+            else:
+                source.seek(0)
+                shutil.copyfileobj(source, f, TAILLE_BLOC)
+    except BaseException:
+        os.remove(temporaire)
+        raise
+    os.replace(temporaire, chemin)
+
+
+def lire_par_blocs(chemin):
+    """Parcourt le contenu d'un fichier par blocs de TAILLE_BLOC octets."""
+    with open(chemin, "rb") as f:
+        while bloc := f.read(TAILLE_BLOC):
+            yield bloc
+
+
+def fichier_temporaire():
+    """Crée un fichier temporaire (à supprimer avec supprimer_temporaire) et renvoie le
+    fichier ouvert en écriture."""
+    return tempfile.NamedTemporaryFile(prefix="sabiana-", suffix=".tmp", delete=False)
+
+
+def supprimer_temporaire(chemin):
+    """Supprime un fichier temporaire s'il existe encore."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(chemin)
@@ -0,0 +1,300 @@
+"""Lecteur xlsx natif : zipfile et analyse XML incrémentale (iterparse), sans openpyxl
+
+Seules les cellules des lignes et colonnes demandées sont converties ; les chaînes
+partagées ne sont lues que jusqu'à la plus grande chaîne utilisée, et la lecture d'un
+onglet s'arrête dès la dernière ligne demandée.
+
+Les valeurs sont identiques à celles d'openpyxl en lecture seule (data_only=True) :
+nombres entiers ou décimaux, chaînes, booléens, codes d'erreur ("#N/A"…) et dates pour
+les cellules au format date. Classeur et Feuille reprennent les méthodes utilisées par
+les modules de traitement (sheetnames, worksheets, classeur[nom], title, iter_rows).
+
+    with Classeur(source) as classeur:
+        for ligne, colonne, valeur in classeur["DS18"].cellules(max_row=79, max_col=89):
+            ...
+"""
+
+import warnings
+import zipfile
+import xml.etree.ElementTree as ET
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, BUILTIN_FORMATS_MAX_SIZE, \
+    is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, \
+    from_excel, from_ISO8601
+
+from detection import NS, chemins_onglets
+
+# Balises des parties de l'archive
+LIGNE = NS + "row"
+CELLULE = NS + "c"
+VALEUR = NS + "v"
+CHAINE = NS + "si"
+TEXTE = NS + "t"
+SEGMENT = NS + "r"
+CHAINE_EN_LIGNE = NS + "is"
+
+CHIFFRES = "0123456789"
+
+
+def numero_colonne(lettres, _cache={}):
+    """Convertit les lettres d'une colonne en numéro (A -> 1, AA -> 27)."""
+    numero = _cache.get(lettres)
+    if numero is None:
+        numero = 0
+        for lettre in lettres:
+            numero = numero * 26 + ord(lettre) - 64
+        _cache[lettres] = numero
+    return numero
+
+
+def texte_chaine(element):
+    """Texte d'une chaîne (<si> ou <is>) sans mise en forme : segment simple puis segments
+    enrichis, comme openpyxl (les indications phonétiques sont ignorées)."""
+    morceaux = []
+    simple = element.find(TEXTE)
+    if simple is not None and simple.text is not None:
+        morceaux.append(simple.text)
+    for segment in element.iterfind(SEGMENT):
+        texte = segment.findtext(TEXTE)
+        if texte is not None:
+            morceaux.append(texte)
+    return "".join(morceaux)
+
+
+def convertir_nombre(texte):
+    """Convertit un nombre écrit dans une cellule en entier ou en décimal."""
+    if "." in texte or "E" in texte or "e" in texte:
+        return float(texte)
+    return int(texte)
+
+
+class ChainesPartagees:
+    """Table des chaînes partagées, lue au fur et à mesure des indices demandés."""
+
+    def __init__(self, archive, chemin="xl/sharedStrings.xml"):
+        self.chaines = []
+        self._flux = None
+        self._elements = None
+        if chemin in archive.namelist():
+            self._flux = archive.open(chemin)
+            self._elements = ET.iterparse(self._flux)
+
+    def _lire_jusqua(self, indice):
+        """Lit les chaînes jusqu'à l'indice demandé (toutes si indice vaut None)."""
+        while self._elements is not None and (indice is None or len(self.chaines) <= indice):
+            try:
+                _, element = next(self._elements)
+            except StopIteration:
+                self.fermer()
+                break
+            if element.tag == CHAINE:
+                self.chaines.append(texte_chaine(element).replace("x005F_", ""))
+                element.clear()
+
+    def __getitem__(self, indice):
+        if indice >= len(self.chaines):
+            self._lire_jusqua(indice)
+        return self.chaines[indice]
+
+    def __len__(self):
+        self._lire_jusqua(None)
+        return len(self.chaines)
+
+    def fermer(self):
+        """Ferme la lecture de la table (les chaînes déjà lues restent disponibles)."""
+        if self._flux is not None:
+            self._flux.close()
+        self._flux = self._elements = None
+
+
+def lire_formats_dates(archive):
+    """Renvoie les indices des styles de cellule au format date et au format durée
+    (cellXfs de xl/styles.xml), comme openpyxl."""
+    if "xl/styles.xml" not in archive.namelist():
+        return frozenset(), frozenset()
+
+    racine = ET.fromstring(archive.read("xl/styles.xml"))
+    personnalises = {int(element.get("numFmtId")): element.get("formatCode")
+                     for element in racine.iterfind(f"{NS}numFmts/{NS}numFmt")}
+
+    dates, durees = set(), set()
+    for indice, style in enumerate(racine.iterfind(f"{NS}cellXfs/{NS}xf")):
+        numero = int(style.get("numFmtId", 0))
+        code = personnalises[numero] if numero in personnalises \
+            else BUILTIN_FORMATS.get(numero) if numero < BUILTIN_FORMATS_MAX_SIZE else None
+        if code is None:
+            continue
+        if is_date_format(code):
+            dates.add(indice)
+        if is_timedelta_format(code):
+            durees.add(indice)
+    return frozenset(dates), frozenset(durees)
+
+
+def lire_epoch(archive):
+    """Renvoie l'origine des dates du classeur (calendrier 1900 ou 1904)."""
+    with archive.open("xl/workbook.xml") as f:
+        for _, element in ET.iterparse(f):
+            if element.tag == NS + "workbookPr":
+                if element.get("date1904", "").lower() in ("1", "true"):
+                    return CALENDAR_MAC_1904
+                break
+    return CALENDAR_WINDOWS_1900
+
+
+class Feuille:
+    """Onglet d'un classeur, lu en flux à chaque parcours."""
+
+    def __init__(self, classeur, title, chemin):
+        self.parent = classeur
+        self.title = title
+        self.chemin = chemin
+
+    def reset_dimensions(self):
+        """Sans effet : les dimensions déclarées dans le fichier ne sont jamais utilisées."""
+
+    def _lignes(self, min_row=1, max_row=None, min_col=1, max_col=None):
+        """Parcourt les lignes présentes dans le fichier : (numéro, [(colonne, valeur)] des
+        colonnes demandées, numéro de la dernière cellule de la ligne). La lecture s'arrête
+        à la première ligne après max_row ; seules les cellules retenues sont converties."""
+        classeur = self.parent
+        chaines = classeur.shared_strings
+        dates, durees, epoch = classeur.formats_dates, classeur.formats_durees, classeur.epoch
+        num_ligne = 0
+
+        with classeur.archive.open(self.chemin) as flux:
+            for _, element in ET.iterparse(flux):
+                if element.tag != LIGNE:
+                    continue
+
+                numero = element.get("r")
+                num_ligne = int(float(numero)) if numero else num_ligne + 1
+                if max_row is not None and num_ligne > max_row:
+                    break
+                if num_ligne < min_row:
+                    element.clear()
+                    continue
+
+                cellules = []
+                num_colonne = 0
+                for cellule in element:
+                    reference = cellule.get("r")
+                    num_colonne = numero_colonne(reference.rstrip(CHIFFRES)) if reference \
+                        else num_colonne + 1
+                    if num_colonne < min_col or (max_col is not None and num_colonne > max_col):
+                        continue
+
+                    type_cellule = cellule.get("t", "n")
+                    if type_cellule == "inlineStr":
+                        chaine = cellule.find(CHAINE_EN_LIGNE)
+                        cellules.append((num_colonne,
+                                         texte_chaine(chaine) if chaine is not None else None))
+                        continue
+
+                    valeur = cellule.findtext(VALEUR) or None
+                    if valeur is not None:
+                        if type_cellule == "n":
+                            valeur = convertir_nombre(valeur)
+                            style = int(cellule.get("s", 0))
+                            if style in dates:
+                                try:
+                                    valeur = from_excel(valeur, epoch,
+                                                        timedelta=style in durees)
+                                except (OverflowError, ValueError):
+                                    warnings.warn(f"Cellule {reference} au format date hors "
+                                                  "des limites : traitée comme une erreur")
+                                    valeur = "#VALUE!"
+                        elif type_cellule == "s":
+                            valeur = chaines[int(valeur)]
+                        elif type_cellule == "b":
+                            valeur = bool(int(valeur))
+                        elif type_cellule == "d":
+                            valeur = from_ISO8601(valeur)
+                    cellules.append((num_colonne, valeur))
+
+                element.clear()
+                yield num_ligne, cellules, num_colonne
+
+    def cellules(self, min_row=1, max_row=None, min_col=1, max_col=None):
+        """Parcourt les cellules présentes de la plage demandée : (ligne, colonne, valeur),
+        numérotées à partir de 1. Le parcours peut être interrompu à tout moment."""
+        for num_ligne, cellules, _ in self._lignes(min_row, max_row, min_col, max_col):
+            for num_colonne, valeur in cellules:
+                yield num_ligne, num_colonne, valeur
+
+    def iter_rows(self, min_row=None, max_row=None, min_col=None, max_col=None,
+                  values_only=True):
+        """Parcourt les valeurs ligne par ligne, comme openpyxl en lecture seule après
+        reset_dimensions() : lignes absentes vides, cellules absentes à None."""
+        if not values_only:
+            raise ValueError("seules les valeurs des cellules sont lues (values_only=True)")
+        min_row, min_col = min_row or 1, min_col or 1
+        # Ligne absente : liste vide sans max_col, comme openpyxl
+        ligne_vide = (None,) * (max_col + 1 - min_col) if max_col is not None else []
+
+        suivante = min_row
+        num_ligne = 1
+        lignes = self._lignes(min_row, None, min_col, max_col)
+        try:
+            for num_ligne, cellules, derniere in lignes:
+                if max_row is not None and num_ligne > max_row:
+                    break
+                # Lignes absentes du fichier
+                for _ in range(suivante, num_ligne):
+                    yield ligne_vide
+                if suivante > num_ligne:
+                    continue
+                suivante = num_ligne + 1
+
+                if derniere == 0 and max_col is None:
+                    yield ()
+                    continue
+                valeurs = [None] * ((max_col or derniere) + 1 - min_col)
+                for num_colonne, valeur in cellules:
+                    valeurs[num_colonne - min_col] = valeur
+                yield tuple(valeurs)
+        finally:
+            # Arrêt de la lecture de l'onglet (fichier refermé)
+            lignes.close()
+
+        # Comme openpyxl : lignes vides jusqu'à max_row si la lecture s'est arrêtée après
+        if max_row is not None and max_row < num_ligne:
+            for _ in range(suivante, max_row + 1):
+                yield ligne_vide
+
+
+class Classeur:
+    """Classeur xlsx ouvert en lecture : onglets, chaînes partagées et formats de date."""
+
+    def __init__(self, source):
+        self.archive = zipfile.ZipFile(source)
+        try:
+            self.epoch = lire_epoch(self.archive)
+            self.formats_dates, self.formats_durees = lire_formats_dates(self.archive)
+            self.shared_strings = ChainesPartagees(self.archive)
+            self.worksheets = [Feuille(self, nom, chemin)
+                               for nom, chemin in chemins_onglets(self.archive).items()]
+        except BaseException:
+            self.archive.close()
+            raise
+
+    @property
+    def sheetnames(self):
+        return [feuille.title for feuille in self.worksheets]
+
+    def __getitem__(self, nom):
+        for feuille in self.worksheets:
+            if feuille.title == nom:
+                return feuille
+        raise KeyError(f"Onglet {nom} introuvable")
+
+    def close(self):
+        self.shared_strings.fermer()
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
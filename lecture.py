@@ -0,0 +1,141 @@
+"""Module de lecture rapide des classeurs Excel
+
+Les classeurs sont lus par le lecteur natif (lecteur_xlsx.py : zipfile et analyse XML
+incrémentale) ou, avec SABIANA_LECTEUR=openpyxl, par openpyxl en lecture seule. Les deux
+lecteurs donnent les mêmes valeurs.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from lecteur_xlsx import Classeur
+from suivi import controler_memoire, etape
+
+# Chaînes considérées comme vides par pd.read_excel (valeurs NA par défaut de pandas)
+VALEURS_VIDES = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})
+
+# Codes d'erreur Excel, lus comme des valeurs vides (openpyxl.cell.cell.ERROR_CODES)
+CODES_ERREUR = frozenset({"#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A"})
+
+# Intervalle (en lignes) entre deux relevés de la mémoire pendant la lecture d'une feuille
+LIGNES_CONTROLE_MEMOIRE = 1000
+
+
+def ouvrir_classeur(source):
+    """Ouvre un classeur en lecture seule, avec les mêmes options que pd.read_excel
+    (lecteur natif par défaut, openpyxl si SABIANA_LECTEUR=openpyxl)."""
+    with etape("ouverture"):
+        if os.environ.get("SABIANA_LECTEUR", "natif") == "openpyxl":
+            from openpyxl import load_workbook  # Chargé seulement si ce lecteur est choisi
+            return load_workbook(source, read_only=True, data_only=True, keep_links=False)
+        return Classeur(source)
+
+
+def convertir_valeur(valeur):
+    """Convertit une valeur de cellule comme le fait pd.read_excel (header=None)."""
+    if valeur is None:
+        return np.nan
+    if isinstance(valeur, str):
+        if valeur in VALEURS_VIDES or valeur in CODES_ERREUR:
+            return np.nan
+        return valeur
+    if isinstance(valeur, bool):
+        return valeur
+    if isinstance(valeur, (int, float)):
+        entier = int(valeur)
+        if entier == valeur:
+            return entier
+        return float(valeur)
+    return valeur
+
+
+def unifier(memo, valeur):
+    """Renvoie une valeur (convertie) telle que pd.read_excel la donne dans une colonne de
+    texte : True et 1, False et 0 y sont confondus et prennent la forme de leur première
+    occurrence dans la colonne (memo, propre à la colonne ; cf. sanitize_objects de pandas)."""
+    if isinstance(valeur, int) and valeur in (0, 1):
+        return memo.setdefault(valeur, valeur)
+    return valeur
+
+
+def memoriser(memo, valeur):
+    """Note une valeur brute d'une cellule hors données lues : première occurrence de
+    0/1/False/True dans sa colonne (cf. unifier)."""
+    if isinstance(valeur, (int, float)) and valeur in (0, 1):
+        unifier(memo, convertir_valeur(valeur))
+
+
+def iterer_lignes(feuille, min_col=None):
+    """Parcourt les valeurs brutes d'une feuille, ligne par ligne, comme pd.read_excel
+    (à partir de la colonne min_col, numérotée à partir de 1).
+
+    La mémoire utilisée est contrôlée toutes les LIGNES_CONTROLE_MEMOIRE lignes : une
+    feuille trop grande interrompt la conversion avant la fin de sa lecture."""
+    # Les dimensions déclarées dans le fichier sont parfois fausses (cf. pandas)
+    feuille.reset_dimensions()
+    for num, ligne in enumerate(feuille.iter_rows(min_col=min_col, values_only=True)):
+        if num % LIGNES_CONTROLE_MEMOIRE == 0:
+            controler_memoire()
+        yield ligne
+
+
+def convertir_texte(valeur):
+    """Convertit une valeur de cellule comme pd.read_excel(..., dtype=str)."""
+    valeur = convertir_valeur(valeur)
+    if isinstance(valeur, float) and np.isnan(valeur):
+        return valeur
+    return str(valeur)
+
+
+def est_texte(valeur):
+    """Vérifie qu'une valeur brute de cellule empêche pd.read_excel de lire sa colonne en
+    nombres (texte, date…), les valeurs vides exceptées."""
+    return not isinstance(convertir_valeur(valeur), (int, float))
+
+
+def lire_plage(feuille, lignes, colonnes):
+    """Lit une plage de cellules d'un onglet lu avec un en-tête (header=0) : équivalent de
+    pd.read_excel(...).iloc[lignes, colonnes], sans convertir les cellules hors plage.
+
+    Comme pd.read_excel, une colonne contenant du texte (titres au-dessus de la plage…)
+    garde ses valeurs telles que lues (type object, entiers conservés) ; une colonne
+    uniquement numérique est convertie en nombres (flottants si elle a des vides). Le type
+    est déterminé d'après les lignes 2 à la dernière ligne lue. Le DataFrame renvoyé est
+    indexé par position de ligne et de colonne."""
+    fin = max(lignes)
+    col_min, col_max = min(colonnes), max(colonnes)
+    lignes = list(lignes)
+    a_lire = set(lignes)
+
+    # La ligne d'en-tête (ligne 1) décale les positions d'une ligne : position 0 = ligne 2.
+    # Les lignes hors plage sont parcourues pour le type des colonnes et unifier 0/1/bool.
+    memos = {col: {} for col in colonnes}
+    textes = set()
+    donnees = {}
+    for num, ligne in enumerate(feuille.iter_rows(min_row=2, max_row=fin + 2,
+                                                  min_col=col_min + 1, max_col=col_max + 1,
+                                                  values_only=True)):
+        if num in a_lire:
+            valeurs = [unifier(memos[col], convertir_valeur(ligne[col - col_min]))
+                       for col in colonnes]
+            donnees[num] = valeurs
+            textes.update(col for col, valeur in zip(colonnes, valeurs)
+                          if not isinstance(valeur, (int, float)))
+        else:
+            for col in colonnes:
+                valeur = ligne[col - col_min]
+                if valeur is not None:
+                    memoriser(memos[col], valeur)
+                    if col not in textes and est_texte(valeur):
+                        textes.add(col)
+
+    plage = pd.DataFrame.from_dict(donnees, orient="index", columns=colonnes, dtype=object)
+    plage = plage.reindex(lignes)
+    numeriques = [col for col in colonnes if col not in textes]
+    plage[numeriques] = plage[numeriques].infer_objects()
+    return plage
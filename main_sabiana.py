@@ -1,129 +1,247 @@
 """Module principal qui détecte la nature du fichier et appelle les fonctions en conséquence"""
 
-import io
+import json
+import os
+import tempfile
+import time
 import traceback
-import streamlit as st
-import pandas as pd
+import zipfile
 
-from panneau import traiter_pulsar, traiter_ds18, modifier_tableau_panneau
-from easysel import copier_donnees_easysel, modifier_tableau_easysel
-from rapidaero import copier_tableaux_rapid_aero, mise_en_forme_rapid_aero
+import streamlit as st
 
+from batch import AUCUNE_DONNEE, chemin_sortie
+from conversion import nom_fichier_sortie
+from detection import identifier_format
+from formats import FORMATS_SORTIE
+from travaux import SUFFIXE_SORTIE, TERMINES, chemin_fichier, etat_travail, lancer_processus, \
+    lire_sortie, soumettre
 
-def identifier_fichier(nom_fichier):
+# Rapports de suivi des conversions affichées pendant cette exécution du script
+rapports = []
 
-    """Identifie le type de fichier en fonction de son nom et exécute les fonctions appropriées."""
-    if "PANNEAU" in nom_fichier.upper():
-        st.write("Fichier détecté : PANNEAU")
+# Archive des fichiers convertis gardée en mémoire jusqu'à cette taille, puis sur disque
+TAILLE_ARCHIVE_MEMOIRE = 64 * 1024 * 1024
+# Délai entre deux consultations des travaux en cours (secondes)
+INTERVALLE_SUIVI = 0.5
 
 
-        # Module issu de panneau.py pour le traitement de données
-        if uploaded_file:
-            # Lecture du fichier source
-            xl = pd.ExcelFile(uploaded_file)
+@st.cache_resource
+def processus_conversion():
+    """Lance une fois les processus de la file d'attente, partagés par toutes les
+    sessions (SABIANA_PROCESSUS=0 s'ils sont lancés à part avec travaux.py)."""
+    return lancer_processus()
 
-            # Chargement des onglets PULSAR et DS18 s'ils existent
-            df_pulsar = xl.parse("PULSAR") if "PULSAR" in xl.sheet_names else None
-            df_ds18 = xl.parse("DS18") if "DS18" in xl.sheet_names else None
 
-            # Création du DataFrame de sortie
-            df_export = pd.DataFrame(columns=["Code Produit", "Libellé", "Quantité"])
+def travail_fichier(fichier):
+    """Renvoie l'identifiant du travail d'un fichier déposé. Le fichier n'est soumis qu'une
+    fois par session, format et mode de profilage : les réexécutions du script (clic sur un
+    bouton, changement d'option) retrouvent le travail au lieu de relancer la conversion."""
+    travaux = st.session_state.setdefault("travaux", {})
+    cle = (fichier.file_id, format_sortie, profilage)
 
-            # Traitement des données de PULSAR
-            if df_pulsar is not None:
-                df_export = traiter_pulsar(df_pulsar, df_export)
+    # Un travail supprimé à la fin de la rétention est soumis à nouveau
+    if cle not in travaux or etat_travail(travaux[cle]) is None:
+        # Copié par blocs dans la file : pas de deuxième copie du classeur en mémoire
+        travaux[cle] = soumettre(fichier, fichier.name, format_sortie, profilage)
+    return travaux[cle]
 
-            # Traitement des données de DS18
-            if df_ds18 is not None:
-                df_export = traiter_ds18(df_ds18, df_export)
 
-            # Mise en forme du dataframe
-            df_export = modifier_tableau_panneau(df_export)
+def attendre():
+    """Réexécute la page après un court délai pour suivre les travaux en cours."""
+    time.sleep(INTERVALLE_SUIVI)
+    st.rerun()
 
-            # Génération du fichier Excel de sortie
-            output = io.BytesIO()
 
-            with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-                df_export.to_excel(writer, sheet_name="Données Exportées", index=False)
-
-                # Mise en forme des lignes de titre en Gras + centrer colonne A
-                # Récupérer le workbook et le worksheet
-                workbook = writer.book
-                worksheet = writer.sheets["Données Exportées"]
+def afficher_progression(travail):
+    """Affiche la barre de progression d'un travail."""
+    nom = travail["nom_fichier"]
+    if travail["statut"] == "OK":
+        texte = f"✅ {nom} : converti ({travail['type_fichier']})"
+    elif travail["statut"] in TERMINES:
+        texte = f"❌ {nom} : {travail['message']}"
+    else:
+        texte = f"{nom} : {travail['statut'].lower()}"
+    st.progress(travail["progression"], text=texte)
+
+
+def construire_archive(travaux):
+    """Construit l'archive zip des fichiers Magenta de travaux terminés : renvoie son
+    contenu, le nombre de fichiers convertis et les erreurs (aussi écrites dans
+    erreurs.txt)."""
+    # Fichier temporaire : les fichiers produits y sont copiés un par un depuis le disque
+    archive = tempfile.SpooledTemporaryFile(max_size=TAILLE_ARCHIVE_MEMOIRE)
+    noms = set()
+    erreurs = []
+
+    with zipfile.ZipFile(archive, "w") as zf:
+        for travail in travaux:
+            nom = travail["nom_fichier"]
+            if travail["statut"] != "OK":
+                messages = travail["rapport"]["messages"] if travail["rapport"] else []
+                erreurs.append(f"{nom} : {travail['statut']} ({travail['message']})"
+                               + "".join(f"\n    {message}" for message in messages))
+                continue
+
+            # Noms uniques dans l'archive (fichiers homonymes déposés)
+            nom_sortie = chemin_sortie(nom, format_sortie)
+            racine, extension = os.path.splitext(nom_sortie)
+            numero = 1
+            while nom_sortie in noms:
+                numero += 1
+                nom_sortie = f"{racine} ({numero}){extension}"
+            noms.add(nom_sortie)
+
+            # xlsx et parquet sont déjà compressés
+            compression = zipfile.ZIP_STORED if format_sortie in ("xlsx", "parquet") \
+                else zipfile.ZIP_DEFLATED
+            zf.write(chemin_fichier(travail["id"], SUFFIXE_SORTIE), nom_sortie,
+                     compress_type=compression)
+
+        if erreurs:
+            zf.writestr("erreurs.txt", "\n".join(erreurs) + "\n")
+
+    with archive:
+        archive.seek(0)
+        return archive.read(), len(noms), erreurs
+
+
+def convertir_lot(fichiers):
+    """Convertit plusieurs fichiers dans la file d'attente, avec une barre de progression
+    par fichier, et propose une archive zip des fichiers Magenta. L'échec d'un fichier
+    n'interrompt pas les autres conversions."""
+    st.write(f"{len(fichiers)} fichiers déposés")
+
+    travaux = [etat_travail(travail_fichier(fichier)) for fichier in fichiers]
+    for travail in travaux:
+        afficher_progression(travail)
+    if any(travail["statut"] not in TERMINES for travail in travaux):
+        attendre()
+
+    # L'archive n'est construite qu'une fois par ensemble de travaux : les réexécutions
+    # du script (clic sur le bouton de téléchargement…) reprennent la dernière construite
+    cle = tuple(travail["id"] for travail in travaux)
+    if st.session_state.get("archive", (None,))[0] != cle:
+        st.session_state["archive"] = (cle, *construire_archive(travaux))
+    _, contenu, convertis, erreurs = st.session_state["archive"]
+
+    if erreurs:
+        st.warning(f"{len(erreurs)} fichier(s) non converti(s) : voir erreurs.txt dans l'archive.")
+    if not convertis:
+        st.error("Aucun fichier n'a pu être converti.")
+        return
+
+    st.success(f"{convertis} fichier(s) converti(s). Téléchargez l'archive ci-dessous :")
+    st.download_button(
+        label="📥 Télécharger l'archive",
+        data=contenu,
+        file_name="fichiers_magenta.zip",
+        mime="application/zip"
+    )
+
+
+def convertir_suivi(type_fichier):
+    """Renvoie le fichier Magenta du fichier déposé, converti dans la file d'attente (None
+    si aucune donnée n'est extraite). Tant que la conversion n'est pas terminée, la page
+    affiche sa progression et est réexécutée."""
+    travail = etat_travail(travail_fichier(uploaded_file))
+    if travail["statut"] not in TERMINES:
+        afficher_progression(travail)
+        attendre()
+
+    if travail["rapport"]:
+        rapports.append(travail["rapport"])
+        # Erreurs signalées par le module de traitement (sections ou colonnes introuvables…)
+        for message in travail["rapport"]["messages"]:
+            st.error(message)
+    if travail["statut"] != "OK":
+        if travail["message"] == AUCUNE_DONNEE:
+            return None
+        raise RuntimeError(travail["message"])
+    return lire_sortie(travail["id"])
+
+
+def afficher_rapport(rapport):
+    """Affiche le détail des étapes dans un panneau repliable, avec export JSON."""
+    import pandas as pd  # Chargé seulement si un rapport est affiché
+
+    with st.expander(f"Diagnostic de la conversion ({rapport['duree_s'] * 1000:.0f} ms)"):
+        etapes = pd.DataFrame(rapport["etapes"])
+        if not etapes.empty:
+            # Indentation des étapes imbriquées
+            etapes["nom"] = ["\u00a0\u00a0" * niveau + nom
+                             for niveau, nom in zip(etapes.pop("niveau"), etapes["nom"])]
+            st.dataframe(etapes, hide_index=True, use_container_width=True)
+
+        if rapport["memoire_pic_octets"] is not None:
+            st.write(f"Pic mémoire : {rapport['memoire_pic_octets'] / 1e6:.1f} Mo")
+        if rapport.get("memoire_utilisee_octets") is not None:
+            plafond = rapport.get("memoire_plafond_octets")
+            st.write(f"Mémoire utilisée : {rapport['memoire_utilisee_octets'] / 1e6:.1f} Mo"
+                     + (f" (maximum : {plafond / 1e6:.0f} Mo)" if plafond else ""))
+        if rapport["profil"]:
+            st.dataframe(pd.DataFrame(rapport["profil"]), hide_index=True,
+                         use_container_width=True)
+        if rapport["erreur"]:
+            st.text(rapport["erreur"])
+
+        st.download_button(
+            label="Télécharger le rapport (JSON)",
+            data=json.dumps(rapport, indent=2, ensure_ascii=False),
+            file_name="diagnostic_conversion.json",
+            mime="application/json"
+        )
 
-                # Définir un format en gras
-                bold_format = workbook.add_format({"bold": True})
 
-                # Trouver les lignes où "Sous total" contient "T"
-                # start=1 car Excel commence à la ligne 2
-                for row_num, value in enumerate(df_export["Sous total"], start=1):
-                    if value == "T":
-                        # Mettre la ligne en gras
-                        worksheet.set_row(row_num, cell_format=bold_format)
+def identifier_fichier(nom_fichier):
 
-                # Définir un format centré pour la colonne "Code"
-                # Alignement horizontal et vertical
-                center_format = workbook.add_format({"align": "center", "valign": "vcenter"})
+    """Identifie le type de fichier en fonction de son contenu (à défaut, de son nom)
+    et exécute les fonctions appropriées."""
+    type_fichier, _ = identifier_format(uploaded_file, nom_fichier)
 
-                # Appliquer l'alignement centré sur toute la colonne "Code"
-                #col_index_code = df_export.columns.get_loc("Code")
-                # Trouver l'index de la colonne "Code"
-                # Centrer le texte dans la colonne A (Code) et ajuster la largeur à 15
-                worksheet.set_column(0, 0, 15, center_format)
+    if type_fichier == "panneau":
+        st.write("Fichier détecté : PANNEAU")
 
-                # Ajustement automatique des largeurs de colonnes
-                for col_num, col_name in enumerate(df_export.columns):
-                    # Trouver la longueur maximale
-                    max_len = df_export[col_name].astype(str).map(len).max()
-                    worksheet.set_column(col_num, col_num, max_len + 2)  # Ajouter un peu d'espace
 
-                # Sauvegarder
-                writer._save()
+        # Module issu de panneau.py pour le traitement de données
+        if uploaded_file:
+            # Lecture, mise en forme et génération du fichier Excel de sortie
+            # (résultat réutilisé si ce fichier a déjà été converti)
+            output = convertir_suivi("panneau")
 
             st.success("Traitement terminé ! Téléchargez votre fichier ci-dessous.")
 
             # Bouton de téléchargement
             st.download_button(
-                label="Télécharger le fichier Excel",
-                data=output.getvalue(),
-                file_name="export_donnees.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                label="Télécharger le fichier",
+                data=output,
+                file_name=nom_fichier_sortie("panneau", format_sortie),
+                mime=FORMATS_SORTIE[format_sortie][2]
             )
 
-    elif "Offerta" in nom_fichier:
+    elif type_fichier == "easysel":
         st.write("Fichier détecté : Easysel")
 
         # Module issu de Sabiana.py pour le traitement de données
         if uploaded_file:
             try:
-                # Charger le fichier Excel
-                sheet = pd.read_excel(uploaded_file, sheet_name=0, header=None)
-
-                # Étape 1 : Copier les données
+                # Étapes 1 et 2 : Copier les données puis modifier le tableau
                 st.info("Traitement des données en cours...")
-                donnees = copier_donnees_easysel(sheet)
-
-                if donnees is not None:
-                    # Étape 2 : Modifier le tableau
-                    resultat = modifier_tableau_easysel(donnees)
+                output = convertir_suivi("easysel")
 
+                if output is not None:
                     # Télécharger le fichier traité
                     st.success("Traitement terminé ! Téléchargez le fichier ci-dessous :")
-                    # Création d'un tampon en mémoire
-                    buffer = io.BytesIO()
-                    resultat.to_excel(buffer, index=False, engine="openpyxl")
-                    buffer.seek(0)  # Remet le curseur au début du fichier
 
                     st.download_button(
-                        label="📥 Télécharger le fichier Excel",
-                        data=buffer,
-                        file_name="fichier_traite.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        label="📥 Télécharger le fichier",
+                        data=output,
+                        file_name=nom_fichier_sortie(type_fichier, format_sortie),
+                        mime=FORMATS_SORTIE[format_sortie][2]
                     )
             except Exception as e:
                 st.error(f"Une erreur est survenue : {e}")
 
-    elif "Rapid'Aero" in nom_fichier:
+    elif type_fichier == "rapidaero":
         st.write("Fichier détecté : Rapid'Aero")
 
         # Module issu de rapidaero.py pour le traitement de données
@@ -131,32 +249,18 @@ def identifier_fichier(nom_fichier):
             try:
                 st.info("Début du traitement du fichier...")
 
-                # Charger le fichier Excel pour récupérer les noms des feuilles
-                excel_file = pd.ExcelFile(uploaded_file)
+                # Étapes 1 et 2 : Copier les données puis mise en forme
+                output = convertir_suivi("rapidaero")
 
-                # Afficher les feuilles disponibles
-                # st.write("Feuilles disponibles :", excel_file.sheet_names)
-
-                # Étape 1 : Copier les données
-                donnees = copier_tableaux_rapid_aero(excel_file)
-
-                if donnees is None or donnees.empty:
+                if output is None:
                     st.error("Aucune donnée extraite. Vérifiez le contenu du fichier.")
                 else:
-                    #st.write("Colonnes après extraction :", donnees.columns) #Debug
-
-                    # Étape 2 : Mise en forme
-                    resultat = mise_en_forme_rapid_aero(donnees)
-
                     st.success("Traitement terminé ! Téléchargez le fichier ci-dessous :")
-                    buffer = io.BytesIO()
-                    resultat.to_excel(buffer, index=False, engine="openpyxl")
-                    buffer.seek(0)
                     st.download_button(
-                        label="📥 Télécharger le fichier Excel",
-                        data=buffer,
-                        file_name="fichier_traite.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        label="📥 Télécharger le fichier",
+                        data=output,
+                        file_name=nom_fichier_sortie(type_fichier, format_sortie),
+                        mime=FORMATS_SORTIE[format_sortie][2]
                     )
 
             except Exception as e:
@@ -167,12 +271,28 @@ def identifier_fichier(nom_fichier):
             "Rapid'Aero ou Panneau. Merci de sélectionner un fichier valide.")
 
 #Interface Streamlit
-st.image("sabiana-logo.png", use_container_width=True)
-st.title("Clic and Selec pour MAGENTA")
-st.subheader("Déposez votre fichier Excel ci-dessous \
-    (issu des outils de sélection : Easysel, Rapid'Aéro ou Panneau)")
+# (non exécutée quand les processus de conversion importent ce module)
+if __name__ == "__main__":
+    st.image("sabiana-logo.png", use_container_width=True)
+    st.title("Clic and Selec pour MAGENTA")
+    st.subheader("Déposez vos fichiers Excel ci-dessous \
+        (issus des outils de sélection : Easysel, Rapid'Aéro ou Panneau)")
+
+    uploaded_files = st.file_uploader("Choisissez un ou plusieurs fichiers Excel",
+                                      type=["xlsx", "xlsm"], accept_multiple_files=True)
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
+
+    format_sortie = st.selectbox("Format de sortie", list(FORMATS_SORTIE),
+                                 format_func=lambda choix: FORMATS_SORTIE[choix][3])
+
+    profilage = st.checkbox("Profiler la conversion (cProfile et mémoire, plus lent)")
+
+    processus_conversion()
 
-uploaded_file = st.file_uploader("Choisissez un fichier Excel", type=["xlsx", "xlsm"])
+    if uploaded_file is not None:
+        identifier_fichier(uploaded_file.name)
 
-if uploaded_file is not None:
-    identifier_fichier(uploaded_file.name)
+        for rapport in rapports:
+            afficher_rapport(rapport)
+    elif uploaded_files:
+        convertir_lot(uploaded_files)
@@ -0,0 +1,287 @@
+"""Métriques des conversions, conservées d'une exécution à l'autre (SQLite)
+
+Chaque conversion (interface, file d'attente, API ou traitement par lots, cf.
+batch.convertir_contenu) est comptée par format, statut et raison d'échec, avec sa durée
+et la taille du classeur reçu et du fichier produit (histogrammes). Les compteurs sont
+incrémentés en une transaction par conversion : plusieurs processus peuvent les mettre
+à jour en même temps.
+
+Les métriques sont exposées au format texte de Prometheus : route GET /metriques de
+l'API, ou
+
+    python metriques.py
+
+Variables d'environnement :
+    SABIANA_METRIQUES  chemin de la base, 0 pour désactiver les métriques
+                       (par défaut ~/.cache/sabiana-magenta/metriques.sqlite3)
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+from collections import defaultdict
+
+journal = logging.getLogger(__name__)
+
+# Bornes des histogrammes : durées en secondes, tailles en octets
+BORNES_DUREE = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+BORNES_TAILLE = (1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+
+# Tranches de taille du classeur reçu, pour suivre la durée selon la taille
+TRANCHES_TAILLE = ((1e5, "100k"), (1e6, "1M"), (1e7, "10M"))
+
+# Métriques : type, description et bornes (histogrammes)
+METRIQUES = {
+    "sabiana_conversions_total": (
+        "counter", "Conversions par format, statut et raison", None),
+    "sabiana_conversion_duree_secondes": (
+        "histogram", "Durée des conversions par format et taille du classeur", BORNES_DUREE),
+    "sabiana_classeur_octets": (
+        "histogram", "Taille des classeurs reçus par format", BORNES_TAILLE),
+    "sabiana_fichier_produit_octets": (
+        "histogram", "Taille des fichiers Magenta produits par format", BORNES_TAILLE),
+    "sabiana_api_erreurs_total": (
+        "counter", "Réponses en erreur de l'API par code HTTP (413, 503 : capacité)", None),
+    "sabiana_cache_lectures_total": (
+        "counter", "Lectures du cache des fichiers Magenta", None),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    nom TEXT NOT NULL,
+    etiquettes TEXT NOT NULL,
+    valeur REAL NOT NULL,
+    PRIMARY KEY (nom, etiquettes)
+) WITHOUT ROWID
+"""
+
+
+def chemin_metriques():
+    """Renvoie le chemin de la base des métriques (None si désactivées)."""
+    chemin = os.environ.get("SABIANA_METRIQUES",
+                            os.path.join(os.path.expanduser("~"), ".cache", "sabiana-magenta",
+                                         "metriques.sqlite3"))
+    return None if chemin in ("", "0") else chemin
+
+
+@contextlib.contextmanager
+def connexion(chemin):
+    """Ouvre la base des métriques (partagée entre processus)."""
+    os.makedirs(os.path.dirname(os.path.abspath(chemin)), exist_ok=True)
+    base = sqlite3.connect(chemin, timeout=30, isolation_level=None)
+    try:
+        base.execute("PRAGMA journal_mode=WAL")
+        base.execute(SCHEMA)
+        yield base
+    finally:
+        base.close()
+
+
+def borne(valeur, bornes):
+    """Renvoie la borne (le) du seau d'un histogramme où tombe une valeur."""
+    for limite in bornes:
+        if valeur <= limite:
+            return format(limite, "g")
+    return "+Inf"
+
+
+def tranche_taille(taille):
+    """Renvoie la tranche de taille d'un classeur ("100k", "1M", "10M" ou "plus")."""
+    for limite, nom in TRANCHES_TAILLE:
+        if taille <= limite:
+            return nom
+    return "plus"
+
+
+def observer(nom, etiquettes, valeur):
+    """Renvoie les incréments (nom, étiquettes, valeur) d'une observation d'histogramme."""
+    seau = dict(etiquettes, le=borne(valeur, METRIQUES[nom][2]))
+    return [(nom + "_bucket", seau, 1), (nom + "_sum", etiquettes, valeur),
+            (nom + "_count", etiquettes, 1)]
+
+
+def incrementer(increments):
+    """Ajoute des incréments (nom, étiquettes, valeur) aux séries, en une transaction.
+    Une erreur d'écriture est journalisée, jamais levée."""
+    chemin = chemin_metriques()
+    if chemin is None:
+        return
+
+    lignes = [(nom, json.dumps(etiquettes, sort_keys=True, ensure_ascii=False), valeur)
+              for nom, etiquettes, valeur in increments]
+    try:
+        with connexion(chemin) as base:
+            base.execute("BEGIN IMMEDIATE")
+            base.executemany("INSERT INTO series (nom, etiquettes, valeur) VALUES (?, ?, ?) "
+                             "ON CONFLICT (nom, etiquettes) "
+                             "DO UPDATE SET valeur = valeur + excluded.valeur", lignes)
+            base.execute("COMMIT")
+    except (sqlite3.Error, OSError) as e:
+        journal.warning("Métriques non enregistrées : %s", e)
+
+
+def enregistrer_conversion(type_fichier, statut, raison, duree, taille_classeur,
+                           taille_sortie=None):
+    """Compte une conversion : statut et raison ("ok", "aucune_donnee", "erreur"…), durée
+    en secondes, tailles du classeur et du fichier produit en octets."""
+    format_fichier = type_fichier or "inconnu"
+    increments = [("sabiana_conversions_total",
+                   {"format": format_fichier, "statut": statut, "raison": raison}, 1)]
+    increments += observer("sabiana_conversion_duree_secondes",
+                           {"format": format_fichier, "taille": tranche_taille(taille_classeur)},
+                           duree)
+    increments += observer("sabiana_classeur_octets", {"format": format_fichier},
+                           taille_classeur)
+    if taille_sortie is not None:
+        increments += observer("sabiana_fichier_produit_octets", {"format": format_fichier},
+                               taille_sortie)
+    incrementer(increments)
+
+
+def compter_erreur_api(code):
+    """Compte une réponse en erreur de l'API (classeur trop volumineux, service saturé…)."""
+    incrementer([("sabiana_api_erreurs_total", {"code": str(code)}, 1)])
+
+
+def compter_lecture_cache(present):
+    """Compte une lecture du cache des fichiers Magenta (présent ou absent)."""
+    incrementer([("sabiana_cache_lectures_total",
+                  {"resultat": "present" if present else "absent"}, 1)])
+
+
+def lectures_cache():
+    """Renvoie les nombres de lectures présentes et absentes du cache des fichiers Magenta."""
+    lectures = lire_series().get("sabiana_cache_lectures_total", {})
+    return tuple(int(lectures.get(json.dumps({"resultat": resultat}), 0))
+                 for resultat in ("present", "absent"))
+
+
+def lire_series():
+    """Renvoie les séries enregistrées : {nom: {étiquettes (JSON): valeur}}."""
+    chemin = chemin_metriques()
+    series = defaultdict(dict)
+    if chemin is None or not os.path.exists(chemin):
+        return series
+    with connexion(chemin) as base:
+        for nom, etiquettes, valeur in base.execute("SELECT nom, etiquettes, valeur "
+                                                    "FROM series"):
+            series[nom][etiquettes] = valeur
+    return series
+
+
+def texte_etiquettes(etiquettes):
+    """Met en forme les étiquettes d'une série : {format="easysel",le="0.5"}."""
+    if not etiquettes:
+        return ""
+    valeurs = ",".join(f'{nom}="{valeur}"' for nom, valeur in etiquettes.items())
+    return "{" + valeurs + "}"
+
+
+def texte_valeur(valeur):
+    """Met en forme une valeur (entière si possible)."""
+    return str(int(valeur)) if float(valeur).is_integer() else repr(float(valeur))
+
+
+def lignes_histogramme(nom, bornes, series):
+    """Renvoie les lignes d'un histogramme : seaux cumulés (toutes les bornes), somme et
+    nombre, pour chaque combinaison d'étiquettes."""
+    seaux = defaultdict(dict)
+    for cle, valeur in series.get(nom + "_bucket", {}).items():
+        etiquettes = json.loads(cle)
+        seaux[json.dumps({k: v for k, v in etiquettes.items() if k != "le"},
+                         sort_keys=True, ensure_ascii=False)][etiquettes["le"]] = valeur
+
+    lignes = []
+    for cle in sorted(series.get(nom + "_count", {})):
+        etiquettes = json.loads(cle)
+        cumul = 0
+        for limite in [format(limite, "g") for limite in bornes] + ["+Inf"]:
+            cumul += seaux[cle].get(limite, 0)
+            lignes.append(f"{nom}_bucket{texte_etiquettes(dict(etiquettes, le=limite))} "
+                          f"{texte_valeur(cumul)}")
+        lignes.append(f"{nom}_sum{texte_etiquettes(etiquettes)} "
+                      f"{texte_valeur(series[nom + '_sum'].get(cle, 0))}")
+        lignes.append(f"{nom}_count{texte_etiquettes(etiquettes)} "
+                      f"{texte_valeur(series[nom + '_count'][cle])}")
+    return lignes
+
+
+def etat_courant():
+    """Renvoie les jauges lues au moment de l'exposition : travaux de la file d'attente par
+    statut et cache des conversions. [(nom, type, description, [(étiquettes, valeur)])]"""
+    jauges = []
+    try:
+        from travaux import connexion as connexion_travaux, dossier_travaux
+
+        nombres = {}
+        if os.path.exists(os.path.join(dossier_travaux(), "travaux.sqlite3")):
+            with connexion_travaux() as base:
+                nombres = dict(base.execute("SELECT statut, COUNT(*) FROM travaux "
+                                            "GROUP BY statut").fetchall())
+        jauges.append(("sabiana_travaux", "gauge", "Travaux de la file d'attente par statut",
+                       [({"statut": statut}, nombre) for statut, nombre in
+                        sorted(nombres.items())]))
+    except (sqlite3.Error, OSError) as e:
+        journal.warning("File d'attente illisible : %s", e)
+
+    try:
+        from cache import statistiques_cache
+
+        stats = statistiques_cache()
+        jauges.append(("sabiana_cache_octets", "gauge", "Taille du cache des conversions",
+                       [({}, stats["taille"])]))
+        jauges.append(("sabiana_cache_entrees", "gauge", "Entrées du cache des conversions",
+                       [({}, stats["entrees"])]))
+    except (sqlite3.Error, OSError, ValueError) as e:
+        journal.warning("Cache illisible : %s", e)
+    return jauges
+
+
+def exposer():
+    """Renvoie les métriques au format texte de Prometheus (version 0.0.4)."""
+    series = lire_series()
+    lignes = []
+    for nom, (type_metrique, description, bornes) in METRIQUES.items():
+        lignes.append(f"# HELP {nom} {description}")
+        lignes.append(f"# TYPE {nom} {type_metrique}")
+        if type_metrique == "histogram":
+            lignes.extend(lignes_histogramme(nom, bornes, series))
+        else:
+            for cle, valeur in sorted(series.get(nom, {}).items()):
+                lignes.append(f"{nom}{texte_etiquettes(json.loads(cle))} "
+                              f"{texte_valeur(valeur)}")
+
+    for nom, type_metrique, description, valeurs in etat_courant():
+        lignes.append(f"# HELP {nom} {description}")
+        lignes.append(f"# TYPE {nom} {type_metrique}")
+        for etiquettes, valeur in valeurs:
+            lignes.append(f"{nom}{texte_etiquettes(etiquettes)} {texte_valeur(valeur)}")
+
+    return "\n".join(lignes) + "\n"
+
+
+def main(argv=None):
+    """Affiche les métriques enregistrées."""
+    parser = argparse.ArgumentParser(description="Métriques des conversions (format Prometheus)")
+    parser.add_argument("--reinitialiser", action="store_true",
+                        help="Supprime les métriques enregistrées")
+    args = parser.parse_args(argv)
+
+    if args.reinitialiser:
+        chemin = chemin_metriques()
+        if chemin is not None and os.path.exists(chemin):
+            with connexion(chemin) as base:
+                base.execute("DELETE FROM series")
+        print("Métriques réinitialisées")
+        return 0
+
+    sys.stdout.write(exposer())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Nomenclature consolidée : quantité totale par code produit sur un ensemble d'offres
+
+Les lignes produits des tableaux Magenta (Easysel, Rapid'Aero et PANNEAU, titres exclus)
+sont regroupées par code en une seule agrégation, avec les fichiers d'origine de chaque
+code. Les tableaux sont repris du cache (cf. cache.tableau_avec_cache) : seules les
+offres jamais converties sont lues.
+
+Exemples :
+    python nomenclature.py /chemin/vers/projet
+    python nomenclature.py /chemin/vers/projet --sortie nomenclature.csv --processus 8
+"""
+
+import argparse
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import pandas as pd
+
+from batch import lister_fichiers
+from catalogue import texte_code
+from detection import identifier_format
+from formats import ecrivain
+from grands_fichiers import flux, ouvrir_contenu
+
+NOM_ONGLET = "Nomenclature"
+COLONNES_LIGNES = ["Code", "Libellé", "Qté", "Fichier", "Format"]
+
+
+def lignes_produits(tableau, nom_fichier, type_fichier):
+    """Renvoie les lignes produits d'un tableau Magenta (code renseigné, hors titres) :
+    code, libellé, quantité numérique, fichier et format d'origine."""
+    codes = tableau["Code"]
+    garder = (tableau["Sous total"] != "T") & codes.notna() & (codes != "")
+    lignes = tableau[garder]
+
+    # Hors Easysel, le libellé d'une ligne produit est déplacé en colonne K
+    libelles = lignes["Col_11"] if "Col_11" in lignes.columns else lignes["Libellé"]
+
+    return pd.DataFrame({
+        "Code": lignes["Code"].map(texte_code),
+        "Libellé": libelles.replace("", None),
+        "Qté": pd.to_numeric(lignes["Qté"], errors="coerce"),
+        "Fichier": nom_fichier,
+        "Format": type_fichier,
+    }, columns=COLONNES_LIGNES)
+
+
+def consolider(lignes):
+    """Regroupe les lignes produits de toutes les offres par code (une seule agrégation) :
+    quantité totale, premier libellé connu, nombre d'offres et fichiers d'origine."""
+    lignes = [bloc for bloc in lignes if not bloc.empty]
+    if not lignes:
+        return pd.DataFrame(columns=["Code", "Libellé", "Qté", "Nb offres", "Formats",
+                                     "Fichiers"])
+
+    toutes = pd.concat(lignes, ignore_index=True)
+    nomenclature = toutes.groupby("Code", sort=True).agg(
+        **{"Libellé": ("Libellé", "first"),
+           "Qté": ("Qté", "sum"),
+           "Nb offres": ("Fichier", "nunique"),
+           "Formats": ("Format", "unique"),
+           "Fichiers": ("Fichier", "unique")}).reset_index()
+
+    nomenclature["Libellé"] = nomenclature["Libellé"].fillna("")
+    nomenclature["Formats"] = nomenclature["Formats"].map(", ".join)
+    nomenclature["Fichiers"] = nomenclature["Fichiers"].map("; ".join)
+    # Quantités entières affichées sans décimale
+    if (nomenclature["Qté"] % 1 == 0).all():
+        nomenclature["Qté"] = nomenclature["Qté"].astype("int64")
+    return nomenclature
+
+
+def lignes_fichier(chemin):
+    """Renvoie (chemin, lignes produits ou None, message) pour un classeur, à partir de son
+    tableau Magenta en cache (converti et mis en cache s'il n'y est pas)."""
+    try:
+        with ouvrir_contenu(chemin) as contenu:
+            nom_fichier = os.path.basename(chemin)
+            type_fichier, _ = identifier_format(flux(contenu), nom_fichier)
+            if type_fichier is None:
+                return chemin, None, "format non reconnu"
+
+            # Importé à la première conversion (avec les règles, pandas et numpy)
+            from cache import tableau_avec_cache
+
+            tableau = tableau_avec_cache(contenu, type_fichier)
+    except Exception as e:
+        return chemin, None, str(e)
+    if tableau is None:
+        return chemin, None, "aucune donnée extraite"
+
+    return chemin, lignes_produits(tableau, nom_fichier, type_fichier), type_fichier
+
+
+def main(argv=None):
+    """Point d'entrée de la nomenclature consolidée."""
+    parser = argparse.ArgumentParser(description="Nomenclature consolidée de plusieurs offres")
+    parser.add_argument("chemins", nargs="*", help="Fichiers ou dossiers des offres")
+    parser.add_argument("--liste", help="Fichier texte contenant un chemin par ligne")
+    parser.add_argument("--sortie", default="nomenclature.xlsx",
+                        help="Fichier produit : .xlsx, .csv ou .parquet "
+                             "(par défaut : nomenclature.xlsx)")
+    parser.add_argument("--processus", type=int, default=os.cpu_count(),
+                        help="Nombre de processus de conversion (par défaut : nombre de cœurs)")
+    args = parser.parse_args(argv)
+
+    format_sortie = os.path.splitext(args.sortie)[1].lstrip(".").lower()
+    if format_sortie not in ("xlsx", "csv", "parquet"):
+        parser.error("le fichier produit doit être un .xlsx, .csv ou .parquet")
+
+    fichiers = lister_fichiers(args.chemins, args.liste)
+    if not fichiers:
+        parser.error("aucun fichier à consolider")
+
+    debut = time.perf_counter()
+    lignes = []
+    ignores = 0
+
+    # Ordre des fichiers conservé : les libellés retenus ne dépendent pas des processus
+    with Pool(processes=max(1, min(args.processus, len(fichiers)))) as pool:
+        for chemin, bloc, message in pool.imap(lignes_fichier, fichiers, chunksize=8):
+            if bloc is None:
+                ignores += 1
+                print(f"IGNORÉ  {chemin} : {message}")
+            else:
+                lignes.append(bloc)
+
+    nomenclature = consolider(lignes)
+    with open(args.sortie, "wb") as f:
+        ecrivain(format_sortie)(nomenclature, f, NOM_ONGLET)
+
+    print(f"\n{len(lignes)} offre(s) consolidée(s), {ignores} ignorée(s) : "
+          f"{len(nomenclature)} code(s) produit dans {args.sortie} "
+          f"({time.perf_counter() - debut:.2f} s)")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,23 @@
 """Module de traitement des fichiers panneau"""
 
-import streamlit as st
+import logging
+
 import pandas as pd
 
+from cache import empreintes_onglets, extraire_bloc
+from catalogue import completer_libelles
+from lecture import ouvrir_classeur, lire_plage
+from suivi import etape, noter
+from regles import appliquer_regles
+
+journal = logging.getLogger(__name__)
+
+# Onglet DS18 : types, colonnes de quantités et colonnes codes correspondantes
+TYPES_DS18 = ["PanneauComplet", "PanneauFirst", "PanneauIntermédiaire", "PanneauFinal",
+              "CapotEntree", "CapotInter", "CapotFinal", "Jonction", "Travail", "CacheTube"]
+COLS_QUANTITE_DS18 = ["AR", "AZ", "BH", "BP", "BY", "CA", "CC", "CE", "CH", "CJ"]
+COLS_CODE_DS18 = ["AS", "BA", "BI", "BQ", "BZ", "CB", "CD", "CF", "CI", "CK"]
+
 
 def lettre_en_index(lettre):
     """
@@ -16,9 +31,42 @@ def lettre_en_index(lettre):
     return index - 1  # Ajuste l'index pour correspondre aux indices Python (commence à 0)
 
 
+def lire_onglets_panneau(source):
+    """
+    Lit uniquement les plages utilisées des onglets PULSAR et DS18 (None si l'onglet
+    est absent). Les DataFrames sont indexés par position, comme xl.parse(onglet).
+    Un onglet inchangé depuis une conversion précédente est repris du cache.
+    """
+    classeur = ouvrir_classeur(source)
+
+    try:
+        empreintes = empreintes_onglets(source, classeur, "panneau", {"PULSAR", "DS18"})
+
+        df_pulsar = None
+        if "PULSAR" in classeur.sheetnames:
+            # Titres, quantités, types, positions et références (colonnes A à D et O)
+            with etape("feuille PULSAR"):
+                df_pulsar = extraire_bloc(empreintes.get("PULSAR"), lire_plage,
+                                          classeur["PULSAR"], range(14, 69), [0, 1, 2, 3, 14])
+
+        df_ds18 = None
+        if "DS18" in classeur.sheetnames:
+            # Panneaux (colonnes A à D, P et colonnes quantités/codes) puis accessoires
+            colonnes = sorted({0, 1, 2, 3, 15}
+                              | {lettre_en_index(col) for col in COLS_QUANTITE_DS18}
+                              | {lettre_en_index(col) for col in COLS_CODE_DS18})
+            with etape("feuille DS18"):
+                df_ds18 = extraire_bloc(empreintes.get("DS18"), lire_plage, classeur["DS18"],
+                                        list(range(13, 44)) + list(range(48, 79)), colonnes)
+    finally:
+        classeur.close()
+
+    return df_pulsar, df_ds18
+
+
 
 def traiter_pulsar(df_source, df_export):
-    """Fonction pour traiter les données de l'onglet PULSAR"""
+    """Fonction pour traiter les données de l'onglet PULSAR (cf. lire_onglets_panneau)"""
     # 🔹 Définir les colonnes cibles (doivent être identiques à df_export)
     colonnes_cibles = ["Code Produit", "Libellé", "Quantité"]
 
@@ -36,20 +84,20 @@ def traiter_pulsar(df_source, df_export):
     col_ref = 14     # Colonne O
 
     # 🔹 1. Traitement par titre (Plage A15:A41)
-    for i, row in df_source.iloc[14:41].iterrows():
-        if pd.notna(row.iloc[col_titre]):  # Vérifier si la cellule A contient un titre
-            dernier_titre = row.iloc[col_titre]
+    for i, row in df_source.loc[14:40].iterrows():
+        if pd.notna(row[col_titre]):  # Vérifier si la cellule A contient un titre
+            dernier_titre = row[col_titre]
 
             if dernier_titre not in titres_exportes:
                 titres_exportes.add(dernier_titre)
                 lignes_pulsar.append(["", dernier_titre, ""])  # Ajout du titre
 
         if dernier_titre != "":
-            quantite = row.iloc[col_quantite]
+            quantite = row[col_quantite]
             if pd.notna(quantite):
-                type_valeur = row.iloc[col_type]
-                position = row.iloc[col_position]
-                reference_valeur = row.iloc[col_ref]
+                type_valeur = row[col_type]
+                position = row[col_position]
+                reference_valeur = row[col_ref]
 
                 libelle = f"{type_valeur} {position}" if pd.notna(type_valeur) \
                     and pd.notna(position) else ""
@@ -57,13 +105,13 @@ def traiter_pulsar(df_source, df_export):
 
     # 🔹 2. Cas sans titre en colonne A (Plage O15:O41)
     if dernier_titre == "":
-        for i, row in df_source.iloc[14:41].iterrows():
-            reference_valeur = row.iloc[col_ref]
+        for i, row in df_source.loc[14:40].iterrows():
+            reference_valeur = row[col_ref]
             if pd.notna(reference_valeur):
-                quantite = row.iloc[col_quantite]
+                quantite = row[col_quantite]
                 if pd.notna(quantite):
-                    type_valeur = row.iloc[col_type]
-                    position = row.iloc[col_position]
+                    type_valeur = row[col_type]
+                    position = row[col_position]
 
                     libelle = f"{type_valeur} {position}" if pd.notna(type_valeur) \
                         and pd.notna(position) else ""
@@ -74,10 +122,10 @@ def traiter_pulsar(df_source, df_export):
         lignes_pulsar.append(["", "", ""])  # Ligne vide pour séparer
         lignes_pulsar.append(["", "Accessoires PULSAR", ""])
 
-        for i, row in df_source.iloc[45:69].iterrows():
-            if pd.notna(row.iloc[col_titre]):  # Vérifier si la cellule contient un code produit
+        for i, row in df_source.loc[45:68].iterrows():
+            if pd.notna(row[col_titre]):  # Vérifier si la cellule contient un code produit
                 # Code produit + quantité
-                lignes_pulsar.append([row.iloc[col_titre], "", row.iloc[col_ref]])
+                lignes_pulsar.append([row[col_titre], "", row[col_ref]])
 
     # 🔹 Convertir la liste en DataFrame avec les bonnes colonnes
     df_pulsar = pd.DataFrame(lignes_pulsar, columns=colonnes_cibles)
@@ -90,21 +138,16 @@ def traiter_pulsar(df_source, df_export):
 
 
 def traiter_ds18(df_source, df_export):
-    """Extrait et formate les données de l'onglet DS18 pour les ajouter au fichier de sortie"""
+    """Extrait et formate les données de l'onglet DS18 pour les ajouter au fichier de sortie
+    (cf. lire_onglets_panneau)"""
 
     if df_source is None:
-        st.error("Erreur : L'onglet 'DS18' n'existe pas dans le fichier source.")
+        journal.error("Erreur : L'onglet 'DS18' n'existe pas dans le fichier source.")
         return df_export
 
-    # Liste des types, colonnes de quantités et colonnes codes correspondantes
-    types = ["PanneauComplet", "PanneauFirst", "PanneauIntermédiaire", "PanneauFinal",
-             "CapotEntree", "CapotInter", "CapotFinal", "Jonction", "Travail", "CacheTube"]
-    cols_quantite = ["AR", "AZ", "BH", "BP", "BY", "CA", "CC", "CE", "CH", "CJ"]
-    cols_code = ["AS", "BA", "BI", "BQ", "BZ", "CB", "CD", "CF", "CI", "CK"]
-
     # Conversion en indices numériques
-    cols_quantite_indices = [lettre_en_index(col) for col in cols_quantite]
-    cols_code_indices = [lettre_en_index(col) for col in cols_code]
+    cols_quantite_indices = [lettre_en_index(col) for col in COLS_QUANTITE_DS18]
+    cols_code_indices = [lettre_en_index(col) for col in COLS_CODE_DS18]
 
     # Liste pour stocker les nouvelles lignes avant concaténation
     nouvelles_lignes = []
@@ -112,17 +155,17 @@ def traiter_ds18(df_source, df_export):
     # Traitement des panneaux DS18 (lignes 15 à 44)
     for i in range(13, 44):  # Indices commencent à 0 en Python
         # Vérifier que les cellules B, C et D ne sont pas vides
-        if pd.notna(df_source.iloc[i, 1]) and pd.notna(df_source.iloc[i, 2]) \
-            and pd.notna(df_source.iloc[i, 3]):
-            titre = f"{df_source.iloc[i, 1]}x {df_source.iloc[i, 2]} de {df_source.iloc[i, 3]}m"
+        if pd.notna(df_source.at[i, 1]) and pd.notna(df_source.at[i, 2]) \
+            and pd.notna(df_source.at[i, 3]):
+            titre = f"{df_source.at[i, 1]}x {df_source.at[i, 2]} de {df_source.at[i, 3]}m"
             nouvelles_lignes.append({"Code Produit": "", "Libellé": titre, "Quantité": ""})
 
             # Parcourir les types et copier les données associées
-            for j, libelle in enumerate(types):
+            for j, libelle in enumerate(TYPES_DS18):
                 # Accès à la colonne de quantités
-                quantite = df_source.iloc[i, cols_quantite_indices[j]]
+                quantite = df_source.at[i, cols_quantite_indices[j]]
                 # Accès à la colonne de codes
-                code = df_source.iloc[i, cols_code_indices[j]]
+                code = df_source.at[i, cols_code_indices[j]]
 
                 # Vérifier si la quantité et le code sont valides
                 if pd.notna(quantite) and quantite != 0 and pd.notna(code):
@@ -135,10 +178,10 @@ def traiter_ds18(df_source, df_export):
         nouvelles_lignes.append({"Code Produit": "", "Libellé": "Accessoires DS18", "Quantité": ""})
 
         for i in range(48, 79):
-            if pd.notna(df_source.iloc[i, 0]):
-                code = df_source.iloc[i, 0]
-                libelle = df_source.iloc[i, 1] if pd.notna(df_source.iloc[i, 1]) else ""
-                quantite = df_source.iloc[i, 15] if pd.notna(df_source.iloc[i, 15]) else ""
+            if pd.notna(df_source.at[i, 0]):
+                code = df_source.at[i, 0]
+                libelle = df_source.at[i, 1] if pd.notna(df_source.at[i, 1]) else ""
+                quantite = df_source.at[i, 15] if pd.notna(df_source.at[i, 15]) else ""
 
                 nouvelles_lignes.append({"Code Produit": code, \
                 "Libellé": libelle, "Quantité": quantite})
@@ -169,10 +212,10 @@ def modifier_tableau_panneau(df_export):
 
     # 4. Ajout de "T" en colonne "Sous total" si SEUL "Libellé" contient une donnée
     if "Sous total" in df_export.columns:
-        for i, row in df_export.iterrows():
-            if pd.notna(row["Libellé"]) and (pd.isna(row["Code"]) or row["Code"] == "") \
-                and (pd.isna(row["Qté"]) or row["Qté"] == ""):
-                df_export.at[i, "Sous total"] = "T"
+        est_titre = df_export["Libellé"].notna() \
+            & (df_export["Code"].isna() | (df_export["Code"] == "")) \
+            & (df_export["Qté"].isna() | (df_export["Qté"] == ""))
+        df_export.loc[est_titre, "Sous total"] = "T"
 
     # Remplacement des NaN par ""
     df_export.fillna("", inplace=True)
@@ -180,9 +223,39 @@ def modifier_tableau_panneau(df_export):
     # Déplacement des libellés en colonne K si ce n'est pas un titre
     # Vérifier si "Sous total" existe avant de commencer
     if "Sous total" in df_export.columns:
-        for i, row in df_export.iterrows():
-            if row["Sous total"] != "T":
-                df_export.at[i, "Col_11"] = row["Libellé"]  # Déplacement vers Col_11
-                df_export.at[i, "Libellé"] = ""  # Vider la colonne "Libellé" après déplacement
+        pas_titre = df_export["Sous total"] != "T"
+        df_export.loc[pas_titre, "Col_11"] = df_export.loc[pas_titre, "Libellé"]  # Vers Col_11
+        df_export.loc[pas_titre, "Libellé"] = ""  # Vider la colonne "Libellé" après déplacement
+
+    # Substitutions de codes (cf. regles_substitution.json)
+    appliquer_regles(df_export, "panneau")
+
+    # Libellés des lignes produits repris du catalogue (cf. catalogue.py)
+    completer_libelles(df_export)
 
     return df_export
+
+
+def convertir(source):
+    """Extrait et met en forme les onglets PULSAR et DS18 d'un fichier PANNEAU."""
+    with etape("extraction"):
+        # Chargement des plages utilisées des onglets PULSAR et DS18 s'ils existent
+        df_pulsar, df_ds18 = lire_onglets_panneau(source)
+
+        # Création du DataFrame de sortie
+        df_export = pd.DataFrame(columns=["Code Produit", "Libellé", "Quantité"])
+
+        # Traitement des données de PULSAR
+        if df_pulsar is not None:
+            with etape("traiter_pulsar"):
+                df_export = traiter_pulsar(df_pulsar, df_export)
+
+        # Traitement des données de DS18
+        if df_ds18 is not None:
+            with etape("traiter_ds18"):
+                df_export = traiter_ds18(df_ds18, df_export)
+        noter("lignes", len(df_export))
+
+    # Mise en forme du dataframe
+    with etape("mise_en_forme"):
+        return modifier_tableau_panneau(df_export)
@@ -1,89 +1,272 @@
-"""Module dev Rapidaero"""
-
-import pandas as pd
-import streamlit as st
+"""Module dev Rapidaero
 
+Les feuilles '°C' sont indépendantes jusqu'à leur assemblage : avec
+SABIANA_FEUILLES_MODE=fils ou processus, elles sont extraites en parallèle par
+SABIANA_FEUILLES_TRAVAILLEURS fils ou processus (par défaut : nombre de cœurs), puis
+assemblées dans l'ordre du classeur. Par défaut (sequentiel), elles sont lues l'une
+après l'autre : aucun gain des modes parallèles n'a encore été mesuré (cf.
+python -m benchmarks.mesures --modes sequentiel,fils,processus sur une machine à
+plusieurs cœurs). Les processus reçoivent le chemin du classeur, pas son contenu.
 
-def copier_tableaux_rapid_aero(excel_file):
-    """ Copie les données des feuilles se terminant par '°C' """
-    liste_feuilles = excel_file.sheet_names  # Récupérer la liste des feuilles
-    resultats = []
-    ligne_destination = 0
+Le suivi (cf. suivi.py) n'est pas transmis aux fils et aux processus : le plafond
+SABIANA_MEMOIRE_MAX est contrôlé après chaque groupe de feuilles extrait, pas pendant
+la lecture. En mode processus, la mémoire des processus d'extraction n'est pas comptée.
+"""
 
-    for sheet_name in liste_feuilles:
-        if sheet_name.endswith("°C"):
-            st.write(f"Traitement de la feuille : {sheet_name}")  # Debugging
-            # ajout dtype=str pour éviter le problème de référence 0008314
-            df = pd.read_excel(excel_file, sheet_name=sheet_name, header=None, dtype=str)
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
 
-            # Vérifier que le fichier contient au moins 18 colonnes (jusqu'à la colonne R)
-            if df.shape[1] > 17:
-                # Trouver la dernière ligne utilisée dans la colonne P (colonne index 15)
-                dern_ligne = df.iloc[:, 15].last_valid_index()
+import numpy as np
+import pandas as pd
 
-                if dern_ligne and dern_ligne >= 1:  # Vérifier qu'il y a bien des données
-                    print("Dernière ligne remplie en colonne P :", dern_ligne)
+from cache import ecrire_bloc, empreintes_onglets, extraire_bloc, lire_bloc
+from catalogue import completer_libelles
+from grands_fichiers import Projection, ecrire_par_blocs, fichier_temporaire, \
+    supprimer_temporaire
+from lecture import ouvrir_classeur, convertir_texte, iterer_lignes
+from regles import appliquer_regles
+from suivi import controler_memoire, etape, noter
 
-                # Créer une liste vide pour stocker les données formatées
-                extrait_liste = []
+journal = logging.getLogger(__name__)
 
-                #  **Ajouter le titre dans la première colonne (ligne actuelle)**
-                # Colonnes P, Q, R vides
-                extrait_liste.append([f"Aérotherme - {sheet_name}"] + [""] * 2)
+MODES_EXTRACTION = ("sequentiel", "fils", "processus")
 
-                #  **Ajouter les données à partir de la ligne suivante**
-                extrait_liste.extend(df.iloc[1:dern_ligne + 1, [15, 16, 17]].values.tolist())
+# Exécuteurs de l'extraction en parallèle, conservés d'une conversion à l'autre
+_executeurs = {}
+_verrou_executeurs = threading.Lock()
 
-                # Convertir la liste en DataFrame pandas
-                extrait = pd.DataFrame(extrait_liste, columns=["P", "Q", "R"])
 
-                # Ajouter au résultat final
-                resultats.append(extrait)
+def lire_tableaux_rapid_aero(source):
+    """ Lit uniquement les colonnes P, Q et R des feuilles se terminant par '°C' (même
+    résultat que les feuilles complètes lues par pd.read_excel, cf. benchmarks/reference.py).
+    Les feuilles inchangées depuis une conversion précédente sont reprises du cache
+    (cf. cache.empreintes_onglets) """
+    classeur = ouvrir_classeur(source)
 
-                # Mise à jour de la ligne de destination (incrémentation)
-                ligne_destination += len(extrait)
+    try:
+        feuilles = [feuille for feuille in classeur.worksheets if feuille.title.endswith("°C")]
+        empreintes = empreintes_onglets(source, classeur, "rapidaero",
+                                        {feuille.title for feuille in feuilles})
+        mode, nombre = mode_extraction()
+        if mode == "sequentiel":
+            extraits = []
+            for feuille in feuilles:
+                with etape(f"feuille {feuille.title}"):
+                    extraits.append(extraire_bloc(empreintes.get(feuille.title),
+                                                  extraire_feuille_rapid_aero, feuille))
+        else:
+            extraits = extraire_en_parallele(source, classeur, feuilles, empreintes, mode,
+                                             nombre)
+        resultats = [extrait for extrait in extraits if extrait is not None]
+    finally:
+        classeur.close()
 
     if resultats:
         return pd.concat(resultats, ignore_index=True)
     else:
         return None
 
+def mode_extraction():
+    """Renvoie le mode d'extraction des feuilles '°C' et le nombre de travailleurs
+    (SABIANA_FEUILLES_MODE, SABIANA_FEUILLES_TRAVAILLEURS)."""
+    mode = os.environ.get("SABIANA_FEUILLES_MODE", "sequentiel")
+    if mode not in MODES_EXTRACTION:
+        journal.warning("SABIANA_FEUILLES_MODE inconnu (%s) : extraction séquentielle", mode)
+        mode = "sequentiel"
+    if mode == "processus" and multiprocessing.current_process().daemon:
+        # Processus d'un Pool (traitement par lots) : processus enfants interdits
+        mode = "fils"
+    nombre = int(os.environ.get("SABIANA_FEUILLES_TRAVAILLEURS", os.cpu_count() or 1))
+    return mode, max(1, nombre)
+
+def executeur_feuilles(mode, nombre):
+    """Renvoie l'exécuteur (fils ou processus) de l'extraction en parallèle, créé au
+    premier usage puis réutilisé."""
+    with _verrou_executeurs:
+        executeur = _executeurs.get((mode, nombre))
+        if executeur is None:
+            if mode == "fils":
+                executeur = ThreadPoolExecutor(nombre, thread_name_prefix="feuilles")
+            else:
+                executeur = ProcessPoolExecutor(
+                    nombre, mp_context=multiprocessing.get_context("spawn"))
+            _executeurs[(mode, nombre)] = executeur
+        return executeur
+
+@contextlib.contextmanager
+def source_partagee(source, mode):
+    """Donne la source sous une forme transmissible aux travailleurs : chemin du fichier
+    (classeur sur disque ou projeté), contenu en mémoire partagé par les fils, ou chemin
+    d'une copie temporaire supprimée à la sortie. Le contenu du classeur n'est jamais
+    envoyé à chaque processus."""
+    if isinstance(source, (str, os.PathLike)):
+        yield os.fspath(source)
+    elif isinstance(source, Projection) and source.chemin is not None:
+        yield source.chemin
+    elif mode == "fils" and hasattr(source, "getvalue"):
+        yield source.getvalue()
+    else:
+        with fichier_temporaire() as f:
+            temporaire = f.name
+        try:
+            position = source.tell()
+            ecrire_par_blocs(source, temporaire)
+            source.seek(position)
+            yield temporaire
+        finally:
+            supprimer_temporaire(temporaire)
+
+def extraire_feuilles(source, titres):
+    """Extrait un groupe de feuilles '°C' (travail d'un fil ou d'un processus) : le
+    classeur est ouvert une fois pour le groupe. Renvoie [(titre, extrait, durée)]."""
+    classeur = ouvrir_classeur(io.BytesIO(source) if isinstance(source, bytes) else source)
+    try:
+        resultats = []
+        for titre in titres:
+            debut = time.perf_counter()
+            extrait = extraire_feuille_rapid_aero(classeur[titre])
+            resultats.append((titre, extrait, round(time.perf_counter() - debut, 6)))
+        return resultats
+    finally:
+        classeur.close()
+
+def extraire_en_parallele(source, classeur, feuilles, empreintes, mode, nombre):
+    """Extrait les feuilles '°C' en parallèle et renvoie leurs extraits dans l'ordre des
+    feuilles. Les blocs en cache sont repris ; les autres feuilles sont réparties en un
+    groupe par travailleur (une seule feuille est lue sur place)."""
+    extraits = {}
+    a_extraire = []
+    for feuille in feuilles:
+        cle = empreintes.get(feuille.title)
+        present, bloc = lire_bloc(cle) if cle is not None else (False, None)
+        if present:
+            extraits[feuille.title] = bloc
+        else:
+            a_extraire.append(feuille.title)
+
+    if len(a_extraire) == 1:
+        with etape(f"feuille {a_extraire[0]}"):
+            extraits[a_extraire[0]] = extraire_feuille_rapid_aero(classeur[a_extraire[0]])
+    elif a_extraire:
+        with etape(f"feuilles en parallèle ({mode})"):
+            groupes = [a_extraire[debut::nombre]
+                       for debut in range(min(nombre, len(a_extraire)))]
+            executeur = executeur_feuilles(mode, nombre)
+            durees = {}
+            with source_partagee(source, mode) as partage:
+                taches = [executeur.submit(extraire_feuilles, partage, groupe)
+                          for groupe in groupes]
+                try:
+                    for tache in taches:
+                        for titre, extrait, duree in tache.result():
+                            extraits[titre] = extrait
+                            durees[titre] = duree
+                        # Le suivi n'est pas transmis aux travailleurs : plafond contrôlé ici
+                        controler_memoire()
+                except BrokenExecutor:
+                    # Processus arrêté brutalement : un nouvel exécuteur sera créé
+                    with _verrou_executeurs:
+                        _executeurs.pop((mode, nombre), None)
+                    raise
+            noter("feuilles", len(a_extraire))
+            noter("travailleurs", len(groupes))
+            noter("feuille_max_s", max(durees.values()))
+
+    for titre in a_extraire:
+        if titre in empreintes:
+            ecrire_bloc(empreintes[titre], extraits[titre])
+    noter("reutilisees", len(feuilles) - len(a_extraire))
+
+    return [extraits[feuille.title] for feuille in feuilles]
+
+def extraire_feuille_rapid_aero(feuille):
+    """ Extrait les colonnes P, Q, R d'une feuille '°C' jusqu'à la dernière ligne remplie en P """
+    journal.debug("Traitement de la feuille : %s", feuille.title)
+
+    lignes = []
+    dern_ligne = None
+    largeur_suffisante = False
+
+    # Lecture à partir de la colonne P : seules P, Q et R sont converties
+    for num, ligne in enumerate(iterer_lignes(feuille, min_col=16)):
+        if not largeur_suffisante:
+            # La feuille doit contenir au moins 18 colonnes (jusqu'à la colonne R)
+            largeur_suffisante = any(valeur not in (None, "") for valeur in ligne[2:])
+
+        valeurs = [convertir_texte(ligne[i]) if i < len(ligne) else np.nan for i in range(3)]
+        if isinstance(valeurs[0], str):
+            dern_ligne = num
+        lignes.append(valeurs)
+
+    if not largeur_suffisante:
+        return None
+
+    if dern_ligne and dern_ligne >= 1:  # Vérifier qu'il y a bien des données
+        journal.debug("Dernière ligne remplie en colonne P : %s", dern_ligne)
+    noter("lignes", dern_ligne or 0)
+
+    # Titre dans la première colonne, puis les données à partir de la ligne suivante
+    extrait_liste = [[f"Aérotherme - {feuille.title}"] + [""] * 2]
+    extrait_liste.extend(lignes[1:(dern_ligne or 0) + 1])
+
+    return pd.DataFrame(extrait_liste, columns=["P", "Q", "R"])
+
 def mise_en_forme_rapid_aero(df):
     """
-    Met en forme le tableau extrait :
-    - Déplace une colonne,
-    - Supprime les colonnes inutiles,
-    - Ajoute des titres,
-    - Supprime les lignes vides.
+    Met en forme le tableau extrait (colonnes P, Q, R), construit en une seule fois :
+    - Échange les colonnes P et Q (Code, Libellé),
+    - Ajoute les titres et les colonnes vides,
+    - Marque les titres "Aérotherme - …" ("T" en "Sous total"),
+    - Supprime les lignes vides,
+    - Déplace les libellés en colonne K pour les lignes qui ne sont pas des titres.
     """
+    designations, codes, quantites = (df.iloc[:, col].to_numpy() for col in range(3))
 
-    # S'assurer que le DataFrame a au moins 11 colonnes
-    while df.shape[1] < 11:
-        df[f'Col_{df.shape[1] + 1}'] = ""
-
-    # Ajouter les titres
-    titres = ["Code", "Libellé", "Qté", "Col_4", "Col_5", "Col_6", "Col_7", "Col_8", "Sous total", "Col_10", "Col_11"]
-    df.columns = titres  # On applique les titres au DataFrame
+    # "T" dans "Sous total" si "Aérotherme" est trouvé dans le libellé (colonne P)
+    est_titre = df.iloc[:, 0].str.contains("Aérotherme", na=False).to_numpy()
 
-    # Swap colonnes A et B
-    df[["Code", "Libellé", "Qté"]] = df[["Libellé","Code", "Qté"]]
+    # Supprimer les lignes où le code (colonne Q) est vide, sauf les titres
+    garder = est_titre | ~(df.iloc[:, 1].isna() | (df.iloc[:, 1] == "")).to_numpy()
+    designations, codes, quantites = designations[garder], codes[garder], quantites[garder]
+    est_titre = est_titre[garder]
+    vide = np.full(len(codes), "", dtype=object)
 
-    print("Colonnes dans le df :", titres)
+    colonnes = {"Code": codes, "Libellé": np.where(est_titre, designations, vide),
+                "Qté": quantites}
+    for num in range(4, 9):
+        colonnes[f"Col_{num}"] = vide
+    colonnes["Sous total"] = np.where(est_titre, "T", vide)
+    colonnes["Col_10"] = vide
+    # Libellés déplacés en colonne K si ce n'est pas un titre
+    colonnes["Col_11"] = np.where(est_titre, vide, designations)
 
-    # Ajouter "T" dans "sous-total" si "Aérotherme" est trouvé dans "Libellé"
-    df.loc[df["Libellé"].str.contains("Aérotherme", na=False), "Sous total"] = "T"
+    df = pd.DataFrame(colonnes, index=df.index[garder])
+    journal.debug("Colonnes dans le df : %s", list(df.columns))
 
-    # Supprimer les lignes où les colonnes A et I sont vides
-    df = df[~(df["Code"].isna() | (df["Code"] == "")) |
-            ~(df["Sous total"].isna() | (df["Sous total"] == ""))]
+    # Substitutions de codes (cf. regles_substitution.json)
+    appliquer_regles(df, "rapidaero")
 
-    # Déplacement des libellés en colonne K si ce n'est pas un titre
-    # Vérifier si "Sous total" existe avant de commencer
-    if "Sous total" in df.columns:
-        for i, row in df.iterrows():
-            if row["Sous total"] != "T":
-                df.at[i, "Col_11"] = row["Libellé"]  # Déplacement vers Col_11
-                df.at[i, "Libellé"] = ""  # Vider la colonne "Libellé"
+    # Libellés des lignes produits repris du catalogue (cf. catalogue.py)
+    completer_libelles(df)
 
     return df
+
+def convertir(source):
+    """Extrait et met en forme les feuilles '°C' d'un fichier Rapid'Aero (None si vide)."""
+    # Lecture des seules colonnes P, Q, R des feuilles '°C'
+    with etape("extraction"):
+        donnees = lire_tableaux_rapid_aero(source)
+        if donnees is None or donnees.empty:
+            return None
+        noter("lignes", len(donnees))
+
+    with etape("mise_en_forme"):
+        return mise_en_forme_rapid_aero(donnees)
+
 # End-of-file (EOF)
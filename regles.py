@@ -0,0 +1,109 @@
+"""Moteur de règles de substitution de codes (plénums, etc.)
+
+Les règles sont décrites dans regles_substitution.json (ou le fichier indiqué par la
+variable d'environnement SABIANA_REGLES) :
+    - "formats" : pipelines concernés ("easysel", "rapidaero", "panneau")
+    - "portee" : "bloc" (lignes consécutives dont le code n'est pas vide) ou "tableau"
+    - "declencheurs" : codes dont la présence dans la portée active la 2e cible
+    - "correspondances" : code -> [cible sans déclencheur, cible avec déclencheur]
+
+Le fichier est compilé une fois par processus, puis recompilé s'il est modifié.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+FICHIER_REGLES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "regles_substitution.json")
+
+# Règles compilées et identification du fichier dont elles sont issues
+_compilees = {"signature": None, "empreinte": None, "regles": []}
+
+
+def chemin_regles():
+    """Renvoie le chemin du fichier de règles."""
+    return os.environ.get("SABIANA_REGLES", FICHIER_REGLES)
+
+
+def compiler_regle(regle):
+    """Transforme une règle du fichier en tableaux de correspondance."""
+    portee = regle.get("portee", "bloc")
+    if portee not in ("bloc", "tableau"):
+        raise ValueError(f"Portée inconnue pour la règle '{regle.get('nom')}' : {portee}")
+
+    cibles = np.array(list(regle["correspondances"].values()), dtype="int64").reshape(-1, 2)
+    return {
+        "nom": regle.get("nom", ""),
+        "formats": set(regle["formats"]),
+        "portee": portee,
+        "declencheurs": np.array(regle.get("declencheurs", []), dtype="int64"),
+        "codes": pd.Index([int(code) for code in regle["correspondances"]], dtype="int64"),
+        "sans_declencheur": cibles[:, 0],
+        "avec_declencheur": cibles[:, 1],
+    }
+
+
+def charger_regles():
+    """Renvoie les règles compilées, en recompilant le fichier s'il a changé."""
+    chemin = chemin_regles()
+    etat = os.stat(chemin)
+    signature = (chemin, etat.st_mtime_ns, etat.st_size)
+
+    if _compilees["signature"] != signature:
+        with open(chemin, "rb") as f:
+            contenu = f.read()
+        donnees = json.loads(contenu)
+        _compilees["regles"] = [compiler_regle(regle) for regle in donnees["regles"]]
+        _compilees["empreinte"] = f"{donnees.get('version', 0)}-" \
+            f"{hashlib.sha256(contenu).hexdigest()[:12]}"
+        _compilees["signature"] = signature
+
+    return _compilees["regles"]
+
+
+def empreinte_regles():
+    """Renvoie la version et l'empreinte du fichier de règles (pour le cache des conversions)."""
+    charger_regles()
+    return _compilees["empreinte"]
+
+
+def appliquer_regles(df, format_fichier, colonne="Code"):
+    """Applique les règles du format à la colonne des codes (seuls les codes numériques
+    sont remplacés)."""
+    regles = [regle for regle in charger_regles() if format_fichier in regle["formats"]]
+
+    for regle in regles:
+        codes = df[colonne].astype(str)
+
+        # Seuls les codes numériques sont comparés aux déclencheurs et aux correspondances
+        # (chiffres ASCII, 18 chiffres significatifs au plus pour tenir dans un int64)
+        valeurs = codes[codes.str.fullmatch(r"0*[0-9]{1,18}")].astype("int64")
+        positions = regle["codes"].get_indexer(valeurs)
+        trouves = positions >= 0
+        if not trouves.any():
+            continue
+        positions = positions[trouves]
+        index_trouves = valeurs.index[trouves]
+
+        # Présence d'AU MOINS UN déclencheur dans la portée (calculée une fois par bloc)
+        if len(regle["declencheurs"]):
+            est_declencheur = valeurs.isin(regle["declencheurs"]) \
+                .reindex(df.index, fill_value=False)
+            if regle["portee"] == "bloc":
+                # Chaque ligne dont le code est vide démarre un nouveau bloc
+                blocs = (codes.str.strip() == "").cumsum()
+                declenche = est_declencheur.groupby(blocs).transform("any")[index_trouves]
+            else:
+                declenche = np.full(len(index_trouves), est_declencheur.any())
+        else:
+            declenche = np.zeros(len(index_trouves), dtype=bool)
+
+        nouveaux = np.where(declenche, regle["avec_declencheur"][positions],
+                            regle["sans_declencheur"][positions])
+        df.loc[index_trouves, colonne] = pd.Series(nouveaux, index=index_trouves).astype(object)
+
+    return df
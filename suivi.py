@@ -0,0 +1,236 @@
+"""Suivi des étapes d'une conversion : durées, mémoire et profilage optionnel
+
+Les fonctions des pipelines délimitent leurs étapes avec etape("nom"). Les mesures ne
+sont enregistrées que pendant un suivi ouvert par demarrer_suivi() ; sinon etape() ne
+fait rien. Le suivi est propre au fil d'exécution (une session Streamlit, un processus).
+Les avertissements et erreurs journalisés pendant le suivi (logging) sont conservés
+dans le rapport, pour être affichés par l'interface.
+
+La mémoire résidente du processus est relevée à chaque étape : une conversion qui
+utilise plus que le plafond SABIANA_MEMOIRE_MAX (en octets, 0 = sans limite) est
+interrompue par MemoireDepassee. Les processus de conversion importent leurs modules
+avant le premier suivi (cf. batch.prechauffer), sans quoi ces imports seraient comptés
+dans leur première conversion. Le suivi n'étant pas transmis aux fils ni aux processus
+lancés par une conversion, le plafond n'y est pas contrôlé (cf. rapidaero.py).
+
+    with demarrer_suivi(profilage=True) as rapport:
+        convertir_fichier(source, "easysel")
+    rapport.en_json()
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+import traceback
+import tracemalloc
+from datetime import datetime
+
+journal = logging.getLogger(__name__)
+
+# Nombre de fonctions conservées dans le profil (triées par temps cumulé)
+NB_FONCTIONS_PROFIL = 30
+
+# Plafond mémoire par défaut d'une conversion (0 : sans limite)
+MEMOIRE_MAX_DEFAUT = 0
+
+# Rapport du suivi en cours (None hors suivi)
+_rapport_courant = contextvars.ContextVar("rapport_courant", default=None)
+
+
+def plafond_memoire():
+    """Renvoie la mémoire maximale d'une conversion en octets (0 : sans limite)."""
+    return int(os.environ.get("SABIANA_MEMOIRE_MAX", MEMOIRE_MAX_DEFAUT))
+
+
+def memoire_processus():
+    """Renvoie la mémoire résidente (RSS) du processus en octets (None si inconnue)."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        # /proc absent (hors Linux) : mémoire non mesurée, plafond non appliqué
+        return None
+
+
+class MemoireDepassee(MemoryError):
+    """Conversion interrompue : mémoire utilisée supérieure au plafond SABIANA_MEMOIRE_MAX."""
+
+
+class Rapport:
+    """Étapes mesurées pendant un suivi, avec le profil et le pic mémoire si demandés."""
+
+    def __init__(self, profilage=False, rappel=None):
+        self.profilage = profilage
+        self.rappel = rappel
+        self.date = datetime.now().isoformat(timespec="seconds")
+        self.debut = time.perf_counter()
+        self.duree = None
+        self.etapes = []
+        self.en_cours = []
+        self.memoire_pic = None
+        self.memoire_plafond = plafond_memoire()
+        self.memoire_depart = memoire_processus()
+        self.memoire_utilisee = 0
+        self.profil = None
+        self.erreur = None
+        self.messages = []
+
+    def en_dict(self):
+        """Renvoie le rapport sous forme de dictionnaire sérialisable en JSON."""
+        return {
+            "date": self.date,
+            "duree_s": self.duree,
+            "profilage": self.profilage,
+            "etapes": self.etapes,
+            "memoire_pic_octets": self.memoire_pic,
+            "memoire_utilisee_octets": (self.memoire_utilisee
+                                        if self.memoire_depart is not None else None),
+            "memoire_plafond_octets": self.memoire_plafond or None,
+            "profil": self.profil,
+            "erreur": self.erreur,
+            "messages": self.messages,
+        }
+
+    def en_json(self):
+        """Renvoie le rapport au format JSON (pour le téléchargement)."""
+        return json.dumps(self.en_dict(), indent=2, ensure_ascii=False)
+
+
+class CollecteurMessages(logging.Handler):
+    """Conserve dans un rapport les messages journalisés pendant son suivi."""
+
+    def __init__(self, rapport):
+        super().__init__(logging.WARNING)
+        self.rapport = rapport
+
+    def emit(self, record):
+        # Les messages des autres fils d'exécution (autres sessions) sont ignorés
+        if _rapport_courant.get() is self.rapport:
+            self.rapport.messages.append(record.getMessage())
+
+
+@contextlib.contextmanager
+def etape(nom):
+    """Mesure la durée (et, en profilage, la mémoire allouée) d'une étape du pipeline."""
+    rapport = _rapport_courant.get()
+    if rapport is None:
+        yield
+        return
+
+    mesure = {"nom": nom, "niveau": len(rapport.en_cours),
+              "debut_s": round(time.perf_counter() - rapport.debut, 6)}
+    if rapport.rappel is not None and not rapport.en_cours:
+        rapport.rappel(nom)
+    # Ajoutée dès le début pour conserver l'ordre d'imbrication des étapes
+    rapport.etapes.append(mesure)
+    memoire = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+    debut = time.perf_counter()
+    rapport.en_cours.append(mesure)
+    try:
+        controler_memoire()
+        yield
+        controler_memoire()
+    finally:
+        rapport.en_cours.pop()
+        mesure["duree_s"] = round(time.perf_counter() - debut, 6)
+        if memoire is not None:
+            mesure["memoire_octets"] = tracemalloc.get_traced_memory()[0] - memoire
+        if rapport.memoire_depart is not None:
+            mesure["memoire_utilisee_octets"] = rapport.memoire_utilisee
+        journal.debug("%s : %.1f ms", nom, mesure["duree_s"] * 1000)
+
+
+def relever_memoire(rapport):
+    """Renvoie la mémoire utilisée depuis le début d'un suivi (croissance de la mémoire
+    résidente, modules importés pendant le suivi compris) et conserve son maximum
+    dans le rapport. Renvoie None si la mémoire n'est pas mesurable."""
+    memoire = memoire_processus()
+    if memoire is None or rapport.memoire_depart is None:
+        return None
+
+    utilisee = max(0, memoire - rapport.memoire_depart)
+    rapport.memoire_utilisee = max(rapport.memoire_utilisee, utilisee)
+    return utilisee
+
+
+def controler_memoire():
+    """Relève la mémoire utilisée par la conversion en cours et lève MemoireDepassee
+    au-delà du plafond."""
+    rapport = _rapport_courant.get()
+    if rapport is None:
+        return
+    utilisee = relever_memoire(rapport)
+    if utilisee is not None and rapport.memoire_plafond and utilisee > rapport.memoire_plafond:
+        nom = rapport.en_cours[-1]["nom"] if rapport.en_cours else "conversion"
+        raise MemoireDepassee(f"Mémoire maximale dépassée ({nom}) : {utilisee / 1e6:.0f} Mo "
+                              f"utilisés pour {rapport.memoire_plafond / 1e6:.0f} Mo autorisés "
+                              "(SABIANA_MEMOIRE_MAX)")
+
+
+def noter(nom, valeur):
+    """Ajoute une information (nombre de lignes, cache…) à l'étape en cours."""
+    rapport = _rapport_courant.get()
+    if rapport is not None and rapport.en_cours:
+        rapport.en_cours[-1][nom] = valeur
+
+
+def extraire_profil(profileur):
+    """Renvoie les fonctions les plus coûteuses d'un profil cProfile."""
+    statistiques = pstats.Stats(profileur, stream=io.StringIO())
+    statistiques.sort_stats(pstats.SortKey.CUMULATIVE)
+    fonctions = []
+    for (fichier, ligne, fonction), (_, appels, propre, cumule, _) in \
+            statistiques.stats.items():
+        fonctions.append({"fonction": f"{fichier}:{ligne}({fonction})", "appels": appels,
+                          "propre_s": round(propre, 6), "cumule_s": round(cumule, 6)})
+    fonctions.sort(key=lambda fonction: fonction["cumule_s"], reverse=True)
+    return fonctions[:NB_FONCTIONS_PROFIL]
+
+
+@contextlib.contextmanager
+def demarrer_suivi(profilage=False, rappel=None):
+    """Ouvre un suivi et renvoie son Rapport ; profilage=True active cProfile et tracemalloc.
+
+    rappel(nom) est appelée au début de chaque étape principale (suivi de l'avancement).
+    Une exception levée pendant le suivi est consignée dans le rapport puis propagée."""
+    rapport = Rapport(profilage, rappel)
+    jeton = _rapport_courant.set(rapport)
+    collecteur = CollecteurMessages(rapport)
+    logging.getLogger().addHandler(collecteur)
+
+    profileur = None
+    memoire_deja_suivie = tracemalloc.is_tracing()
+    if profilage:
+        if not memoire_deja_suivie:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        profileur = cProfile.Profile()
+        try:
+            profileur.enable()
+        except ValueError:
+            # Un seul profileur actif à la fois (autre session en cours de profilage)
+            journal.warning("Profilage indisponible : un autre profil est en cours")
+            profileur = None
+
+    try:
+        yield rapport
+    except Exception:
+        rapport.erreur = traceback.format_exc()
+        raise
+    finally:
+        rapport.duree = round(time.perf_counter() - rapport.debut, 6)
+        relever_memoire(rapport)
+        if profileur is not None:
+            profileur.disable()
+            rapport.profil = extraire_profil(profileur)
+            rapport.memoire_pic = tracemalloc.get_traced_memory()[1]
+            if not memoire_deja_suivie:
+                tracemalloc.stop()
+        logging.getLogger().removeHandler(collecteur)
+        _rapport_courant.reset(jeton)
@@ -0,0 +1,43 @@
+"""Configuration commune des tests : modules du dépôt importables, environnement isolé et
+classeurs synthétiques (cf. benchmarks/generateur.py)."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generateur import generer_easysel, generer_panneau, generer_rapid_aero  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def environnement(tmp_path, monkeypatch):
+    """Isole chaque test : cache, travaux et métriques dans un dossier temporaire, sans
+    catalogue produits."""
+    monkeypatch.setenv("SABIANA_CACHE_DOSSIER", str(tmp_path / "cache"))
+    monkeypatch.setenv("SABIANA_TRAVAUX_DOSSIER", str(tmp_path / "travaux"))
+    monkeypatch.setenv("SABIANA_CATALOGUE", str(tmp_path / "absent.sqlite3"))
+    monkeypatch.setenv("SABIANA_METRIQUES", "0")
+    for nom in ("SABIANA_CACHE_TAILLE_MAX", "SABIANA_LECTEUR", "SABIANA_FEUILLES_MODE",
+                "SABIANA_FEUILLES_TRAVAILLEURS", "SABIANA_MEMOIRE_MAX", "SABIANA_REGLES"):
+        monkeypatch.delenv(nom, raising=False)
+
+
+@pytest.fixture(scope="session")
+def classeurs(tmp_path_factory):
+    """Classeurs synthétiques de chaque format : {nom: (format, chemin)}."""
+    dossier = tmp_path_factory.mktemp("classeurs")
+    chemins = {nom: str(dossier / fichier) for nom, fichier in (
+        ("easysel", "Offerta_300.xlsx"), ("panneau", "PANNEAU_200.xlsx"),
+        ("panneau_pulsar", "PANNEAU_pulsar.xlsx"), ("panneau_ds18", "PANNEAU_ds18.xlsx"),
+        ("rapidaero", "Rapid'Aero_6.xlsx"))}
+
+    generer_easysel(chemins["easysel"], 300)
+    generer_panneau(chemins["panneau"], nb_lignes_annexes=200)
+    generer_panneau(chemins["panneau_pulsar"], ds18=False, graine=1)
+    generer_panneau(chemins["panneau_ds18"], pulsar=False, graine=2)
+    generer_rapid_aero(chemins["rapidaero"], 6, nb_lignes=50)
+
+    return {nom: (nom.split("_")[0], chemin) for nom, chemin in chemins.items()}
+
@@ -0,0 +1,141 @@
+"""API HTTP (api.py) : conversions directes exécutées dans le processus de test
+(executeur=None) et travaux de la file d'attente exécutés sur place."""
+
+import io
+import json
+
+import pandas as pd
+import pytest
+from tornado.testing import AsyncHTTPTestCase
+
+import travaux
+from api import creer_application
+from benchmarks.reference import convertir_reference
+from formats import FORMATS_SORTIE
+
+TAILLE_MAX = 2 * 1024 * 1024
+
+
+def codes_sortie(contenu, format_sortie):
+    """Renvoie les codes non vides d'un fichier Magenta renvoyé par l'API."""
+    flux = io.BytesIO(contenu)
+    if format_sortie == "xlsx":
+        df = pd.read_excel(flux, dtype=str)
+    elif format_sortie == "csv":
+        df = pd.read_csv(flux, dtype=str)
+    elif format_sortie == "parquet":
+        df = pd.read_parquet(flux)
+    else:
+        df = pd.read_csv(flux, sep="\t", header=None, dtype=str, encoding="cp1252")
+    return [code for code in df.iloc[:, 0].fillna("") if code != ""]
+
+
+def codes_reference(chemin, type_fichier):
+    """Renvoie les codes non vides du tableau Magenta de référence (en texte)."""
+    tableau = convertir_reference(chemin, type_fichier)
+    return [str(code) for code in tableau["Code"] if code != ""]
+
+
+class TestApi(AsyncHTTPTestCase):
+
+    @pytest.fixture(autouse=True)
+    def preparer(self, classeurs, tmp_path, monkeypatch):
+        monkeypatch.setenv("SABIANA_METRIQUES", str(tmp_path / "metriques.sqlite3"))
+        self.classeurs = classeurs
+
+    def get_app(self):
+        return creer_application(None, concurrence=2, taille_max=TAILLE_MAX)
+
+    def classeur(self, nom):
+        with open(self.classeurs[nom][1], "rb") as f:
+            return f.read()
+
+    def deposer(self, url, corps):
+        return self.fetch(url, method="POST", body=corps)
+
+    def erreur(self, reponse):
+        return json.loads(reponse.body)["erreur"]
+
+    def test_conversion_directe(self):
+        corps = self.classeur("easysel")
+        attendu = codes_reference(self.classeurs["easysel"][1], "easysel")
+
+        for format_sortie, (_, extension, type_mime, _) in FORMATS_SORTIE.items():
+            reponse = self.deposer(f"/convertir?nom=Offerta.xlsx&format={format_sortie}",
+                                   corps)
+            assert reponse.code == 200, format_sortie
+            assert reponse.headers["Content-Type"] == type_mime
+            assert reponse.headers["X-Type-Fichier"] == "easysel"
+            assert extension + '"' in reponse.headers["Content-Disposition"]
+            assert codes_sortie(reponse.body, format_sortie) == attendu, format_sortie
+
+    def test_travail_dans_la_file(self):
+        reponse = self.deposer("/convertir?nom=Rapid'Aero.xlsx&file=1&format=csv",
+                               self.classeur("rapidaero"))
+        assert reponse.code == 202
+        id_travail = json.loads(reponse.body)["id"]
+        assert reponse.headers["Location"] == f"/travaux/{id_travail}"
+
+        etat = json.loads(self.fetch(f"/travaux/{id_travail}").body)
+        assert etat["statut"] == travaux.EN_ATTENTE
+        reponse = self.fetch(f"/travaux/{id_travail}/sortie")
+        assert reponse.code == 409
+
+        # Exécuté sur place, à la place d'un processus de conversion
+        travaux.executer_travail(travaux.prendre_travail())
+
+        etat = json.loads(self.fetch(f"/travaux/{id_travail}").body)
+        assert (etat["statut"], etat["progression"]) == ("OK", 1.0)
+        reponse = self.fetch(f"/travaux/{id_travail}/sortie")
+        assert reponse.code == 200
+        assert reponse.headers["X-Type-Fichier"] == "rapidaero"
+        assert codes_sortie(reponse.body, "csv") == \
+            codes_reference(self.classeurs["rapidaero"][1], "rapidaero")
+
+    def test_travail_inconnu(self):
+        assert self.fetch("/travaux/abc").code == 404
+        assert self.fetch("/travaux/abc/sortie").code == 404
+
+    def test_classeur_trop_volumineux(self):
+        reponse = self.deposer("/convertir?nom=Offerta.xlsx", b"x" * (TAILLE_MAX + 1))
+        assert reponse.code == 413
+        assert "volumineux" in self.erreur(reponse)
+
+    def test_format_non_reconnu(self):
+        reponse = self.deposer("/convertir?nom=notes.txt", b"pas un classeur")
+        assert reponse.code == 415
+        assert self.erreur(reponse) == "format non reconnu"
+
+    def test_requetes_invalides(self):
+        reponse = self.deposer("/convertir?nom=Offerta.xlsx", b"")
+        assert reponse.code == 400
+        reponse = self.deposer("/convertir?nom=Offerta.xlsx&format=pdf",
+                               self.classeur("easysel"))
+        assert reponse.code == 400
+        assert "format inconnu" in self.erreur(reponse)
+
+    def test_conversions_simultanees_depassees(self):
+        self._app.en_cours = self._app.settings["concurrence"]
+        reponse = self.deposer("/convertir?nom=Offerta.xlsx", self.classeur("easysel"))
+        assert reponse.code == 503
+        assert reponse.headers["Retry-After"] == "1"
+
+    def test_sante(self):
+        reponse = self.fetch("/sante")
+        assert reponse.code == 200
+        sante = json.loads(reponse.body)
+        assert sante["statut"] == "ok"
+        assert sante["en_cours"] == 0
+        assert set(sante["formats_sortie"]) == set(FORMATS_SORTIE)
+
+    def test_metriques(self):
+        self.deposer("/convertir?nom=Offerta.xlsx", self.classeur("easysel"))
+        self.deposer("/convertir?nom=notes.txt", b"pas un classeur")
+
+        reponse = self.fetch("/metriques")
+        assert reponse.code == 200
+        assert reponse.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        texte = reponse.body.decode()
+        assert "# TYPE sabiana_conversions_total counter" in texte
+        assert 'statut="OK"' in texte
+        assert 'code="415"' in texte
@@ -0,0 +1,135 @@
+"""Cache disque des conversions : résultats repris, éviction et blocs des onglets."""
+
+import os
+import shutil
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import cache
+from benchmarks.reference import convertir_reference
+from formats import convertisseur
+from suivi import demarrer_suivi
+
+
+def modifier(source, destination, onglet, cellule, valeur):
+    """Enregistre une copie du classeur avec une cellule modifiée (openpyxl)."""
+    classeur = load_workbook(source)
+    classeur[onglet][cellule] = valeur
+    classeur.save(destination)
+
+
+def etapes(rapport, cle):
+    """Renvoie les valeurs notées cle dans les étapes d'un suivi."""
+    return [etape[cle] for etape in rapport.etapes if cle in etape]
+
+
+def test_resultat_repris_du_cache(classeurs):
+    _, chemin = classeurs["easysel"]
+    with open(chemin, "rb") as f:
+        contenu = f.read()
+
+    with demarrer_suivi() as premier:
+        sortie = cache.convertir_avec_cache(contenu, "easysel", "csv")
+    with demarrer_suivi() as second:
+        assert cache.convertir_avec_cache(contenu, "easysel", "csv") == sortie
+
+    assert etapes(premier, "present") == [False]
+    assert etapes(second, "present") == [True]
+
+
+def test_autre_format_depuis_le_tableau(classeurs):
+    """Un autre format de sortie est écrit depuis le tableau Magenta en cache."""
+    _, chemin = classeurs["panneau"]
+    with open(chemin, "rb") as f:
+        contenu = f.read()
+
+    cache.convertir_avec_cache(contenu, "panneau", "xlsx")
+    cle = cache.cle_cache(contenu, "panneau", "tableau")
+    present, tableau = cache.lire_bloc(cle)
+    assert present
+    pd.testing.assert_frame_equal(tableau, convertir_reference(chemin, "panneau"),
+                                  check_index_type=False)
+
+
+def test_cache_desactive(classeurs, monkeypatch):
+    monkeypatch.setenv("SABIANA_CACHE_TAILLE_MAX", "0")
+    _, chemin = classeurs["easysel"]
+    with open(chemin, "rb") as f:
+        cache.convertir_avec_cache(f.read(), "easysel", "csv")
+    assert cache.statistiques_cache()["entrees"] == 0
+
+
+def test_eviction_des_moins_recemment_utilisees(monkeypatch):
+    monkeypatch.setenv("SABIANA_CACHE_TAILLE_MAX", "1000")
+    dossier = cache.dossier_cache()
+
+    def ecrire(numero, date):
+        cache.ecrire_cache(f"cle{numero}", bytes(300))
+        chemin = os.path.join(dossier, f"cle{numero}" + cache.EXTENSION)
+        os.utime(chemin, (date, date))
+
+    for numero in range(3):
+        ecrire(numero, 1000 + numero)
+    # La lecture met à jour la date d'utilisation : cle0 devient la plus récente
+    assert cache.lire_cache("cle0") == bytes(300)
+
+    # 1200 octets : éviction jusqu'à MARGE_EVICTION de la taille maximale
+    ecrire(3, 2000)
+    restantes = {entree.name for entree in os.scandir(dossier)
+                 if entree.name.endswith(cache.EXTENSION)}
+    assert restantes == {"cle0.sortie", "cle2.sortie", "cle3.sortie"}
+    assert cache.statistiques_cache()["taille"] == 900
+    with open(os.path.join(dossier, ".taille"), encoding="ascii") as f:
+        assert int(f.read()) == 900
+
+
+def test_entree_trop_grande_ignoree(monkeypatch):
+    monkeypatch.setenv("SABIANA_CACHE_TAILLE_MAX", "100")
+    cache.ecrire_cache("grande", bytes(200))
+    assert cache.lire_cache("grande") is None
+
+
+def test_fichiers_etrangers_conserves(monkeypatch):
+    """L'éviction ne supprime que les entrées du cache, même dans un dossier partagé."""
+    monkeypatch.setenv("SABIANA_CACHE_TAILLE_MAX", "500")
+    dossier = cache.dossier_cache()
+    autre = os.path.join(dossier, "travail.resultat")
+    with open(autre, "wb") as f:
+        f.write(bytes(1000))
+
+    for numero in range(3):
+        cache.ecrire_cache(f"cle{numero}", bytes(300))
+    assert os.path.exists(autre)
+
+
+@pytest.mark.parametrize("type_fichier, mode, onglet, cellule, valeur, reutilises", [
+    ("rapidaero", "sequentiel", "12°C", "P5", "NOUVEAU", 5),
+    ("rapidaero", "fils", "12°C", "P5", "NOUVEAU", 5),
+    ("panneau", "sequentiel", "DS18", "AR20", 7, 1),
+    ("panneau", "sequentiel", "PULSAR", "O20", "X99", 1),
+])
+def test_blocs_reutilises_apres_modification(classeurs, tmp_path, monkeypatch, type_fichier,
+                                             mode, onglet, cellule, valeur, reutilises):
+    """Nouvelle version d'un classeur dont un onglet est modifié : seul cet onglet est
+    relu, le résultat est celui de la conversion complète."""
+    monkeypatch.setenv("SABIANA_FEUILLES_MODE", mode)
+    monkeypatch.setenv("SABIANA_FEUILLES_TRAVAILLEURS", "2")
+    _, chemin = classeurs[type_fichier]
+    version1 = str(tmp_path / "version1.xlsx")
+    version2 = str(tmp_path / "version2.xlsx")
+    # Première version enregistrée par openpyxl, comme la seconde
+    shutil.copy(chemin, tmp_path / "source.xlsx")
+    modifier(tmp_path / "source.xlsx", version1, onglet, "ZZ1", None)
+    modifier(version1, version2, onglet, cellule, valeur)
+
+    convertisseur(type_fichier)(version1)
+    with demarrer_suivi() as rapport:
+        tableau = convertisseur(type_fichier)(version2)
+
+    # Blocs repris onglet par onglet (reutilise) ou par l'extraction en parallèle
+    assert sum(etapes(rapport, "reutilise")) + sum(etapes(rapport, "reutilisees")) \
+        == reutilises
+    pd.testing.assert_frame_equal(tableau, convertir_reference(version2, type_fichier),
+                                  check_index_type=False)
@@ -0,0 +1,65 @@
+"""Conversions des pipelines comparées à celles de l'application d'origine
+(benchmarks/reference.py), types des colonnes compris."""
+
+import io
+
+import pandas as pd
+import pytest
+
+from benchmarks.generateur import codes_regles
+from benchmarks.reference import TABLE_CORRESPONDANCE, convertir_reference
+from formats import convertisseur
+from rapidaero import MODES_EXTRACTION
+
+
+def comparer(obtenu, attendu):
+    """L'index d'un tableau filtré peut être de type différent : seules les valeurs et les
+    types des colonnes sont comparés."""
+    assert obtenu is not None
+    pd.testing.assert_frame_equal(obtenu, attendu, check_dtype=True, check_index_type=False)
+
+
+@pytest.mark.parametrize("lecteur", ["natif", "openpyxl"])
+@pytest.mark.parametrize("nom", ["easysel", "panneau", "panneau_pulsar", "panneau_ds18",
+                                 "rapidaero"])
+def test_identique_a_reference(classeurs, nom, lecteur, monkeypatch):
+    monkeypatch.setenv("SABIANA_LECTEUR", lecteur)
+    type_fichier, chemin = classeurs[nom]
+    comparer(convertisseur(type_fichier)(chemin), convertir_reference(chemin, type_fichier))
+
+
+@pytest.mark.parametrize("nom", ["easysel", "panneau", "rapidaero"])
+def test_sans_cache(classeurs, nom, monkeypatch):
+    monkeypatch.setenv("SABIANA_CACHE_TAILLE_MAX", "0")
+    type_fichier, chemin = classeurs[nom]
+    comparer(convertisseur(type_fichier)(chemin), convertir_reference(chemin, type_fichier))
+
+
+@pytest.mark.parametrize("octets", [False, True], ids=["chemin", "octets"])
+@pytest.mark.parametrize("mode", MODES_EXTRACTION)
+def test_rapid_aero_modes_extraction(classeurs, mode, octets, monkeypatch):
+    monkeypatch.setenv("SABIANA_FEUILLES_MODE", mode)
+    monkeypatch.setenv("SABIANA_FEUILLES_TRAVAILLEURS", "2")
+    _, chemin = classeurs["rapidaero"]
+    attendu = convertir_reference(chemin, "rapidaero")
+
+    with open(chemin, "rb") as f:
+        contenu = f.read()
+    source = (lambda: io.BytesIO(contenu)) if octets else (lambda: chemin)
+
+    # Deuxième conversion : blocs des feuilles repris du cache
+    comparer(convertisseur("rapidaero")(source()), attendu)
+    comparer(convertisseur("rapidaero")(source()), attendu)
+
+
+def test_regles_appliquees(classeurs):
+    """Le classeur Easysel généré contient des codes remplacés par la règle des plénums,
+    avec et sans déclencheur dans leur bloc."""
+    _, chemin = classeurs["easysel"]
+    codes = set(convertisseur("easysel")(chemin)["Code"])
+
+    _, remplaces = codes_regles()
+    cibles = {cible for paire in TABLE_CORRESPONDANCE.values() for cible in paire}
+    assert not codes & (set(remplaces) - cibles)
+    assert codes & {sans for sans, avec in TABLE_CORRESPONDANCE.values() if sans != avec}
+    assert codes & {avec for sans, avec in TABLE_CORRESPONDANCE.values() if sans != avec}
@@ -0,0 +1,32 @@
+"""Règles de substitution des codes (regles.py)."""
+
+import pandas as pd
+
+from regles import appliquer_regles
+
+# Code remplacé par la règle des plénums : 9069560 sans déclencheur, 9069190 avec
+CODE_PLENUM = "9069190"
+DECLENCHEUR = "9066613"
+
+
+def test_remplacement_selon_declencheur_du_bloc():
+    df = pd.DataFrame({"Code": [CODE_PLENUM, DECLENCHEUR, "", CODE_PLENUM]})
+    resultat = appliquer_regles(df, "easysel")
+    assert resultat["Code"].tolist() == [9069190, DECLENCHEUR, "", 9069560]
+
+
+def test_codes_non_numeriques_ignores():
+    codes = ["12345678901234567890", "²", "٣", "abc", None, "9069190.5"]
+    df = pd.DataFrame({"Code": codes})
+    resultat = appliquer_regles(df, "easysel")
+    assert resultat["Code"].tolist() == codes
+
+
+def test_zeros_en_tete():
+    df = pd.DataFrame({"Code": ["0" + CODE_PLENUM]})
+    assert appliquer_regles(df, "easysel")["Code"].tolist() == [9069560]
+
+
+def test_format_non_concerne():
+    df = pd.DataFrame({"Code": [CODE_PLENUM]})
+    assert appliquer_regles(df, "panneau")["Code"].tolist() == [CODE_PLENUM]
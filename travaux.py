@@ -0,0 +1,362 @@
+"""File d'attente persistante des conversions (SQLite), traitée par des processus dédiés
+
+L'interface dépose un travail (classeur source et options) puis consulte son état ; les
+processus de conversion prennent les travaux en attente un par un. Les fichiers déposés
+et produits sont conservés dans le dossier des travaux jusqu'à la fin de la rétention.
+
+Variables d'environnement :
+    SABIANA_TRAVAUX_DOSSIER    dossier de la base et des fichiers
+                               (par défaut ~/.cache/sabiana-magenta/travaux)
+    SABIANA_TRAVAUX_RETENTION  durée de conservation des travaux en secondes (par défaut 24 h)
+    SABIANA_PROCESSUS          nombre de processus de conversion (par défaut : nombre de cœurs)
+    SABIANA_TRAVAUX_TENTATIVES nombre de conversions d'un travail interrompues par l'arrêt
+                               de leur processus avant son échec (par défaut 3)
+
+Les classeurs déposés sont copiés par blocs dans le dossier des travaux ; les grands
+classeurs y sont lus par projection en mémoire (cf. grands_fichiers.py).
+
+Exemple (processus de conversion indépendants de l'interface) :
+    python travaux.py --processus 4
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+
+from batch import convertir_contenu, prechauffer
+from grands_fichiers import ecrire_par_blocs, ouvrir_contenu
+from suivi import demarrer_suivi
+
+journal = logging.getLogger(__name__)
+
+RETENTION_DEFAUT = 24 * 3600
+TENTATIVES_DEFAUT = 3
+
+# Statuts des travaux (ceux des travaux terminés sont ceux de batch.convertir_contenu)
+EN_ATTENTE = "EN ATTENTE"
+EN_COURS = "EN COURS"
+TERMINES = ("OK", "ÉCHEC", "IGNORÉ")
+
+# Fichiers d'un travail : classeur déposé et fichier Magenta produit (extension distincte
+# de celles du cache des conversions, qui peut partager le même dossier)
+SUFFIXE_ENTREE = ".entree"
+SUFFIXE_SORTIE = ".resultat"
+
+# Avancement d'un travail au début de chaque étape de la conversion
+PROGRESSION_ETAPES = {"cache": 0.1, "extraction": 0.2, "mise_en_forme": 0.7, "ecriture": 0.85}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS travaux (
+    id TEXT PRIMARY KEY,
+    nom_fichier TEXT NOT NULL,
+    format_sortie TEXT NOT NULL,
+    profilage INTEGER NOT NULL DEFAULT 0,
+    statut TEXT NOT NULL,
+    progression REAL NOT NULL DEFAULT 0,
+    type_fichier TEXT,
+    message TEXT,
+    rapport TEXT,
+    pid INTEGER,
+    tentatives INTEGER NOT NULL DEFAULT 0,
+    cree REAL NOT NULL,
+    debut REAL,
+    fin REAL
+)
+"""
+
+
+def dossier_travaux():
+    """Renvoie le dossier des travaux (créé si besoin)."""
+    dossier = os.environ.get("SABIANA_TRAVAUX_DOSSIER",
+                             os.path.join(os.path.expanduser("~"), ".cache", "sabiana-magenta",
+                                          "travaux"))
+    os.makedirs(dossier, exist_ok=True)
+    return dossier
+
+
+def retention_travaux():
+    """Renvoie la durée de conservation des travaux en secondes."""
+    return float(os.environ.get("SABIANA_TRAVAUX_RETENTION", RETENTION_DEFAUT))
+
+
+def tentatives_max():
+    """Renvoie le nombre de conversions d'un travail interrompues avant son échec."""
+    return int(os.environ.get("SABIANA_TRAVAUX_TENTATIVES", TENTATIVES_DEFAUT))
+
+
+def nombre_processus():
+    """Renvoie le nombre de processus de conversion."""
+    return int(os.environ.get("SABIANA_PROCESSUS", os.cpu_count() or 1))
+
+
+@contextlib.contextmanager
+def connexion():
+    """Ouvre la base des travaux (partagée entre processus) et valide les modifications."""
+    base = sqlite3.connect(os.path.join(dossier_travaux(), "travaux.sqlite3"), timeout=30,
+                           isolation_level=None)
+    base.row_factory = sqlite3.Row
+    try:
+        base.execute("PRAGMA journal_mode=WAL")
+        base.execute(SCHEMA)
+        migrer(base)
+        yield base
+    finally:
+        base.close()
+
+
+def migrer(base):
+    """Ajoute aux bases créées par une version précédente les colonnes manquantes."""
+    colonnes = {ligne["name"] for ligne in base.execute("PRAGMA table_info(travaux)")}
+    if "tentatives" not in colonnes:
+        try:
+            base.execute("ALTER TABLE travaux ADD COLUMN tentatives INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            # Colonne ajoutée entre-temps par un autre processus
+            pass
+
+
+def chemin_fichier(id_travail, suffixe):
+    """Renvoie le chemin du fichier déposé (SUFFIXE_ENTREE) ou produit (SUFFIXE_SORTIE)
+    d'un travail."""
+    return os.path.join(dossier_travaux(), id_travail + suffixe)
+
+
+def soumettre(contenu, nom_fichier, format_sortie="xlsx", profilage=False):
+    """Dépose un classeur (octets, ou fichier ouvert copié par blocs) dans la file et renvoie
+    l'identifiant du travail."""
+    purger()
+    id_travail = uuid.uuid4().hex
+
+    # Le fichier est écrit avant l'insertion : un travail en attente a toujours son entrée
+    ecrire_par_blocs(contenu, chemin_fichier(id_travail, SUFFIXE_ENTREE))
+
+    with connexion() as base:
+        base.execute("INSERT INTO travaux (id, nom_fichier, format_sortie, profilage, statut, "
+                     "cree) VALUES (?, ?, ?, ?, ?, ?)",
+                     (id_travail, nom_fichier, format_sortie, int(profilage), EN_ATTENTE,
+                      time.time()))
+    return id_travail
+
+
+def etat_travail(id_travail):
+    """Renvoie l'état d'un travail sous forme de dictionnaire (None s'il n'existe plus)."""
+    with connexion() as base:
+        ligne = base.execute("SELECT * FROM travaux WHERE id = ?", (id_travail,)).fetchone()
+    if ligne is None:
+        return None
+
+    travail = dict(ligne)
+    travail["rapport"] = json.loads(travail["rapport"]) if travail["rapport"] else None
+    return travail
+
+
+def lire_sortie(id_travail):
+    """Renvoie le fichier Magenta produit par un travail (None si absent)."""
+    try:
+        with open(chemin_fichier(id_travail, SUFFIXE_SORTIE), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def mettre_a_jour(id_travail, **valeurs):
+    """Modifie les colonnes d'un travail."""
+    colonnes = ", ".join(f"{colonne} = ?" for colonne in valeurs)
+    with connexion() as base:
+        base.execute(f"UPDATE travaux SET {colonnes} WHERE id = ?",
+                     (*valeurs.values(), id_travail))
+
+
+def prendre_travail():
+    """Réserve le plus ancien travail en attente pour ce processus (None si la file est vide)."""
+    with connexion() as base:
+        # Réservation exclusive : deux processus ne prennent jamais le même travail
+        base.execute("BEGIN IMMEDIATE")
+        try:
+            ligne = base.execute("SELECT * FROM travaux WHERE statut = ? ORDER BY cree LIMIT 1",
+                                 (EN_ATTENTE,)).fetchone()
+            if ligne is not None:
+                base.execute("UPDATE travaux SET statut = ?, pid = ?, debut = ?, "
+                             "tentatives = tentatives + 1 WHERE id = ?",
+                             (EN_COURS, os.getpid(), time.time(), ligne["id"]))
+            base.execute("COMMIT")
+        except BaseException:
+            base.execute("ROLLBACK")
+            raise
+    return dict(ligne) if ligne is not None else None
+
+
+def executer_travail(travail):
+    """Convertit le classeur d'un travail réservé et enregistre le résultat."""
+    id_travail = travail["id"]
+
+    def avancer(etape):
+        # Seules les étapes principales font avancer la progression
+        for nom, progression in PROGRESSION_ETAPES.items():
+            if etape.startswith(nom):
+                mettre_a_jour(id_travail, progression=progression)
+
+    try:
+        with ouvrir_contenu(chemin_fichier(id_travail, SUFFIXE_ENTREE)) as contenu, \
+                demarrer_suivi(bool(travail["profilage"]), rappel=avancer) as rapport:
+            # En profilage, le résultat en cache est ignoré pour mesurer la conversion
+            statut, type_fichier, sortie, message = convertir_contenu(
+                contenu, travail["nom_fichier"], travail["format_sortie"],
+                relire=not travail["profilage"])
+    except OSError as e:
+        statut, type_fichier, sortie, message = "ÉCHEC", None, None, str(e)
+        rapport = None
+
+    if sortie is not None:
+        ecrire_par_blocs(sortie, chemin_fichier(id_travail, SUFFIXE_SORTIE))
+
+    mettre_a_jour(id_travail, statut=statut, progression=1.0, type_fichier=type_fichier,
+                  message=message, fin=time.time(),
+                  rapport=rapport.en_json() if rapport is not None else None)
+
+    # Le fichier déposé ne sert plus une fois le travail terminé
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(chemin_fichier(id_travail, SUFFIXE_ENTREE))
+
+
+def terminer_en_echec(id_travail, message):
+    """Enregistre l'échec d'un travail interrompu par une erreur inattendue."""
+    mettre_a_jour(id_travail, statut="ÉCHEC", progression=1.0, message=message,
+                  fin=time.time())
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(chemin_fichier(id_travail, SUFFIXE_ENTREE))
+
+
+def processus_actif(pid):
+    """Vérifie qu'un processus existe encore."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def reprendre_abandonnes():
+    """Remet en attente les travaux dont le processus de conversion s'est arrêté. Après
+    tentatives_max() conversions interrompues, un travail (qui arrête peut-être lui-même
+    son processus : mémoire épuisée, erreur du lecteur…) échoue."""
+    maximum = tentatives_max()
+    with connexion() as base:
+        lignes = base.execute("SELECT id, pid, tentatives FROM travaux WHERE statut = ?",
+                              (EN_COURS,)).fetchall()
+        abandonnes = [ligne for ligne in lignes
+                      if ligne["pid"] is None or not processus_actif(ligne["pid"])]
+        for ligne in abandonnes:
+            if ligne["tentatives"] < maximum:
+                base.execute("UPDATE travaux SET statut = ?, progression = 0, pid = NULL "
+                             "WHERE id = ? AND statut = ?", (EN_ATTENTE, ligne["id"], EN_COURS))
+                continue
+            message = (f"conversion interrompue {ligne['tentatives']} fois "
+                       "(arrêt du processus de conversion)")
+            base.execute("UPDATE travaux SET statut = ?, progression = 1, pid = NULL, "
+                         "message = ?, fin = ? WHERE id = ? AND statut = ?",
+                         ("ÉCHEC", message, time.time(), ligne["id"], EN_COURS))
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(chemin_fichier(ligne["id"], SUFFIXE_ENTREE))
+
+
+def purger():
+    """Supprime les travaux (et leurs fichiers) plus anciens que la durée de rétention."""
+    limite = time.time() - retention_travaux()
+    with connexion() as base:
+        anciens = [ligne["id"] for ligne in base.execute(
+            "SELECT id FROM travaux WHERE cree < ? AND statut NOT IN (?, ?)",
+            (limite, EN_ATTENTE, EN_COURS))]
+        for id_travail in anciens:
+            for suffixe in (SUFFIXE_ENTREE, SUFFIXE_SORTIE):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(chemin_fichier(id_travail, suffixe))
+            base.execute("DELETE FROM travaux WHERE id = ?", (id_travail,))
+
+
+def travailler(attente=0.5, parent=None):
+    """Boucle d'un processus de conversion : traite les travaux en attente, un par un,
+    jusqu'à l'arrêt du processus parent s'il est indiqué."""
+    prechauffer()
+    while True:
+        travail = prendre_travail()
+        if travail is None:
+            if parent is not None and not processus_actif(parent):
+                return
+            # File vide : reprise des travaux d'un processus arrêté en cours de conversion
+            reprendre_abandonnes()
+            time.sleep(attente)
+            continue
+
+        try:
+            executer_travail(travail)
+        except Exception as e:
+            # Base verrouillée, résultat illisible… : le travail échoue, pas le processus
+            journal.exception("Travail %s interrompu", travail["id"])
+            try:
+                terminer_en_echec(travail["id"], f"erreur inattendue : {e}")
+            except (sqlite3.Error, OSError):
+                journal.exception("Échec du travail %s non enregistré", travail["id"])
+
+
+def demarrer_travailleur(parent=None):
+    """Démarre un processus de conversion (arrêté avec le processus qui le lance)."""
+    travailleur = multiprocessing.get_context("spawn").Process(
+        target=travailler, kwargs={"parent": parent}, daemon=True)
+    travailleur.start()
+    return travailleur
+
+
+def demarrer_processus(nombre=None, parent=None):
+    """Démarre les processus de conversion (arrêtés avec le processus qui les lance)."""
+    return [demarrer_travailleur(parent)
+            for _ in range(nombre_processus() if nombre is None else nombre)]
+
+
+def surveiller(processus, parent=None, attente=1.0):
+    """Remplace les processus de conversion arrêtés (mémoire épuisée, erreur du lecteur…)
+    jusqu'à l'arrêt du processus parent s'il est indiqué."""
+    while parent is None or processus_actif(parent):
+        for num, travailleur in enumerate(processus):
+            if not travailleur.is_alive():
+                journal.warning("Processus de conversion %s arrêté (code %s) : relancé",
+                                travailleur.pid, travailleur.exitcode)
+                processus[num] = demarrer_travailleur(parent)
+        time.sleep(attente)
+
+
+def lancer_processus(nombre=None):
+    """Lance les processus de conversion dans un programme séparé (python travaux.py),
+    arrêté avec le processus appelant : les processus n'importent ni l'appelant ni
+    Streamlit. Renvoie None si le nombre de processus est nul."""
+    nombre = nombre_processus() if nombre is None else nombre
+    if nombre <= 0:
+        return None
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--processus",
+                             str(nombre), "--parent", str(os.getpid())])
+
+
+def main(argv=None):
+    """Point d'entrée des processus de conversion indépendants."""
+    parser = argparse.ArgumentParser(description="Processus de conversion de la file d'attente")
+    parser.add_argument("--processus", type=int, default=nombre_processus(),
+                        help="Nombre de processus de conversion (par défaut : nombre de cœurs)")
+    parser.add_argument("--parent", type=int,
+                        help="Arrêter les processus quand ce processus se termine")
+    args = parser.parse_args(argv)
+
+    surveiller(demarrer_processus(args.processus, args.parent), args.parent)
+
+
+if __name__ == "__main__":
+    main()